@@ -0,0 +1,22 @@
+"""ASGI entry point: async catalog and order-history reads, everything else on Flask.
+
+    pip install uvicorn asgiref "sqlalchemy[asyncio]" aiomysql   # aiosqlite for SQLite
+    SECRET_KEY=... uvicorn asgi:app --workers 4 --port 5000
+
+Product reads and order-history reads are served from an async engine on
+the event loop (utils/async_reads.py). Writes and all other routes run on
+the Flask app on a pool of ASYNC_WSGI_THREADS threads, as under gunicorn
+with --threads. The Flask-only deployment (app.py) is unchanged; this mode
+is optional. Both run the APP_ENV profile, production by default, which
+refuses to start without SECRET_KEY.
+"""
+from app import create_app
+from utils.async_reads import AsyncReadApp
+
+
+def create_asgi_app(config=None):
+    """Wrap create_app(config) in the async read path; config is as for create_app."""
+    return AsyncReadApp(create_app(config))
+
+
+app = create_asgi_app()
@@ -0,0 +1,314 @@
+"""Compare the sync Flask server with the ASGI read path under many open connections.
+
+    python -m benchmarks.async_serving --connections 1000 --duration 20 --output async.json
+
+Seeds a database, then for each mode starts a server in its own process
+and holds --connections keep-alive connections open against it. Each
+connection loops over a weighted mix of the reads asgi.py serves
+asynchronously (catalog pages, single products, categories, search and
+order history):
+
+- sync: the Flask app on werkzeug's threaded server, one thread per
+  connection, as app.py runs it.
+- async: asgi:app on uvicorn, a single event loop (needs uvicorn,
+  asgiref, greenlet and aiosqlite or aiomysql).
+
+Both run as one process, so requests/second and memory compare like for
+like. Memory is the server's resident set size, sampled from /proc while
+the load runs (Linux only). The JSON report has throughput, latency
+percentiles, status counts, and baseline and peak RSS and threads per
+mode.
+"""
+import argparse
+import asyncio
+import json
+import logging
+import os
+import random
+import resource
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from urllib.parse import quote_plus
+from database import db
+from benchmarks.run import build_app, percentile
+from benchmarks.seed import seed, WORDS, CATEGORIES
+
+MIX = {'browse': 20, 'product': 35, 'category': 10, 'search': 15, 'order_history': 20}
+
+# Seconds a server may take to start answering
+STARTUP_TIMEOUT = 60
+# Seconds between RSS samples
+SAMPLE_INTERVAL = 0.25
+
+
+def _raise_fd_limit():
+    """Allow one file descriptor per connection, up to the hard limit."""
+    soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    if hard == resource.RLIM_INFINITY or soft < hard:
+        resource.setrlimit(resource.RLIMIT_NOFILE, (hard, hard))
+
+
+def serve(mode, database_uri, port):
+    """Run one server in the foreground (the child side of run_mode)."""
+    _raise_fd_limit()
+    config = {'SQLALCHEMY_DATABASE_URI': database_uri, 'DEBUG': False, 'SECRET_KEY': 'benchmark-only',
+              'ADMISSION_CONTROL': False, 'OUTBOX_WORKERS': 0}
+    if mode == 'sync':
+        from werkzeug.serving import run_simple, WSGIRequestHandler
+        from app import create_app
+
+        class KeepAliveHandler(WSGIRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+        # One access-log line per request would be measured as well; uvicorn's is off too
+        logging.getLogger('werkzeug').setLevel(logging.WARNING)
+        run_simple('127.0.0.1', port, create_app(config), threaded=True, request_handler=KeepAliveHandler)
+    else:
+        import uvicorn
+        from app import create_app
+        from utils.async_reads import AsyncReadApp
+        # Not asgi:app, which builds the app from the environment's profile on import
+        uvicorn.run(AsyncReadApp(create_app(config)), host='127.0.0.1', port=port, log_level='warning',
+                    backlog=4096, timeout_keep_alive=60)
+
+
+def _free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def _proc_status(pid):
+    """(RSS in MiB, thread count) of pid, from /proc."""
+    rss = threads = None
+    with open(f'/proc/{pid}/status') as f:
+        for line in f:
+            if line.startswith('VmRSS:'):
+                rss = int(line.split()[1]) / 1024
+            elif line.startswith('Threads:'):
+                threads = int(line.split()[1])
+    return rss, threads
+
+
+def _paths(args, rng):
+    names = list(MIX)
+    weights = [MIX[name] for name in names]
+    while True:
+        name = rng.choices(names, weights)[0]
+        if name == 'browse':
+            path = f'/api/products?limit=20&cursor={rng.randint(0, args.products)}'
+        elif name == 'product':
+            path = f'/api/products/{rng.randint(1, args.products)}'
+        elif name == 'category':
+            path = '/api/products/categories?categories=' + quote_plus(rng.choice(CATEGORIES))
+        elif name == 'search':
+            path = f'/api/products/search?q={rng.choice(WORDS)[:4]}&limit=20'
+        else:
+            path = f'/api/orders/user/{rng.randint(1, args.users)}?limit=20'
+        yield name, path
+
+
+async def _request(reader, writer, path):
+    writer.write(f'GET {path} HTTP/1.1\r\nHost: 127.0.0.1\r\nConnection: keep-alive\r\n\r\n'.encode())
+    await writer.drain()
+    head = await reader.readuntil(b'\r\n\r\n')
+    lines = head.decode('latin-1').split('\r\n')
+    status = int(lines[0].split()[1])
+    length = 0
+    keep_alive = True
+    for line in lines[1:]:
+        key, _, value = line.partition(':')
+        if key.lower() == 'content-length':
+            length = int(value)
+        elif key.lower() == 'connection':
+            keep_alive = value.strip().lower() != 'close'
+    await reader.readexactly(length)
+    return status, keep_alive
+
+
+async def _load(args, port):
+    """Open args.connections connections, then loop requests on all of them for args.duration."""
+    samples = []
+    errors = {'connect': 0, 'request': 0}
+    connected = asyncio.Event()
+    start = asyncio.Event()
+    ready = 0
+    connect_slots = asyncio.Semaphore(args.connect_batch)
+
+    async def connect():
+        async with connect_slots:
+            for _ in range(5):
+                try:
+                    return await asyncio.wait_for(asyncio.open_connection('127.0.0.1', port), 10)
+                except (OSError, asyncio.TimeoutError):
+                    await asyncio.sleep(0.2)
+        errors['connect'] += 1
+        return None
+
+    async def client(client_id):
+        nonlocal ready
+        rng = random.Random(args.seed * 100000 + client_id)
+        paths = _paths(args, rng)
+        conn = await connect()
+        ready += 1
+        if ready == args.connections:
+            connected.set()
+        await start.wait()
+        while conn is not None and time.perf_counter() < stop_at:
+            name, path = next(paths)
+            t0 = time.perf_counter()
+            try:
+                status, keep_alive = await asyncio.wait_for(_request(*conn, path), args.request_timeout)
+            except (OSError, asyncio.IncompleteReadError, asyncio.LimitOverrunError, asyncio.TimeoutError):
+                errors['request'] += 1
+                conn[1].close()
+                conn = await connect()
+                continue
+            samples.append((name, status, time.perf_counter() - t0))
+            if not keep_alive:
+                conn[1].close()
+                conn = await connect()
+        if conn is not None:
+            conn[1].close()
+
+    stop_at = float('inf')
+    tasks = [asyncio.create_task(client(i)) for i in range(args.connections)]
+    await connected.wait()
+    begin = time.perf_counter()
+    stop_at = begin + args.duration
+    start.set()
+    await asyncio.gather(*tasks)
+    return samples, errors, time.perf_counter() - begin
+
+
+async def _sample(pid, stop, readings):
+    while not stop.is_set():
+        readings.append(_proc_status(pid))
+        try:
+            await asyncio.wait_for(stop.wait(), SAMPLE_INTERVAL)
+        except asyncio.TimeoutError:
+            pass
+
+
+async def _measure(args, port, pid):
+    stop = asyncio.Event()
+    readings = []
+    sampler = asyncio.create_task(_sample(pid, stop, readings))
+    try:
+        return await _load(args, port), readings
+    finally:
+        stop.set()
+        await sampler
+
+
+def _get(port, path, timeout):
+    with socket.create_connection(('127.0.0.1', port), timeout=timeout) as sock:
+        sock.sendall(f'GET {path} HTTP/1.1\r\nHost: 127.0.0.1\r\nConnection: close\r\n\r\n'.encode())
+        return sock.recv(64).startswith(b'HTTP/1.1 200')
+
+
+def _wait_until_ready(port, process):
+    """Wait for the server to answer, then warm it up.
+
+    The warm-up search builds the search index, which the sync app
+    otherwise builds on the first search request, under full load.
+    """
+    deadline = time.monotonic() + STARTUP_TIMEOUT
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise SystemExit(f'Server exited with status {process.returncode} before it was ready')
+        try:
+            if _get(port, '/api/products/1', 1):
+                _get(port, '/api/products/search?q=a', STARTUP_TIMEOUT)
+                return
+        except OSError:
+            pass
+        time.sleep(0.2)
+    raise SystemExit(f'Server did not answer within {STARTUP_TIMEOUT}s')
+
+
+def run_mode(args, mode):
+    port = _free_port()
+    process = subprocess.Popen([sys.executable, '-m', 'benchmarks.async_serving', '--serve', mode,
+                                '--port', str(port), '--database-uri', args.database_uri])
+    try:
+        _wait_until_ready(port, process)
+        baseline_rss, baseline_threads = _proc_status(process.pid)
+        (samples, errors, elapsed), readings = asyncio.run(_measure(args, port, process.pid))
+    finally:
+        process.terminate()
+        process.wait(10)
+
+    latencies = sorted(seconds for _, status, seconds in samples if status < 400)
+    statuses = {}
+    for _, status, _ in samples:
+        statuses[str(status)] = statuses.get(str(status), 0) + 1
+    rss = [value for value, _ in readings if value is not None]
+    threads = [value for _, value in readings if value is not None]
+
+    def ms(value):
+        return round(value * 1000, 3) if value is not None else None
+
+    return {
+        'elapsed_s': round(elapsed, 3),
+        'requests': len(samples),
+        'rps': round(len(latencies) / elapsed, 2),
+        'p50_ms': ms(percentile(latencies, 50)),
+        'p95_ms': ms(percentile(latencies, 95)),
+        'p99_ms': ms(percentile(latencies, 99)),
+        'statuses': statuses,
+        'errors': errors,
+        'rss_mib': {'baseline': round(baseline_rss, 1), 'peak': round(max(rss, default=baseline_rss), 1),
+                    'mean': round(sum(rss) / len(rss), 1) if rss else None},
+        'threads': {'baseline': baseline_threads, 'peak': max(threads, default=baseline_threads)},
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--mode', choices=('sync', 'async', 'both'), default='both')
+    parser.add_argument('--connections', type=int, default=1000)
+    parser.add_argument('--duration', type=float, default=20, help='Seconds of load per mode')
+    parser.add_argument('--connect-batch', type=int, default=100, help='Connections opened at once while ramping up')
+    parser.add_argument('--request-timeout', type=float, default=30)
+    parser.add_argument('--database-uri', help='Sync SQLAlchemy URI (default: SQLite file in the temp dir). '
+                                               'The schema is dropped and recreated.')
+    parser.add_argument('--users', type=int, default=200)
+    parser.add_argument('--products', type=int, default=2000)
+    parser.add_argument('--orders', type=int, default=2000)
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--output', help='Write the JSON report here instead of stdout')
+    parser.add_argument('--serve', choices=('sync', 'async'), help=argparse.SUPPRESS)
+    parser.add_argument('--port', type=int, help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+
+    if args.serve:
+        return serve(args.serve, args.database_uri, args.port)
+
+    _raise_fd_limit()
+    args.database_uri = args.database_uri or 'sqlite:///' + os.path.join(tempfile.gettempdir(), 'vitalis_async.db')
+    app = build_app(args.database_uri, OUTBOX_WORKERS=0)
+    with app.app_context():
+        seed(users=args.users, products=args.products, carts=0, orders=args.orders, seed=args.seed)
+        db.session.commit()
+
+    modes = ['sync', 'async'] if args.mode == 'both' else [args.mode]
+    config = {key: value for key, value in vars(args).items() if key not in ('output', 'serve', 'port')}
+    config['database_uri'] = args.database_uri.split('@')[-1]
+    report = {
+        'config': config,
+        'modes': {mode: run_mode(args, mode) for mode in modes},
+    }
+    text = json.dumps(report, indent=2, sort_keys=True)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(text + '\n')
+    else:
+        print(text)
+
+
+if __name__ == '__main__':
+    main()
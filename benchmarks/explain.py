@@ -0,0 +1,194 @@
+"""Capture EXPLAIN plans for the queries behind each route and fail on full scans.
+
+    python -m benchmarks.explain --products 2000 --orders 5000 --output plans.json
+
+Each probe below is sent once against freshly seeded data (with planner
+statistics gathered by ANALYZE). Every SELECT, UPDATE and DELETE it issues
+is explained on the same connection. The plans are printed (or written to
+--output) as JSON. The exit status is 1 when a statement reads a table
+with a full scan that its probe does not list as expected, so losing an
+index shows up as a failure instead of a slow page. Tables with fewer
+than --min-rows rows are exempt, because the planner rightly scans those.
+Works on SQLite and MySQL.
+"""
+import argparse
+import json
+import os
+import re
+import sys
+import tempfile
+from sqlalchemy import event, text
+from database import db
+from benchmarks.run import build_app
+from benchmarks.seed import seed, CATEGORIES
+from utils.auth import user_cache
+from utils.product_cache import product_cache
+
+EXPLAINED = ('SELECT', 'UPDATE', 'DELETE')
+
+# (name, method, path, JSON body, tables a full scan is expected on)
+PROBES = [
+    ('product', 'GET', '/api/products/1', None, ()),
+    ('products_by_ids', 'GET', '/api/products?ids=1,2,3,4,5', None, ()),
+    ('products_page', 'GET', '/api/products?limit=50&cursor=100', None, ()),
+    ('products_filtered', 'GET',
+     f'/api/products?category={CATEGORIES[0]}&min_price=50&max_price=100&sort=price&limit=20', None,
+     # Facet counts aggregate over the whole catalog by design
+     ('product',)),
+    ('products_in_stock', 'GET', '/api/products?in_stock=true&sort=-stock&limit=20', None, ('product',)),
+    ('search', 'GET', '/api/products/search?q=kettlebell&limit=10', None,
+     # The first search in a process reads the catalog to build the index
+     ('product',)),
+    ('user', 'GET', '/api/users/1', None, ()),
+    ('login', 'POST', '/api/users/login', {'email': 'nobody@bench.local', 'password': 'x'}, ()),
+    ('user_cart', 'GET', '/api/cart/user/1?limit=50', None, ()),
+    ('cart_summary', 'GET', '/api/cart/user/1/summary', None, ()),
+    ('order', 'GET', '/api/orders/1', None, ()),
+    ('orders_page', 'GET', '/api/orders?limit=50&cursor=100', None, ()),
+    ('user_orders', 'GET', '/api/orders/user/1?limit=50', None, ()),
+    ('order_lines', 'GET', '/api/order-products/1', None, ()),
+    ('analytics_daily', 'GET', '/api/analytics/daily', None, ()),
+    ('analytics_top_sellers', 'GET', '/api/analytics/top-sellers?limit=10', None, ()),
+    ('add_to_cart', 'POST', '/api/cart', {'user_id': 2, 'product_id': 3, 'quantity': 1}, ()),
+    ('create_order', 'POST', '/api/orders', {
+        'user_id': 2, 'total_amount': 10, 'payment_status': 'Success', 'payment_method': 'card',
+        'items': [{'product_id': 1, 'quantity': 1}, {'product_id': 2, 'quantity': 2}]
+    }, ()),
+    ('cancel_order', 'PUT', '/api/orders/2', {'status': 'Cancelled'}, ()),
+    ('checkout', 'POST', '/api/cart/user/3/checkout', {'payment_method': 'card'}, ()),
+]
+
+_SQLITE_SCAN = re.compile(r'^SCAN (?:TABLE )?(\S+)(.*)$')
+
+
+def full_scans(dialect, plan):
+    """Return the tables a plan reads with a full table scan."""
+    tables = []
+    for row in plan:
+        if dialect == 'sqlite':
+            match = _SQLITE_SCAN.match(row['detail'])
+            # "SCAN t USING [COVERING] INDEX ..." walks an index, not the table
+            if match and 'USING' not in match.group(2) and match.group(1) != 'CONSTANT':
+                tables.append(match.group(1))
+        elif str(row.get('type')).upper() == 'ALL':
+            tables.append(row['table'])
+    return tables
+
+
+def explain(connection, statement, parameters):
+    dialect = connection.dialect.name
+    prefix = 'EXPLAIN QUERY PLAN ' if dialect == 'sqlite' else 'EXPLAIN '
+    result = connection.exec_driver_sql(prefix + statement, parameters)
+    return [dict(row._mapping) for row in result]
+
+
+def run_probe(client, probe, table_rows, min_rows):
+    name, method, path, body, expected = probe
+    statements = []
+
+    def capture(conn, cursor, statement, parameters, context, executemany):
+        if not executemany and statement.lstrip().split(None, 1)[0].upper() in EXPLAINED:
+            statements.append((statement, parameters))
+
+    # Start every probe cold so cached routes still reach the database
+    product_cache.cache.clear()
+    user_cache.clear()
+
+    engine = db.engine
+    event.listen(engine, 'before_cursor_execute', capture)
+    try:
+        status = client.open(path, method=method, json=body).status_code
+    finally:
+        event.remove(engine, 'before_cursor_execute', capture)
+
+    results = []
+    with engine.connect() as connection:
+        for statement, parameters in statements:
+            plan = explain(connection, statement, parameters)
+            scans = full_scans(connection.dialect.name, plan)
+            unexpected = {table for table in scans
+                          if table not in expected and table_rows.get(table, min_rows) >= min_rows}
+            results.append({
+                'sql': ' '.join(statement.split()),
+                'plan': plan,
+                'full_scans': scans,
+                'unexpected': sorted(unexpected),
+            })
+    return {'status': status, 'statements': results}
+
+
+def run(args):
+    database_uri = args.database_uri or 'sqlite:///' + os.path.join(tempfile.gettempdir(), 'vitalis_explain.db')
+    # No background outbox workers: their polling would be captured with the probes
+    app = build_app(database_uri, OUTBOX_WORKERS=0)
+
+    with app.app_context():
+        seed(users=args.users, products=args.products, carts=args.carts,
+             orders=args.orders, items_per_order=args.items_per_order, seed=args.seed)
+        from utils.analytics import backfill
+        backfill()
+        with db.engine.begin() as connection:
+            table_rows = {
+                table.name: connection.execute(db.select(db.func.count()).select_from(table)).scalar()
+                for table in db.metadata.sorted_tables
+            }
+            if connection.dialect.name == 'sqlite':
+                connection.execute(text('ANALYZE'))
+            else:
+                for table in db.metadata.sorted_tables:
+                    connection.execute(text(f'ANALYZE TABLE `{table.name}`'))
+
+        client = app.test_client()
+        probes = {probe[0]: run_probe(client, probe, table_rows, args.min_rows) for probe in PROBES}
+
+    failures = [
+        f'{name}: HTTP {result["status"]}' for name, result in probes.items() if result['status'] >= 500
+    ] + [
+        f'{name}: full scan of {", ".join(stmt["unexpected"])} in {stmt["sql"]}'
+        for name, result in probes.items() for stmt in result['statements'] if stmt['unexpected']
+    ]
+    return {
+        'config': {
+            'database': database_uri.split('@')[-1],
+            'users': args.users, 'products': args.products, 'carts': args.carts,
+            'orders': args.orders, 'items_per_order': args.items_per_order, 'seed': args.seed,
+            'min_rows': args.min_rows, 'table_rows': table_rows
+        },
+        'probes': probes,
+        'failures': failures,
+    }
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--database-uri', help='SQLAlchemy URI (default: SQLite file in the temp dir). '
+                                               'The schema is dropped and recreated.')
+    parser.add_argument('--users', type=int, default=200)
+    parser.add_argument('--products', type=int, default=2000)
+    parser.add_argument('--carts', type=int, default=500)
+    parser.add_argument('--orders', type=int, default=5000)
+    parser.add_argument('--items-per-order', type=int, default=3)
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--min-rows', type=int, default=100,
+                        help='Ignore full scans of tables with fewer rows than this')
+    parser.add_argument('--output', help='Write the JSON report here instead of stdout')
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    report = run(args)
+    text_report = json.dumps(report, indent=2, sort_keys=True, default=str)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(text_report + '\n')
+    else:
+        print(text_report)
+
+    for failure in report['failures']:
+        print(f'FAIL {failure}', file=sys.stderr)
+    sys.exit(1 if report['failures'] else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,82 @@
+"""Measure login throughput and tail latency under a burst of concurrent logins.
+
+    python -m benchmarks.login --users 200 --concurrency 32 --requests 2000
+"""
+import argparse
+import json
+import random
+import threading
+import time
+from sqlalchemy import insert
+from database import db
+from models.user import User
+from benchmarks.run import build_app, percentile
+from utils.auth import hash_password
+
+PASSWORD = 'bench-password'
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--database-uri', default='sqlite:////tmp/vitalis_login_bench.db')
+    parser.add_argument('--users', type=int, default=200)
+    parser.add_argument('--requests', type=int, default=1000)
+    parser.add_argument('--concurrency', type=int, default=16)
+    parser.add_argument('--seed', type=int, default=42)
+    args = parser.parse_args(argv)
+
+    app = build_app(args.database_uri)
+    with app.app_context():
+        # One real hash shared by every user keeps seeding fast but login realistic
+        password_hash = hash_password(PASSWORD)
+        db.session.execute(insert(User), [
+            {'fname': f'User{i}', 'email': f'user{i}@bench.local', 'password': password_hash}
+            for i in range(1, args.users + 1)
+        ])
+        db.session.commit()
+
+    samples = []
+    lock = threading.Lock()
+    per_worker = args.requests // args.concurrency
+    start_gate = threading.Barrier(args.concurrency)
+
+    def worker(worker_id):
+        rng = random.Random(args.seed + worker_id)
+        client = app.test_client()
+        local = []
+        start_gate.wait()
+        for _ in range(per_worker):
+            email = f'user{rng.randint(1, args.users)}@bench.local'
+            t0 = time.perf_counter()
+            status = client.post('/api/users/login', json={'email': email, 'password': PASSWORD}).status_code
+            local.append((time.perf_counter() - t0, status))
+        with lock:
+            samples.extend(local)
+
+    threads = [threading.Thread(target=worker, args=(i,)) for i in range(args.concurrency)]
+    start = time.perf_counter()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    elapsed = time.perf_counter() - start
+
+    latencies = sorted(s[0] * 1000 for s in samples)
+    statuses = {}
+    for _, status in samples:
+        statuses[str(status)] = statuses.get(str(status), 0) + 1
+
+    print(json.dumps({
+        'requests': len(samples),
+        'concurrency': args.concurrency,
+        'elapsed_s': round(elapsed, 3),
+        'logins_per_second': round(len(samples) / elapsed, 2),
+        'p50_ms': round(percentile(latencies, 50), 3),
+        'p95_ms': round(percentile(latencies, 95), 3),
+        'p99_ms': round(percentile(latencies, 99), 3),
+        'status_counts': statuses
+    }, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,159 @@
+"""Overload the API with and without admission control and compare tail latency.
+
+    python -m benchmarks.overload --clients 64 --duration 10 --pool-size 4 --query-delay-ms 20
+
+Each client thread has its own address and loops over a weighted mix of
+search, order creation and single-product reads. --query-delay-ms holds
+every pooled connection for a little longer per statement, which
+simulates a database that is already busy. Several clients share one
+connection per pool slot, so without admission control requests pile
+up on the pool. With it, excess requests are turned away early with
+429/503. Clients then wait for Retry-After, as well-behaved clients
+would.
+
+The JSON report has latency percentiles per scenario and the status code
+counts for each mode. Only admitted (2xx) requests count towards the
+latency of a mode; rejections are reported separately with their own
+latency, which should stay close to zero.
+"""
+import argparse
+import json
+import random
+import threading
+import time
+from sqlalchemy import event
+from database import db
+from benchmarks.run import build_app, percentile
+from benchmarks.seed import seed, WORDS
+
+MIX = {'search': 40, 'create_order': 20, 'product': 40}
+
+
+def _scenarios(args, rng):
+    def search(client):
+        return client.get('/api/products/search', query_string={'q': rng.choice(WORDS)[:4], 'limit': 20})
+
+    def create_order(client):
+        return client.post('/api/orders', json={
+            'user_id': rng.randint(1, args.users),
+            'total_amount': 10,
+            'items': [{'product_id': rng.randint(1, args.products), 'quantity': 1}],
+            'payment_status': 'Success',
+            'payment_method': 'card'
+        })
+
+    def product(client):
+        return client.get(f'/api/products/{rng.randint(1, args.products)}')
+
+    return {'search': search, 'create_order': create_order, 'product': product}
+
+
+def _stats(latencies):
+    latencies = sorted(latencies)
+    if not latencies:
+        return None
+    return {
+        'requests': len(latencies),
+        'p50_ms': round(percentile(latencies, 50) * 1000, 3),
+        'p95_ms': round(percentile(latencies, 95) * 1000, 3),
+        'p99_ms': round(percentile(latencies, 99) * 1000, 3),
+        'max_ms': round(latencies[-1] * 1000, 3),
+    }
+
+
+def run_mode(args, admission):
+    database_uri = f'sqlite:////tmp/vitalis_overload_{"on" if admission else "off"}.db'
+    app = build_app(database_uri, ADMISSION_CONTROL=admission, OUTBOX_WORKERS=0,
+                    DB_POOL_SIZE=args.pool_size, DB_MAX_OVERFLOW=0,
+                    SQLALCHEMY_ENGINE_OPTIONS={'pool_size': args.pool_size, 'max_overflow': 0,
+                                               'pool_timeout': args.pool_timeout})
+    with app.app_context():
+        seed(users=args.users, products=args.products, carts=0, orders=0, seed=args.seed)
+        db.session.commit()
+        engine = db.engine
+
+    def slow_statement(*_):
+        time.sleep(args.query_delay_ms / 1000)
+
+    event.listen(engine, 'before_cursor_execute', slow_statement)
+    names = list(MIX)
+    weights = [MIX[name] for name in names]
+    samples = []
+    lock = threading.Lock()
+    stop_at = time.perf_counter() + args.duration
+
+    def client_loop(client_id):
+        rng = random.Random(args.seed * 1000 + client_id)
+        scenarios = _scenarios(args, rng)
+        client = app.test_client()
+        client.environ_base['REMOTE_ADDR'] = f'10.0.{client_id // 250}.{client_id % 250 + 1}'
+        local = []
+        while time.perf_counter() < stop_at:
+            name = rng.choices(names, weights)[0]
+            t0 = time.perf_counter()
+            retry_after = None
+            try:
+                response = scenarios[name](client)
+                status = response.status_code
+                retry_after = response.headers.get('Retry-After')
+            except Exception:
+                status = 599
+            local.append((name, status, time.perf_counter() - t0))
+            if retry_after:
+                time.sleep(min(float(retry_after), max(0.0, stop_at - time.perf_counter())))
+        with lock:
+            samples.extend(local)
+
+    threads = [threading.Thread(target=client_loop, args=(i,)) for i in range(args.clients)]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - start
+    event.remove(engine, 'before_cursor_execute', slow_statement)
+
+    statuses = {}
+    for name, status, _ in samples:
+        statuses.setdefault(name, {}).setdefault(str(status), 0)
+        statuses[name][str(status)] += 1
+
+    return {
+        'elapsed_s': round(elapsed, 3),
+        'admitted_rps': round(sum(1 for _, s, _ in samples if s < 300) / elapsed, 2),
+        'admitted': {name: _stats([t for n, s, t in samples if n == name and s < 300]) for name in names},
+        'rejected': {name: _stats([t for n, s, t in samples if n == name and s in (429, 503)]) for name in names},
+        'statuses': statuses,
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--mode', choices=('on', 'off', 'both'), default='both',
+                        help='Run with admission control on, off, or both (default)')
+    parser.add_argument('--clients', type=int, default=64)
+    parser.add_argument('--duration', type=float, default=10, help='Seconds per mode')
+    parser.add_argument('--pool-size', type=int, default=4)
+    parser.add_argument('--pool-timeout', type=float, default=10)
+    parser.add_argument('--query-delay-ms', type=float, default=20)
+    parser.add_argument('--users', type=int, default=200)
+    parser.add_argument('--products', type=int, default=500)
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--output', help='Write the JSON report here instead of stdout')
+    args = parser.parse_args(argv)
+
+    modes = ['off', 'on'] if args.mode == 'both' else [args.mode]
+    report = {
+        'config': {key: value for key, value in vars(args).items() if key != 'output'},
+        'modes': {mode: run_mode(args, mode == 'on') for mode in modes},
+    }
+    text = json.dumps(report, indent=2, sort_keys=True)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(text + '\n')
+    else:
+        print(text)
+
+
+if __name__ == '__main__':
+    main()
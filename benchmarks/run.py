@@ -0,0 +1,291 @@
+"""Seed a local database and drive a weighted mix of /api routes against it.
+
+    python -m benchmarks.run --products 2000 --orders 5000 --concurrency 8 \
+        --requests 5000 --output bench.json
+
+Results are printed (or written to --output) as JSON with p50/p95/p99
+latency, throughput and SQL queries per request for each scenario, so two
+runs can be diffed directly.
+
+--pagination measures the list endpoints on a large product table
+instead of running the mix:
+
+    python -m benchmarks.run --pagination --products 1000000
+
+It reports the latency of keyset pages taken from the start, middle and
+end of the table, and the capped unpaged list. It also reports the time
+and peak traced memory of streaming the whole table with ?stream=ndjson
+and ?stream=json. Page latency should not depend on the cursor, and
+streaming memory should not depend on --products.
+"""
+import argparse
+import json
+import os
+import platform
+import random
+import tempfile
+import threading
+import time
+import tracemalloc
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from database import db
+from benchmarks.seed import seed, WORDS, CATEGORIES
+
+# Scenario name -> default weight in the request mix
+DEFAULT_MIX = {
+    'browse': 25,
+    'product': 20,
+    'category': 10,
+    'search': 15,
+    'add_to_cart': 10,
+    'create_order': 5,
+    'order_history': 15,
+}
+
+_local = threading.local()
+
+
+def _count_query(*args):
+    _local.queries = getattr(_local, 'queries', 0) + 1
+
+
+def build_app(database_uri, **config):
+    """Build the API against database_uri, recreate the schema and return it."""
+    from app import create_app
+
+    # Every benchmark client shares one address, so rate limits are off unless asked for
+    app = create_app({'SQLALCHEMY_DATABASE_URI': database_uri, 'DEBUG': False, 'ADMISSION_CONTROL': False,
+                      'SECRET_KEY': 'benchmark-only', **config})
+    with app.app_context():
+        db.drop_all()
+        db.create_all()
+    return app
+
+
+def make_scenarios(args, rng):
+    """Return {name: callable(client) -> status code} for each scenario."""
+
+    def browse(client):
+        return client.get('/api/products').status_code
+
+    def product(client):
+        return client.get(f'/api/products/{rng.randint(1, args.products)}').status_code
+
+    def category(client):
+        categories = ','.join(rng.sample(CATEGORIES, 2))
+        return client.get('/api/products/categories', query_string={'categories': categories}).status_code
+
+    def search(client):
+        return client.get('/api/products/search', query_string={'q': rng.choice(WORDS)[:4]}).status_code
+
+    def add_to_cart(client):
+        return client.post('/api/cart', json={
+            'user_id': rng.randint(1, args.users),
+            'product_id': rng.randint(1, args.products),
+            'quantity': 1
+        }).status_code
+
+    def create_order(client):
+        product_ids = rng.sample(range(1, args.products + 1), min(3, args.products))
+        return client.post('/api/orders', json={
+            'user_id': rng.randint(1, args.users),
+            'total_amount': 100,
+            'items': [{'product_id': pid, 'quantity': 1} for pid in product_ids],
+            'payment_status': 'Success',
+            'payment_method': 'card'
+        }).status_code
+
+    def order_history(client):
+        return client.get(f'/api/orders/user/{rng.randint(1, args.users)}').status_code
+
+    return {
+        'browse': browse, 'product': product, 'category': category, 'search': search,
+        'add_to_cart': add_to_cart, 'create_order': create_order, 'order_history': order_history
+    }
+
+
+def percentile(sorted_values, pct):
+    if not sorted_values:
+        return None
+    index = min(len(sorted_values) - 1, int(round(pct / 100 * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+
+def summarize(samples, elapsed):
+    """samples: list of (scenario, seconds, status, queries)."""
+    by_scenario = {}
+    for name, seconds, status, queries in samples:
+        by_scenario.setdefault(name, []).append((seconds, status, queries))
+
+    def stats(rows):
+        latencies = sorted(r[0] * 1000 for r in rows)
+        return {
+            'requests': len(rows),
+            'errors': sum(1 for r in rows if r[1] >= 500),
+            'p50_ms': round(percentile(latencies, 50), 3),
+            'p95_ms': round(percentile(latencies, 95), 3),
+            'p99_ms': round(percentile(latencies, 99), 3),
+            'mean_ms': round(sum(latencies) / len(latencies), 3),
+            'queries_per_request': round(sum(r[2] for r in rows) / len(rows), 2)
+        }
+
+    return {
+        'elapsed_s': round(elapsed, 3),
+        'throughput_rps': round(len(samples) / elapsed, 2) if elapsed else None,
+        'overall': stats([(s, st, q) for _, s, st, q in samples]),
+        'scenarios': {name: stats(rows) for name, rows in sorted(by_scenario.items())}
+    }
+
+
+def run(args):
+    database_uri = args.database_uri or 'sqlite:///' + os.path.join(tempfile.gettempdir(), 'vitalis_bench.db')
+    app = build_app(database_uri)
+
+    with app.app_context():
+        start = time.perf_counter()
+        seed(users=args.users, products=args.products, carts=args.carts,
+             orders=args.orders, items_per_order=args.items_per_order, seed=args.seed)
+        seed_time = time.perf_counter() - start
+
+    mix = dict(DEFAULT_MIX)
+    for entry in args.mix or []:
+        name, _, weight = entry.partition('=')
+        if name not in mix:
+            raise SystemExit(f'Unknown scenario {name!r}; choose from {", ".join(mix)}')
+        mix[name] = int(weight)
+    names = [name for name, weight in mix.items() if weight > 0]
+    weights = [mix[name] for name in names]
+
+    event.listen(Engine, 'before_cursor_execute', _count_query)
+    samples = []
+    samples_lock = threading.Lock()
+    per_worker = args.requests // args.concurrency
+
+    def worker(worker_id):
+        rng = random.Random(args.seed * 1000 + worker_id)
+        scenarios = make_scenarios(args, rng)
+        client = app.test_client()
+        local_samples = []
+        for _ in range(per_worker):
+            name = rng.choices(names, weights)[0]
+            _local.queries = 0
+            t0 = time.perf_counter()
+            status = scenarios[name](client)
+            local_samples.append((name, time.perf_counter() - t0, status, _local.queries))
+        with samples_lock:
+            samples.extend(local_samples)
+
+    threads = [threading.Thread(target=worker, args=(i,)) for i in range(args.concurrency)]
+    start = time.perf_counter()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    elapsed = time.perf_counter() - start
+    event.remove(Engine, 'before_cursor_execute', _count_query)
+
+    report = summarize(samples, elapsed)
+    report['config'] = {
+        'database': database_uri.split('@')[-1],
+        'users': args.users, 'products': args.products, 'carts': args.carts,
+        'orders': args.orders, 'items_per_order': args.items_per_order,
+        'requests': per_worker * args.concurrency, 'concurrency': args.concurrency,
+        'mix': mix, 'seed': args.seed, 'seed_time_s': round(seed_time, 3)
+    }
+    report['environment'] = {'python': platform.python_version(), 'platform': platform.platform()}
+    return report
+
+
+def _timed_get(client, path, repeat):
+    latencies = []
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        response = client.get(path)
+        latencies.append(time.perf_counter() - t0)
+        assert response.status_code == 200, (path, response.status_code)
+    latencies.sort()
+    return {'p50_ms': round(percentile(latencies, 50) * 1000, 3),
+            'max_ms': round(latencies[-1] * 1000, 3)}
+
+
+def _stream(client, path):
+    """Read a streamed response chunk by chunk, without keeping it, under tracemalloc."""
+    tracemalloc.start()
+    t0 = time.perf_counter()
+    response = client.get(path, buffered=False)
+    size = 0
+    lines = 0
+    for chunk in response.response:
+        size += len(chunk)
+        lines += chunk.count(b'\n')
+    response.close()
+    elapsed = time.perf_counter() - t0
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return {'elapsed_s': round(elapsed, 3), 'bytes': size, 'newlines': lines,
+            'peak_traced_mib': round(peak / 2 ** 20, 2)}
+
+
+def run_pagination(args):
+    database_uri = args.database_uri or 'sqlite:///' + os.path.join(tempfile.gettempdir(), 'vitalis_pages.db')
+    app = build_app(database_uri)
+    with app.app_context():
+        start = time.perf_counter()
+        seed(users=1, products=args.products, carts=0, orders=0, seed=args.seed)
+        seed_time = time.perf_counter() - start
+
+    client = app.test_client()
+    limit = 1000
+    report = {
+        'pages': {
+            name: _timed_get(client, f'/api/products?limit={limit}&cursor={cursor}', args.repeat)
+            for name, cursor in (('start', 0), ('middle', args.products // 2),
+                                 ('end', max(0, args.products - limit)))
+        },
+        'stream_ndjson': _stream(client, '/api/products?stream=ndjson'),
+        'stream_json': _stream(client, '/api/products?stream=json'),
+    }
+    # The plain list: capped at UNPAGED_LIMIT rows, and cached after the first call
+    report['unpaged'] = {'first_call': _timed_get(client, '/api/products', 1),
+                         'cached': _timed_get(client, '/api/products', args.repeat)}
+    report['config'] = {'database': database_uri.split('@')[-1], 'products': args.products,
+                        'page_limit': limit, 'repeat': args.repeat, 'seed_time_s': round(seed_time, 3)}
+    report['environment'] = {'python': platform.python_version(), 'platform': platform.platform()}
+    return report
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--database-uri', help='SQLAlchemy URI (default: SQLite file in the temp dir). '
+                                               'The schema is dropped and recreated.')
+    parser.add_argument('--users', type=int, default=100)
+    parser.add_argument('--products', type=int, default=500)
+    parser.add_argument('--carts', type=int, default=200)
+    parser.add_argument('--orders', type=int, default=1000)
+    parser.add_argument('--items-per-order', type=int, default=3)
+    parser.add_argument('--requests', type=int, default=2000)
+    parser.add_argument('--concurrency', type=int, default=4)
+    parser.add_argument('--mix', nargs='*', metavar='SCENARIO=WEIGHT',
+                        help=f'Override scenario weights ({", ".join(DEFAULT_MIX)})')
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--pagination', action='store_true',
+                        help='Benchmark pagination and streaming of /api/products instead of the mix')
+    parser.add_argument('--repeat', type=int, default=20, help='Requests per page position with --pagination')
+    parser.add_argument('--output', help='Write the JSON report here instead of stdout')
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    report = run_pagination(args) if args.pagination else run(args)
+    text = json.dumps(report, indent=2, sort_keys=True)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(text + '\n')
+    else:
+        print(text)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,78 @@
+import random
+from sqlalchemy import insert
+from database import db
+from models.user import User
+from models.product import Product
+from models.cart import Cart
+from models.order import Order
+from models.order_product import OrderProduct
+
+CATEGORIES = list(Product.category.type.enums)
+
+WORDS = [
+    'yoga', 'mat', 'protein', 'whey', 'vitamin', 'omega', 'serum', 'shampoo', 'dumbbell',
+    'kettlebell', 'resistance', 'band', 'foam', 'roller', 'herbal', 'tea', 'collagen',
+    'moisturizer', 'sunscreen', 'massage', 'oil', 'aroma', 'diffuser', 'multivitamin',
+    'organic', 'natural', 'premium', 'daily', 'recovery', 'energy', 'sleep', 'calm'
+]
+
+BATCH_SIZE = 1000
+
+
+def _batched_insert(model, rows):
+    batch = []
+    for row in rows:
+        batch.append(row)
+        if len(batch) >= BATCH_SIZE:
+            db.session.execute(insert(model), batch)
+            batch = []
+    if batch:
+        db.session.execute(insert(model), batch)
+
+
+def seed(users=100, products=500, carts=200, orders=1000, items_per_order=3, seed=42):
+    """Fill an empty schema with a reproducible dataset.
+
+    The same arguments always produce the same rows. User IDs and product
+    IDs are assumed to start at 1.
+    """
+    rng = random.Random(seed)
+
+    _batched_insert(User, ({
+        'fname': f'User{i}',
+        'lname': 'Bench',
+        'email': f'user{i}@bench.local',
+        'password': 'not-a-real-hash'
+    } for i in range(1, users + 1)))
+
+    _batched_insert(Product, ({
+        'name': ' '.join(rng.sample(WORDS, 3)).title(),
+        'description': ' '.join(rng.choices(WORDS, k=30)),
+        'price': round(rng.uniform(5, 500), 2),
+        'category': CATEGORIES[i % len(CATEGORIES)],
+        'stock': rng.randint(1000, 100000),
+        'image_url': f'https://example.com/img/{i}.jpg'
+    } for i in range(1, products + 1)))
+
+    cart_rows = {}
+    while len(cart_rows) < min(carts, users * products):
+        key = (rng.randint(1, users), rng.randint(1, products))
+        cart_rows[key] = rng.randint(1, 5)
+    _batched_insert(Cart, ({'user_id': u, 'product_id': p, 'quantity': q}
+                           for (u, p), q in cart_rows.items()))
+
+    _batched_insert(Order, ({
+        'user_id': rng.randint(1, users),
+        'total_amount': round(rng.uniform(10, 2000), 2),
+        'status': rng.choice(['Pending', 'Shipped', 'Delivered', 'Cancelled']),
+        'payment_status': 'Success',
+        'payment_method': rng.choice(['upi', 'card', 'wallet'])
+    } for _ in range(orders)))
+
+    def order_lines():
+        for order_id in range(1, orders + 1):
+            for product_id in rng.sample(range(1, products + 1), min(items_per_order, products)):
+                yield {'order_id': order_id, 'product_id': product_id, 'quantity': rng.randint(1, 3)}
+    _batched_insert(OrderProduct, order_lines())
+
+    db.session.commit()
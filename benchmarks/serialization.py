@@ -0,0 +1,60 @@
+"""Compare listing serialization throughput: ORM to_dict + stdlib json vs
+column projection + the app's JSON provider.
+
+    python -m benchmarks.serialization --products 20000 --orders 5000
+"""
+import argparse
+import json
+import time
+from database import db
+from models.product import Product
+from models.order import Order
+from benchmarks.run import build_app
+from benchmarks.seed import seed
+from utils.json_provider import orjson
+
+
+def measure(fn, repeat):
+    best = None
+    for _ in range(repeat):
+        db.session.expunge_all()
+        start = time.perf_counter()
+        rows = fn()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return rows, best
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--database-uri', default='sqlite://')
+    parser.add_argument('--products', type=int, default=20000)
+    parser.add_argument('--orders', type=int, default=5000)
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args(argv)
+
+    app = build_app(args.database_uri)
+    with app.app_context():
+        seed(users=100, products=args.products, carts=0, orders=args.orders)
+        dumps = app.json.dumps
+
+        cases = {
+            'products_to_dict': lambda: json.dumps([p.to_dict() for p in Product.query.all()]),
+            'products_projected': lambda: dumps([r._asdict() for r in Product.query.with_entities(*Product.projection())]),
+            'orders_to_dict': lambda: json.dumps([o.to_dict() for o in Order.with_items().all()]),
+            'orders_projected': lambda: dumps(Order.encode_rows(Order.query.with_entities(*Order.projection()).all())),
+        }
+        counts = {'products': args.products, 'orders': args.orders}
+
+        report = {'json_backend': 'orjson' if orjson else 'stdlib', 'results': {}}
+        for name, fn in cases.items():
+            _, elapsed = measure(fn, args.repeat)
+            rows = counts[name.split('_')[0]]
+            report['results'][name] = {'rows': rows, 'seconds': round(elapsed, 4),
+                                       'rows_per_second': round(rows / elapsed)}
+
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == '__main__':
+    main()
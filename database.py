@@ -1,11 +1,76 @@
+import os
 from flask_sqlalchemy import SQLAlchemy
-from config import SQLALCHEMY_DATABASE_URI, SQLALCHEMY_TRACK_MODIFICATIONS, SQLALCHEMY_ENGINE_OPTIONS
+from config import SQLALCHEMY_ENGINE_OPTIONS
+from utils.db_routing import ReplicaRouter, RoutingSession
+
+db = SQLAlchemy(session_options={'class_': RoutingSession})
+
+
+def engine_options(config, uri=None):
+    """Build SQLAlchemy engine options from the app's DB_* settings.
+
+    Any SQLALCHEMY_ENGINE_OPTIONS already set on the app take precedence.
+    """
+    uri = uri or config['SQLALCHEMY_DATABASE_URI']
+
+    if uri.startswith('sqlite'):
+        # SQLite has no server-side pool to size; allow use across threads
+        options = {'connect_args': {'check_same_thread': False, 'timeout': 30}}
+    else:
+        options = dict(SQLALCHEMY_ENGINE_OPTIONS) if uri.startswith('mysql') else {'pool_pre_ping': True}
+        options.update(
+            pool_size=config.get('DB_POOL_SIZE', 10),
+            max_overflow=config.get('DB_MAX_OVERFLOW', 5),
+            pool_timeout=config.get('DB_POOL_TIMEOUT', 10),
+            pool_recycle=config.get('DB_POOL_RECYCLE', 1800),
+        )
+        # Server isolation levels such as READ COMMITTED; SQLite has its own
+        if config.get('DB_ISOLATION_LEVEL'):
+            options['isolation_level'] = config['DB_ISOLATION_LEVEL']
+
+    options.update(config.get('SQLALCHEMY_ENGINE_OPTIONS') or {})
+    return options
+
+
+def begin_savepoint():
+    """db.session.begin_nested() on the primary, nested on SQLite as well.
+
+    pysqlite defers BEGIN to the first INSERT/UPDATE/DELETE. A savepoint
+    taken before that would be the outermost transaction, and releasing
+    it would commit, so the transaction is begun first.
+    """
+    connection = db.session.connection(bind_arguments={'bind': db.engine})
+    if connection.dialect.name == 'sqlite' and not connection.connection.dbapi_connection.in_transaction:
+        connection.exec_driver_sql('BEGIN')
+    return db.session.begin_nested()
 
-db = SQLAlchemy()
 
 def init_db(app):
     """Initialize the database with the Flask app."""
-    app.config["SQLALCHEMY_DATABASE_URI"] = SQLALCHEMY_DATABASE_URI
-    app.config["SQLALCHEMY_TRACK_MODIFICATIONS"] = SQLALCHEMY_TRACK_MODIFICATIONS
-    app.config["SQLALCHEMY_ENGINE_OPTIONS"] = SQLALCHEMY_ENGINE_OPTIONS
+    app.config.setdefault('SQLALCHEMY_TRACK_MODIFICATIONS', False)
+    # Replica options are built from the settings as given, not from the
+    # primary's merged options, so replicas don't inherit its pool sizing
+    primary_options = engine_options(app.config)
+
+    replica_uris = [uri.strip() for uri in (app.config.get('DB_REPLICA_URIS') or '').split(',') if uri.strip()]
+    if replica_uris:
+        binds = dict(app.config.get('SQLALCHEMY_BINDS') or {})
+        for i, uri in enumerate(replica_uris):
+            binds[f'replica_{i}'] = {'url': uri, **engine_options(app.config, uri)}
+        app.config['SQLALCHEMY_BINDS'] = binds
+        app.extensions['db_router'] = ReplicaRouter(
+            [f'replica_{i}' for i in range(len(replica_uris))],
+            strategy=app.config.get('DB_REPLICA_STRATEGY', 'round_robin'),
+            max_lag=app.config.get('DB_REPLICA_MAX_LAG'),
+            check_interval=app.config.get('DB_REPLICA_LAG_CHECK_INTERVAL', 5)
+        )
+    app.config['SQLALCHEMY_ENGINE_OPTIONS'] = primary_options
+
     db.init_app(app)
+
+    # Forked workers (gunicorn prefork) must never reuse the parent's
+    # pooled connections; drop them in the child without closing them.
+    if hasattr(os, 'register_at_fork'):
+        with app.app_context():
+            engines = list(db.engines.values())
+        os.register_at_fork(after_in_child=lambda: [engine.dispose(close=False) for engine in engines])
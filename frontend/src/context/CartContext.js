@@ -1,5 +1,6 @@
 import React, { createContext, useContext, useState, useEffect } from 'react';
 import API from '../api';
+import { getStoredUserId } from '../services/authService';
 
 // Create the context
 const CartContext = createContext();
@@ -24,16 +25,8 @@ export const CartProvider = ({ children }) => {
     return localStorage.getItem('token') !== null;
   };
 
-  // Get user ID from token (in a real app, you would decode the JWT token)
-  const getUserId = () => {
-    const token = localStorage.getItem('token');
-    if (!token) return null;
-    
-    // For now, we'll extract the user ID from our dummy token format
-    // In a real app, you would decode the JWT token
-    const match = token.match(/dummy_token_(\d+)/);
-    return match ? match[1] : null;
-  };
+  // Get the logged-in user's ID (the signed token is opaque to the client)
+  const getUserId = () => getStoredUserId();
 
   // Fetch cart items for the logged-in user
   const fetchCartItems = async () => {
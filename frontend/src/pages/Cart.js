@@ -1,7 +1,7 @@
 import React, { useState, useEffect } from 'react';
 import { useCart } from '../context/CartContext';
 import { useNavigate } from 'react-router-dom';
-import { getProductById } from '../services/productService';
+import { getProductsByIds } from '../services/productService';
 import '../styles/Cart.css';
 
 function Cart() {
@@ -27,9 +27,11 @@ function Cart() {
         // Get unique product IDs from cart items
         const uniqueProductIds = [...new Set(cartItems.map(item => item.product_id))];
         
-        // Fetch product details for each unique product
-        const productPromises = uniqueProductIds.map(id => getProductById(id));
-        const productResults = await Promise.all(productPromises);
+        // Fetch product details for all unique products in one request
+        const productsById = await getProductsByIds(uniqueProductIds);
+        const productResults = uniqueProductIds
+          .map(id => productsById[id])
+          .filter(product => product !== undefined);
         
         // Map products with their cart quantities
         const productsWithQuantities = productResults.map(product => {
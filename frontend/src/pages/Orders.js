@@ -1,14 +1,15 @@
 import React, { useState, useEffect } from 'react';
 import { useLocation, useNavigate } from 'react-router-dom';
 import { useCart } from '../context/CartContext';
-import { createOrder, getUserOrders } from '../services/orderService';
-import { getProductById } from '../services/productService';
+import { checkoutCart, getUserOrders } from '../services/orderService';
+import { getProductsByIds } from '../services/productService';
+import { getStoredUserId } from '../services/authService';
 import '../styles/Orders.css';
 
 function Orders() {
   const location = useLocation();
   const navigate = useNavigate();
-  const { cartItems, clearCart, isLoggedIn } = useCart();
+  const { cartItems, fetchCartItems, isLoggedIn } = useCart();
   const [loading, setLoading] = useState(true);
   const [error, setError] = useState(null);
   const [orderPlaced, setOrderPlaced] = useState(false);
@@ -38,11 +39,11 @@ function Orders() {
     console.log('Token in localStorage:', token);
     
     if (token) {
-      const match = token.match(/dummy_token_(\d+)/);
-      if (match) {
-        console.log('User ID from token:', match[1]);
+      const userId = getStoredUserId();
+      if (userId) {
+        console.log('Logged-in user ID:', userId);
       } else {
-        console.error('Token format is invalid');
+        console.error('No stored user for token');
       }
     } else {
       console.error('No token found in localStorage');
@@ -67,41 +68,32 @@ function Orders() {
         console.log('Orders fetched:', orders);
         setPreviousOrders(Array.isArray(orders) ? orders : []);
 
-        // Fetch product details for each order's items
-        if (orders && orders.length > 0) {
+        // Fetch product details for every order item and cart item in one batch
+        const orderList = Array.isArray(orders) ? orders : [];
+        const productIds = [
+          ...orderList.flatMap(order => (order.items || []).map(item => item.product_id)),
+          ...(cartItems || []).map(item => item.product_id)
+        ];
+        const productsById = productIds.length > 0 ? await getProductsByIds(productIds) : {};
+
+        if (orderList.length > 0) {
           const productDetails = {};
           
-          for (const order of orders) {
-            console.log(`Processing order ${order.order_id}:`, order);
-            
+          for (const order of orderList) {
             if (order.items && order.items.length > 0) {
-              console.log(`Order ${order.order_id} has ${order.items.length} items:`, order.items);
-              
-              const productPromises = order.items.map(item => {
-                console.log(`Fetching product details for product_id: ${item.product_id}`);
-                return getProductById(item.product_id)
-                  .then(product => {
-                    console.log(`Product details for ${item.product_id}:`, product);
-                    if (!product) {
-                      console.error(`Product not found for ID: ${item.product_id}`);
-                      return null;
-                    }
-                    return {
-                      ...product,
-                      quantity: item.quantity,
-                      price: item.price
-                    };
-                  })
-                  .catch(err => {
-                    console.error(`Error fetching product ${item.product_id}:`, err);
-                    return null;
-                  });
-              });
-
-              const products = await Promise.all(productPromises);
-              const validProducts = products.filter(product => product !== null);
-              console.log(`Valid products for order ${order.order_id}:`, validProducts);
-              productDetails[order.order_id] = validProducts;
+              productDetails[order.order_id] = order.items
+                .filter(item => {
+                  if (!productsById[item.product_id]) {
+                    console.error(`Product not found for ID: ${item.product_id}`);
+                    return false;
+                  }
+                  return true;
+                })
+                .map(item => ({
+                  ...productsById[item.product_id],
+                  quantity: item.quantity,
+                  price: item.price
+                }));
             } else {
               console.log(`Order ${order.order_id} has no items`);
             }
@@ -111,33 +103,29 @@ function Orders() {
           setOrderProducts(productDetails);
         }
 
-        // Fetch product details for cart items
+        // Product details for cart items
         if (cartItems && cartItems.length > 0) {
-          const productPromises = cartItems.map(item => 
-            getProductById(item.product_id)
-              .then(product => {
-                if (!product) {
-                  console.error(`Product not found for ID: ${item.product_id}`);
-                  return null;
-                }
-                return {
-                  id: product.product_id,
-                  product_id: product.product_id,
-                  name: product.name,
-                  price: product.price,
-                  image_url: product.image_url,
-                  quantity: item.quantity,
-                  cart_item_id: item.cart_id
-                };
-              })
-              .catch(err => {
-                console.error(`Error fetching product ${item.product_id}:`, err);
-                return null;
-              })
-          );
-
-          const products = await Promise.all(productPromises);
-          const validProducts = products.filter(product => product !== null);
+          const validProducts = cartItems
+            .filter(item => {
+              if (!productsById[item.product_id]) {
+                console.error(`Product not found for ID: ${item.product_id}`);
+                return false;
+              }
+              return true;
+            })
+            .map(item => {
+              const product = productsById[item.product_id];
+              return {
+                id: product.product_id,
+                product_id: product.product_id,
+                name: product.name,
+                price: product.price,
+                image_url: product.image_url,
+                quantity: item.quantity,
+                cart_item_id: item.cart_id
+              };
+            });
+
           console.log('Fetched products for cart:', validProducts);
           setProducts(validProducts);
           
@@ -238,24 +226,13 @@ function Orders() {
         // Simulate payment processing
         await new Promise(resolve => setTimeout(resolve, 1500));
         
-        // Prepare order data
-        const orderData = {
-          total_amount: calculateTotal(),
-          items: products.map(product => ({
-            product_id: product.product_id,
-            quantity: product.quantity,
-            price: product.price
-          })),
-          payment_method: selectedPaymentMethod
-        };
-
-        // Create the order
-        const newOrder = await createOrder(orderData);
+        // Turn the cart into an order (priced and cleared server-side)
+        const newOrder = await checkoutCart(selectedPaymentMethod);
         console.log('Order placed successfully:', newOrder);
         
         setCurrentOrder(newOrder);
         setOrderPlaced(true);
-        clearCart(); // Clear the cart after successful order
+        fetchCartItems(); // Cart was emptied by the checkout
         setProducts([]); // Clear products state
         setShowPaymentSection(false); // Hide payment section
         
@@ -285,26 +262,13 @@ function Orders() {
     setError(null);
 
     try {
-      // Prepare order data
-      const orderData = {
-        total_amount: calculateTotal(),
-        items: products.map(product => ({
-          product_id: product.product_id,
-          quantity: product.quantity,
-          price: product.price
-        })),
-        payment_method: selectedPaymentMethod // Include payment method
-      };
-
-      console.log('Placing order with data:', orderData);
-
-      // Create the order
-      const newOrder = await createOrder(orderData);
+      // Turn the cart into an order (priced and cleared server-side)
+      const newOrder = await checkoutCart(selectedPaymentMethod);
       console.log('Order placed successfully:', newOrder);
       
       setCurrentOrder(newOrder);
       setOrderPlaced(true);
-      clearCart(); // Clear the cart after successful order
+      fetchCartItems(); // Cart was emptied by the checkout
       setProducts([]); // Clear products state
       setShowPaymentSection(false); // Hide payment section
       setPaymentSuccess(false); // Reset payment success
@@ -27,6 +27,18 @@ export const loginUser = async (credentials) => {
   }
 };
 
+// Get the logged-in user's ID. The token is signed by the server and
+// opaque to the client, so the ID comes from the user stored at login.
+export const getStoredUserId = () => {
+  if (!localStorage.getItem("token")) return null;
+  try {
+    const user = JSON.parse(localStorage.getItem("user"));
+    return user && user.user_id ? String(user.user_id) : null;
+  } catch (error) {
+    return null;
+  }
+};
+
 // Logout User
 export const logoutUser = () => {
   localStorage.removeItem("token");
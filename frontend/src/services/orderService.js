@@ -1,29 +1,20 @@
 import axios from 'axios';
+import { getStoredUserId } from './authService';
 
 const API_URL = 'http://localhost:5000/api';
 
-// Get user ID from token
+// Get the logged-in user's ID
 const getUserId = () => {
-  const token = localStorage.getItem('token');
-  if (!token) {
-    console.error('No token found in localStorage');
-    return null;
+  const userId = getStoredUserId();
+  if (!userId) {
+    console.error('No logged-in user found in localStorage');
   }
-  
-  // Extract user ID from token
-  const match = token.match(/dummy_token_(\d+)/);
-  if (!match) {
-    console.error('Token format is invalid:', token);
-    return null;
-  }
-  
-  const userId = match[1];
-  console.log('Extracted user ID:', userId);
   return userId;
 };
 
-// Create a new order
-export const createOrder = async (orderData) => {
+// Create a new order. Pass the same idempotencyKey when retrying a
+// request that may have gone through, so the order is created only once.
+export const createOrder = async (orderData, idempotencyKey = crypto.randomUUID()) => {
   try {
     const userId = getUserId();
     if (!userId) throw new Error('User not authenticated');
@@ -67,7 +58,8 @@ export const createOrder = async (orderData) => {
     const response = await axios.post(`${API_URL}/orders`, orderPayload, {
       headers: {
         'Authorization': `Bearer ${localStorage.getItem('token')}`,
-        'Content-Type': 'application/json'
+        'Content-Type': 'application/json',
+        'Idempotency-Key': idempotencyKey
       }
     });
 
@@ -84,6 +76,36 @@ export const createOrder = async (orderData) => {
   }
 };
 
+// Check out the current user's cart: the server prices the items,
+// reserves stock, creates the order and empties the cart in one request
+export const checkoutCart = async (paymentMethod, paymentStatus = 'Success', idempotencyKey = crypto.randomUUID()) => {
+  try {
+    const userId = getUserId();
+    if (!userId) throw new Error('User not authenticated');
+
+    const response = await axios.post(`${API_URL}/cart/user/${userId}/checkout`, {
+      payment_method: paymentMethod || null,
+      payment_status: paymentStatus
+    }, {
+      headers: {
+        'Authorization': `Bearer ${localStorage.getItem('token')}`,
+        'Content-Type': 'application/json',
+        'Idempotency-Key': idempotencyKey
+      }
+    });
+
+    console.log('Checkout response:', response.data);
+    return response.data;
+  } catch (error) {
+    console.error('Error checking out cart:', error);
+    if (error.response) {
+      console.error('Response data:', error.response.data);
+      throw new Error(error.response.data.error || 'Failed to place order');
+    }
+    throw error;
+  }
+};
+
 // Get all orders for the current user
 export const getUserOrders = async () => {
   try {
@@ -1,29 +1,62 @@
 import API from '../api';
 
+// Backend limit on rows per keyset page
+const MAX_PAGE_SIZE = 1000;
+
+// Get every row of an unpaged list route. The server caps those lists and
+// sends X-Next-Cursor when there is more; the rest comes in keyset pages.
+const getAllPages = async (path, params = {}) => {
+  const response = await API.get(path, { params });
+  const rows = response.data;
+  let cursor = response.headers['x-next-cursor'];
+  while (cursor) {
+    const page = await API.get(path, { params: { ...params, cursor, limit: MAX_PAGE_SIZE } });
+    rows.push(...page.data.items);
+    cursor = page.data.next_cursor;
+  }
+  return rows;
+};
+
 // Get all products
 export const getAllProducts = async () => {
   try {
-    const response = await API.get('/products');
-    return response.data;
+    return await getAllPages('/products');
   } catch (error) {
     console.error('Error fetching all products:', error);
     throw error;
   }
 };
 
-// Get products by category
+// Get every product in a category. The filtered listing would return only
+// its first page, so this uses the plain category listing.
 export const getProductsByCategory = async (category) => {
   try {
-    const response = await API.get('/products');
-    const allProducts = response.data;
-    
-    // Filter products by category
-    return allProducts.filter(product => product.category === category);
+    return await getAllPages('/products/categories', { categories: category });
   } catch (error) {
     throw error.response ? error.response.data : error.message;
   }
 };
 
+// Get a filtered, sorted page of products with facet counts.
+// filters: { category: [...], minPrice, maxPrice, inStock, sort, limit }
+// Resolves to { products, total, facets: { category, price } }.
+export const filterProducts = async (filters = {}) => {
+  try {
+    const params = { sort: filters.sort || 'name' };
+    if (filters.category && filters.category.length > 0) params.category = filters.category.join(',');
+    if (filters.minPrice !== undefined) params.min_price = filters.minPrice;
+    if (filters.maxPrice !== undefined) params.max_price = filters.maxPrice;
+    if (filters.inStock) params.in_stock = 'true';
+    if (filters.limit) params.limit = filters.limit;
+
+    const response = await API.get('/products', { params });
+    return response.data;
+  } catch (error) {
+    console.error('Error filtering products:', error);
+    throw error;
+  }
+};
+
 // Get a single product by ID
 export const getProductById = async (productId) => {
   try {
@@ -35,6 +68,36 @@ export const getProductById = async (productId) => {
   }
 };
 
+// Backend limit on IDs per batch request
+const MAX_BATCH_IDS = 100;
+
+// Get several products by ID in as few requests as possible.
+// Resolves to an object keyed by product_id; missing IDs are left out.
+export const getProductsByIds = async (productIds) => {
+  try {
+    const uniqueIds = [...new Set(productIds)];
+    const chunks = [];
+    for (let i = 0; i < uniqueIds.length; i += MAX_BATCH_IDS) {
+      chunks.push(uniqueIds.slice(i, i + MAX_BATCH_IDS));
+    }
+
+    const responses = await Promise.all(chunks.map(ids =>
+      API.get('/products', { params: { ids: ids.join(',') } })
+    ));
+
+    const productsById = {};
+    responses.forEach(response => {
+      response.data.products.forEach(product => {
+        productsById[product.product_id] = product;
+      });
+    });
+    return productsById;
+  } catch (error) {
+    console.error('Error fetching products:', error);
+    throw error;
+  }
+};
+
 // Get products by categories
 export const getProductsByCategories = async (categories) => {
   try {
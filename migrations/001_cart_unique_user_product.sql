@@ -0,0 +1,19 @@
+-- Merge duplicate cart lines and enforce one row per (user_id, product_id).
+-- Required before Cart.upsert can rely on the unique constraint.
+
+UPDATE cart c
+JOIN (
+    SELECT user_id, product_id, MIN(cart_id) AS keep_id, SUM(quantity) AS total
+    FROM cart
+    GROUP BY user_id, product_id
+    HAVING COUNT(*) > 1
+) d ON c.cart_id = d.keep_id
+SET c.quantity = d.total;
+
+DELETE c FROM cart c
+JOIN cart k
+  ON k.user_id = c.user_id
+ AND k.product_id = c.product_id
+ AND k.cart_id < c.cart_id;
+
+ALTER TABLE cart ADD UNIQUE INDEX uq_cart_user_product (user_id, product_id);
@@ -0,0 +1,7 @@
+-- Indexes behind the filtered/sorted product listing and its facet counts.
+-- (category, price) serves category filters with price ranges or price
+-- sorting and the grouped facet aggregate; (stock) serves in_stock=true.
+
+ALTER TABLE product
+    ADD INDEX ix_product_category_price (category, price),
+    ADD INDEX ix_product_stock (stock);
@@ -0,0 +1,15 @@
+-- Secondary indexes for the access paths used by routes/*.py.
+-- InnoDB drops the implicit index it created for a foreign key once one
+-- of these explicit indexes can enforce the constraint instead.
+-- user.email is already covered by its unique index and cart.user_id by
+-- uq_cart_user_product (001).
+
+ALTER TABLE `order`
+    ADD INDEX ix_order_user_id_order_id (user_id, order_id),
+    ADD INDEX ix_order_order_date (order_date);
+
+ALTER TABLE order_product
+    ADD INDEX ix_order_product_product_id (product_id);
+
+ALTER TABLE cart
+    ADD INDEX ix_cart_product_id (product_id);
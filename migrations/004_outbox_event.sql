@@ -0,0 +1,16 @@
+-- Transactional outbox drained by utils/outbox.py workers.
+
+CREATE TABLE outbox_event (
+    event_id INT NOT NULL AUTO_INCREMENT PRIMARY KEY,
+    topic VARCHAR(50) NOT NULL,
+    payload JSON NOT NULL,
+    status ENUM('pending', 'done', 'dead') NOT NULL,
+    attempts INT NOT NULL,
+    available_at DATETIME NOT NULL,
+    lease_token VARCHAR(32) NULL,
+    last_error TEXT NULL,
+    created_at DATETIME NOT NULL,
+    processed_at DATETIME NULL,
+    INDEX ix_outbox_event_status_available_at (status, available_at),
+    INDEX ix_outbox_event_lease_token (lease_token)
+);
@@ -0,0 +1,13 @@
+-- Stored responses for POST requests sent with an Idempotency-Key header.
+
+CREATE TABLE idempotency_key (
+    `key` VARCHAR(64) NOT NULL PRIMARY KEY,
+    fingerprint VARCHAR(64) NOT NULL,
+    status ENUM('in_progress', 'done') NOT NULL,
+    response_status INT NULL,
+    response_body TEXT NULL,
+    content_type VARCHAR(100) NULL,
+    created_at DATETIME NOT NULL,
+    expires_at DATETIME NOT NULL,
+    INDEX ix_idempotency_key_expires_at (expires_at)
+);
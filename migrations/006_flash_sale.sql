@@ -0,0 +1,14 @@
+-- Flash-sale mode (utils/flash_sale.py): flagged products are sold from
+-- stock allocated to each serving process.
+
+ALTER TABLE product ADD COLUMN flash_sale BOOLEAN NOT NULL DEFAULT FALSE;
+
+CREATE TABLE flash_sale_allocation (
+    owner VARCHAR(64) NOT NULL,
+    product_id INT NOT NULL,
+    quantity INT NOT NULL,
+    updated_at DATETIME NOT NULL,
+    PRIMARY KEY (owner, product_id),
+    CONSTRAINT fk_flash_sale_allocation_product FOREIGN KEY (product_id)
+        REFERENCES product (product_id) ON DELETE CASCADE
+);
@@ -0,0 +1,13 @@
+-- Catalog version behind the catalog ETags (utils/http_cache.py): the
+-- latest product write and the latest product deletion. The database
+-- stamps updated_at on every insert and update, stock changes included.
+
+ALTER TABLE product
+    ADD COLUMN updated_at DATETIME(6) NOT NULL
+        DEFAULT CURRENT_TIMESTAMP(6) ON UPDATE CURRENT_TIMESTAMP(6),
+    ADD INDEX ix_product_updated_at (updated_at);
+
+CREATE TABLE product_deletion (
+    deletion_id INT NOT NULL AUTO_INCREMENT PRIMARY KEY,
+    product_id INT NOT NULL
+);
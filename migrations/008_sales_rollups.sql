@@ -0,0 +1,41 @@
+-- Sales rollups maintained by the outbox 'sales.record' handler
+-- (utils/analytics.py). Fill them from existing orders afterwards with
+-- 'flask --app app rebuild-analytics'.
+--
+-- order_product.unit_price is the price a line was ordered at, so a
+-- cancellation subtracts the revenue the order added even after a price
+-- change. Lines written before this migration keep NULL and are counted
+-- at the product's current price.
+
+ALTER TABLE order_product ADD COLUMN unit_price DECIMAL(10, 2) NULL;
+
+CREATE TABLE sales_daily (
+    day DATE NOT NULL PRIMARY KEY,
+    orders INT NOT NULL,
+    units INT NOT NULL,
+    revenue DECIMAL(14, 2) NOT NULL
+);
+
+CREATE TABLE sales_daily_category (
+    day DATE NOT NULL,
+    category ENUM('Fitness Equipment', 'Wellness & Self-care',
+                  'Hair & Skin Products', 'Health Supplements') NOT NULL,
+    units INT NOT NULL,
+    revenue DECIMAL(14, 2) NOT NULL,
+    PRIMARY KEY (day, category)
+);
+
+CREATE TABLE sales_daily_product (
+    day DATE NOT NULL,
+    product_id INT NOT NULL,
+    units INT NOT NULL,
+    revenue DECIMAL(14, 2) NOT NULL,
+    PRIMARY KEY (day, product_id)
+);
+
+CREATE TABLE sales_product_total (
+    product_id INT NOT NULL PRIMARY KEY,
+    units INT NOT NULL,
+    revenue DECIMAL(14, 2) NOT NULL,
+    INDEX ix_sales_product_total_units (units)
+);
@@ -1,7 +1,13 @@
+from sqlalchemy.dialects import mysql, postgresql, sqlite
 from database import db
 
 class Cart(db.Model):
     __tablename__ = 'cart'
+    __table_args__ = (
+        # Also the index for every WHERE user_id = ? cart lookup
+        db.UniqueConstraint('user_id', 'product_id', name='uq_cart_user_product'),
+        db.Index('ix_cart_product_id', 'product_id'),
+    )
 
     cart_id = db.Column(db.Integer, primary_key=True, autoincrement=True)
     user_id = db.Column(db.Integer, db.ForeignKey('user.user_id', ondelete='CASCADE'), nullable=False)
@@ -12,6 +18,35 @@ class Cart(db.Model):
     user = db.relationship('User', backref='cart_items', lazy=True)
     product = db.relationship('Product', backref='cart_items', lazy=True)
 
+    @classmethod
+    def upsert(cls, user_id, product_id, quantity):
+        """Add quantity to the user's line for product_id, creating it if needed.
+
+        Runs as a single INSERT ... ON DUPLICATE KEY UPDATE (MySQL) or
+        INSERT ... ON CONFLICT DO UPDATE (SQLite/PostgreSQL) against the
+        (user_id, product_id) unique constraint.
+        """
+        values = {'user_id': user_id, 'product_id': product_id, 'quantity': quantity}
+        dialect = db.session.get_bind().dialect.name
+
+        if dialect == 'mysql':
+            stmt = mysql.insert(cls).values(**values)
+            stmt = stmt.on_duplicate_key_update(quantity=cls.quantity + stmt.inserted.quantity)
+        else:
+            insert = postgresql.insert if dialect == 'postgresql' else sqlite.insert
+            stmt = insert(cls).values(**values)
+            stmt = stmt.on_conflict_do_update(
+                index_elements=['user_id', 'product_id'],
+                set_={'quantity': cls.quantity + stmt.excluded.quantity}
+            )
+
+        db.session.execute(stmt)
+
+    @classmethod
+    def projection(cls):
+        """Columns returned by to_dict, for listings that skip ORM hydration."""
+        return (cls.cart_id, cls.user_id, cls.product_id, cls.quantity, cls.added_on)
+
     def to_dict(self):
         """Convert model instance to dictionary."""
         return {
@@ -0,0 +1,19 @@
+from database import db
+from models.outbox import utcnow
+
+
+class FlashSaleAllocation(db.Model):
+    """Stock of a flash-sale product held by one serving process (utils/flash_sale.py).
+
+    Units move from product.stock to a row here in the same transaction,
+    and leave it when their order lines are flushed or when the process
+    hands unsold units back. product.stock plus every owner's quantity is
+    the product's unsold stock.
+    """
+    __tablename__ = 'flash_sale_allocation'
+
+    # host-pid-nonce of the process, also the name of its reservation log
+    owner = db.Column(db.String(64), primary_key=True)
+    product_id = db.Column(db.Integer, db.ForeignKey('product.product_id', ondelete="CASCADE"), primary_key=True)
+    quantity = db.Column(db.Integer, nullable=False)
+    updated_at = db.Column(db.DateTime, nullable=False, default=utcnow, onupdate=utcnow)
@@ -0,0 +1,18 @@
+from database import db
+
+
+class IdempotencyKey(db.Model):
+    """Stored outcome of a write request sent with an Idempotency-Key header."""
+    __tablename__ = 'idempotency_key'
+
+    # sha256 of the client's key scoped by method, path and caller
+    key = db.Column(db.String(64), primary_key=True)
+    # sha256 of the request body; a reused key with another body is rejected
+    fingerprint = db.Column(db.String(64), nullable=False)
+    status = db.Column(db.Enum('in_progress', 'done'), nullable=False, default='in_progress')
+    response_status = db.Column(db.Integer, nullable=True)
+    response_body = db.Column(db.Text, nullable=True)
+    content_type = db.Column(db.String(100), nullable=True)
+    created_at = db.Column(db.DateTime, nullable=False)
+    # In-progress rows expire after IDEMPOTENCY_LOCK_TIMEOUT, finished ones after IDEMPOTENCY_TTL
+    expires_at = db.Column(db.DateTime, nullable=False, index=True)
@@ -1,9 +1,15 @@
+from sqlalchemy.orm import selectinload
 from database import db
 from models.order_product import OrderProduct
 from models.product import Product
 
 class Order(db.Model):
     __tablename__ = 'order'
+    __table_args__ = (
+        # Order history pages: WHERE user_id = ? ORDER BY order_id
+        db.Index('ix_order_user_id_order_id', 'user_id', 'order_id'),
+        db.Index('ix_order_order_date', 'order_date'),
+    )
 
     order_id = db.Column(db.Integer, primary_key=True, autoincrement=True)
     user_id = db.Column(db.Integer, db.ForeignKey('user.user_id', ondelete="CASCADE"), nullable=False)
@@ -13,15 +19,71 @@ class Order(db.Model):
     payment_status = db.Column(db.String(20), default='Pending', nullable=False)
     payment_method = db.Column(db.String(50), nullable=True)
 
+    order_products = db.relationship('OrderProduct', lazy=True,
+                                     cascade='all, delete-orphan', passive_deletes=True)
+
+    @classmethod
+    def with_items(cls):
+        """Query that eager-loads order lines and their products.
+
+        Serializing any number of orders from this query costs three
+        SELECTs in total (orders, order_product rows, products) instead of
+        one per order plus one per line item.
+        """
+        return cls.query.options(
+            selectinload(cls.order_products).selectinload(OrderProduct.product)
+        )
+
+    @classmethod
+    def projection(cls):
+        """Order columns returned by to_dict, for listings that skip ORM hydration."""
+        return (cls.order_id, cls.user_id, cls.total_amount, cls.order_date,
+                cls.status, cls.payment_status, cls.payment_method)
+
+    @staticmethod
+    def items_statement(order_ids):
+        """SELECT for the items of the given orders, in the shape to_dict uses."""
+        return db.select(
+            OrderProduct.order_id, OrderProduct.product_id, OrderProduct.quantity,
+            Product.price, Product.name.label('product_name')
+        ).join(Product, Product.product_id == OrderProduct.product_id) \
+         .where(OrderProduct.order_id.in_(order_ids))
+
+    @staticmethod
+    def encode_rows(rows):
+        """Encode projected order rows, attaching their items with one join query.
+
+        Produces the same shape as to_dict, but leaves Decimal and datetime
+        values for the JSON provider to encode.
+        """
+        orders = [row._asdict() for row in rows]
+        if not orders:
+            return orders
+        lines = db.session.execute(Order.items_statement([order['order_id'] for order in orders]))
+        return Order.attach_items(orders, lines)
+
+    @staticmethod
+    def attach_items(orders, lines):
+        """Add an 'items' list to each order dict from rows of items_statement."""
+        items_by_order = {}
+        for line in lines:
+            items_by_order.setdefault(line.order_id, []).append({
+                'product_id': line.product_id,
+                'quantity': line.quantity,
+                'price': line.price,
+                'product_name': line.product_name
+            })
+
+        for order in orders:
+            order['items'] = items_by_order.get(order['order_id'], [])
+        return orders
+
     def to_dict(self):
         """Convert model instance to dictionary"""
-        # Get order products
-        order_products = OrderProduct.query.filter_by(order_id=self.order_id).all()
-        
-        # Get product details for each order product
+        # Product details for each order product
         items = []
-        for op in order_products:
-            product = Product.query.get(op.product_id)
+        for op in self.order_products:
+            product = op.product
             if product:
                 items.append({
                     'product_id': op.product_id,
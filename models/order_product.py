@@ -2,10 +2,19 @@ from database import db
 
 class OrderProduct(db.Model):
     __tablename__ = 'order_product'
+    __table_args__ = (
+        # The primary key covers order_id lookups; this serves product_id
+        # joins and the cascade when a product is deleted
+        db.Index('ix_order_product_product_id', 'product_id'),
+    )
 
     order_id = db.Column(db.Integer, db.ForeignKey('order.order_id', ondelete="CASCADE"), primary_key=True)
     product_id = db.Column(db.Integer, db.ForeignKey('product.product_id', ondelete="CASCADE"), primary_key=True)
     quantity = db.Column(db.Integer, nullable=False)
+    # Product price when the line was ordered; NULL on lines written before it was recorded
+    unit_price = db.Column(db.Numeric(10, 2), nullable=True)
+
+    product = db.relationship('Product', lazy=True)
 
     def to_dict(self):
         return {
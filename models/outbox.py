@@ -0,0 +1,33 @@
+from datetime import datetime, timezone
+from database import db
+
+
+def utcnow():
+    """Naive UTC timestamp, as stored in the outbox DateTime columns."""
+    return datetime.now(timezone.utc).replace(tzinfo=None)
+
+
+class OutboxEvent(db.Model):
+    """Follow-up work written in the same transaction as the change that caused it.
+
+    Rows are claimed and processed by the workers in utils/outbox.py.
+    """
+    __tablename__ = 'outbox_event'
+    __table_args__ = (
+        # Workers poll WHERE status = 'pending' AND available_at <= now
+        db.Index('ix_outbox_event_status_available_at', 'status', 'available_at'),
+        db.Index('ix_outbox_event_lease_token', 'lease_token'),
+    )
+
+    event_id = db.Column(db.Integer, primary_key=True, autoincrement=True)
+    topic = db.Column(db.String(50), nullable=False)
+    payload = db.Column(db.JSON, nullable=False)
+    status = db.Column(db.Enum('pending', 'done', 'dead'), nullable=False, default='pending')
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+    # Not picked up before this time: set by retries' backoff and by claim leases
+    available_at = db.Column(db.DateTime, nullable=False, default=utcnow)
+    lease_token = db.Column(db.String(32), nullable=True)
+    last_error = db.Column(db.Text, nullable=True)
+    created_at = db.Column(db.DateTime, nullable=False, default=utcnow)
+    processed_at = db.Column(db.DateTime, nullable=True)
+
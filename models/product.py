@@ -1,7 +1,37 @@
+from sqlalchemy.dialects import mysql
+from sqlalchemy.ext.compiler import compiles
+from sqlalchemy.sql.functions import FunctionElement
 from database import db
 
+
+class now_precise(FunctionElement):
+    """The database server's current time, with sub-second precision where the dialect has it."""
+    type = db.DateTime()
+    inherit_cache = True
+
+
+@compiles(now_precise)
+def _now_precise(element, compiler, **kw):
+    return 'CURRENT_TIMESTAMP'
+
+
+@compiles(now_precise, 'mysql')
+def _now_precise_mysql(element, compiler, **kw):
+    return 'CURRENT_TIMESTAMP(6)'
+
+
+@compiles(now_precise, 'sqlite')
+def _now_precise_sqlite(element, compiler, **kw):
+    return "strftime('%Y-%m-%d %H:%M:%f', 'now')"
+
+
 class Product(db.Model):
     __tablename__ = 'product'
+    __table_args__ = (
+        db.Index('ix_product_category_price', 'category', 'price'),
+        db.Index('ix_product_stock', 'stock'),
+        db.Index('ix_product_updated_at', 'updated_at'),
+    )
 
     product_id = db.Column(db.Integer, primary_key=True, autoincrement=True)
     name = db.Column(db.String(100), nullable=False)
@@ -11,6 +41,17 @@ class Product(db.Model):
                                  'Hair & Skin Products', 'Health Supplements'), nullable=False)
     stock = db.Column(db.Integer, nullable=False)
     image_url = db.Column(db.String(255), nullable=False)
+    # Checkouts are served from the flash-sale ledger when FLASH_SALE_MODE is on
+    flash_sale = db.Column(db.Boolean, nullable=False, default=False, server_default=db.false())
+    # Set by the database on every insert and update (stock changes included); see catalog_version
+    updated_at = db.Column(db.DateTime().with_variant(mysql.DATETIME(fsp=6), 'mysql'), nullable=False,
+                           default=now_precise(), onupdate=now_precise())
+
+    @classmethod
+    def projection(cls):
+        """Columns returned by to_dict, for listings that skip ORM hydration."""
+        return (cls.product_id, cls.name, cls.description, cls.price,
+                cls.category, cls.stock, cls.image_url)
 
     def to_dict(self):
         """Convert product instance to dictionary."""
@@ -23,3 +64,11 @@ class Product(db.Model):
             'stock': self.stock,
             'image_url': self.image_url
         }
+
+
+class ProductDeletion(db.Model):
+    """One row per deleted product, so deletes move the catalog version too."""
+    __tablename__ = 'product_deletion'
+
+    deletion_id = db.Column(db.Integer, primary_key=True, autoincrement=True)
+    product_id = db.Column(db.Integer, nullable=False)
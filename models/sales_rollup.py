@@ -0,0 +1,49 @@
+from database import db
+from models.product import Product
+
+CATEGORY = db.Enum(*Product.category.type.enums)
+
+
+class DailySales(db.Model):
+    """Orders, units and revenue per day (cancelled orders excluded)."""
+    __tablename__ = 'sales_daily'
+
+    day = db.Column(db.Date, primary_key=True)
+    orders = db.Column(db.Integer, nullable=False, default=0)
+    units = db.Column(db.Integer, nullable=False, default=0)
+    revenue = db.Column(db.Numeric(14, 2), nullable=False, default=0)
+
+    def to_dict(self):
+        return {
+            'day': self.day.isoformat(),
+            'orders': self.orders,
+            'units': self.units,
+            'revenue': float(self.revenue)
+        }
+
+
+class DailyCategorySales(db.Model):
+    __tablename__ = 'sales_daily_category'
+
+    day = db.Column(db.Date, primary_key=True)
+    category = db.Column(CATEGORY, primary_key=True)
+    units = db.Column(db.Integer, nullable=False, default=0)
+    revenue = db.Column(db.Numeric(14, 2), nullable=False, default=0)
+
+
+class DailyProductSales(db.Model):
+    __tablename__ = 'sales_daily_product'
+
+    day = db.Column(db.Date, primary_key=True)
+    product_id = db.Column(db.Integer, primary_key=True)
+    units = db.Column(db.Integer, nullable=False, default=0)
+    revenue = db.Column(db.Numeric(14, 2), nullable=False, default=0)
+
+
+class ProductSalesTotal(db.Model):
+    """All-time units and revenue per product, indexed for top-seller queries."""
+    __tablename__ = 'sales_product_total'
+
+    product_id = db.Column(db.Integer, primary_key=True)
+    units = db.Column(db.Integer, nullable=False, default=0, index=True)
+    revenue = db.Column(db.Numeric(14, 2), nullable=False, default=0)
@@ -10,6 +10,11 @@ class User(db.Model):
     password = db.Column(db.String(255), nullable=False)  # Store hashed password
     registration_date = db.Column(db.TIMESTAMP, server_default=db.func.current_timestamp())
 
+    @classmethod
+    def projection(cls):
+        """Columns returned by to_dict, for listings that skip ORM hydration."""
+        return (cls.user_id, cls.fname, cls.lname, cls.email, cls.registration_date)
+
     def to_dict(self):
         """Convert model instance to dictionary (excluding password)."""
         return {
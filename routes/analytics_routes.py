@@ -0,0 +1,81 @@
+from datetime import date, timedelta
+from flask import Blueprint, request, jsonify
+from sqlalchemy import func
+from database import db
+from models.product import Product
+from models.sales_rollup import DailySales, DailyCategorySales, ProductSalesTotal
+
+analytics_bp = Blueprint('analytics_bp', __name__)
+
+# Default reporting window when no dates are given
+DEFAULT_DAYS = 30
+MAX_TOP_SELLERS = 100
+
+
+def _date_range():
+    """Parse ?from=YYYY-MM-DD&to=YYYY-MM-DD, defaulting to the last DEFAULT_DAYS days."""
+    end = date.fromisoformat(request.args['to']) if request.args.get('to') else date.today()
+    start = date.fromisoformat(request.args['from']) if request.args.get('from') \
+        else end - timedelta(days=DEFAULT_DAYS - 1)
+    return start, end
+
+
+# Daily order count, units and revenue
+@analytics_bp.route('/analytics/daily', methods=['GET'])
+def get_daily_totals():
+    try:
+        start, end = _date_range()
+    except ValueError:
+        return jsonify({'error': 'Dates must be YYYY-MM-DD'}), 400
+
+    rows = DailySales.query.filter(DailySales.day.between(start, end)) \
+        .order_by(DailySales.day).all()
+    return jsonify([row.to_dict() for row in rows])
+
+
+# Revenue per category over a date range
+@analytics_bp.route('/analytics/revenue-by-category', methods=['GET'])
+def get_revenue_by_category():
+    try:
+        start, end = _date_range()
+    except ValueError:
+        return jsonify({'error': 'Dates must be YYYY-MM-DD'}), 400
+
+    rows = db.session.query(
+        DailyCategorySales.category,
+        func.sum(DailyCategorySales.units).label('units'),
+        func.sum(DailyCategorySales.revenue).label('revenue')
+    ).filter(DailyCategorySales.day.between(start, end)) \
+     .group_by(DailyCategorySales.category) \
+     .order_by(func.sum(DailyCategorySales.revenue).desc()) \
+     .all()
+
+    return jsonify({
+        'from': start.isoformat(),
+        'to': end.isoformat(),
+        'categories': [{
+            'category': row.category,
+            'units': int(row.units),
+            'revenue': float(row.revenue)
+        } for row in rows]
+    })
+
+
+# Best-selling products of all time
+@analytics_bp.route('/analytics/top-sellers', methods=['GET'])
+def get_top_sellers():
+    limit = max(1, min(request.args.get('limit', 10, type=int), MAX_TOP_SELLERS))
+
+    rows = db.session.query(ProductSalesTotal, Product.name, Product.category) \
+        .outerjoin(Product, Product.product_id == ProductSalesTotal.product_id) \
+        .filter(ProductSalesTotal.units > 0) \
+        .order_by(ProductSalesTotal.units.desc()) \
+        .limit(limit).all()
+
+    return jsonify([{
+        'product_id': total.product_id,
+        'name': name,
+        'category': category,
+        'units': total.units,
+        'revenue': float(total.revenue)
+    } for total, name, category in rows])
@@ -1,13 +1,24 @@
+import logging
 from flask import Blueprint, request, jsonify
+from sqlalchemy import func
 from database import db
 from models.cart import Cart
 from models.user import User
 from models.product import Product
+from models.order import Order
+from models.order_product import OrderProduct
+from utils.pagination import paginated_response, encode_projected
+from utils.product_cache import product_cache
+from utils.stock import aggregate_quantities, reserve_stock
+from utils.order_events import order_placed
+from utils.idempotency import idempotent
 
 cart_bp = Blueprint('cart_bp', __name__)
+logger = logging.getLogger(__name__)
 
 # Add item to cart
 @cart_bp.route('/cart', methods=['POST'])
+@idempotent
 def add_to_cart():
     data = request.get_json()
 
@@ -15,38 +26,65 @@ def add_to_cart():
         return jsonify({'error': 'Missing required fields'}), 400
 
     user = User.query.get(data['user_id'])
-    product = Product.query.get(data['product_id'])
+    product = product_cache.get_product(data['product_id'])
 
     if not user or not product:
         return jsonify({'error': 'User or Product not found'}), 404
 
-    if product.stock < data['quantity']:
+    if product['stock'] < data['quantity']:
         return jsonify({'error': 'Insufficient stock available'}), 400
 
-    new_cart_item = Cart(
-        user_id=data['user_id'],
-        product_id=data['product_id'],
-        quantity=data['quantity']
-    )
-
-    db.session.add(new_cart_item)
+    # Adding a product already in the cart increases its quantity
+    Cart.upsert(data['user_id'], data['product_id'], data['quantity'])
     db.session.commit()
 
-    return jsonify({'message': 'Item added to cart', 'cart': new_cart_item.to_dict()}), 201
+    cart_item = Cart.query.filter_by(user_id=data['user_id'], product_id=data['product_id']).first()
+    return jsonify({'message': 'Item added to cart', 'cart': cart_item.to_dict()}), 201
 
 
 # Get all cart items
 @cart_bp.route('/cart', methods=['GET'])
 def get_cart_items():
-    cart_items = Cart.query.all()
-    return jsonify([item.to_dict() for item in cart_items])
+    return paginated_response(Cart.query.with_entities(*Cart.projection()), Cart.cart_id, encode_projected)
 
 
 # Get cart items for a specific user
 @cart_bp.route('/cart/user/<int:user_id>', methods=['GET'])
 def get_user_cart(user_id):
-    cart_items = Cart.query.filter_by(user_id=user_id).all()
-    return jsonify([item.to_dict() for item in cart_items])
+    query = Cart.query.with_entities(*Cart.projection()).filter(Cart.user_id == user_id)
+    return paginated_response(query, Cart.cart_id, encode_projected)
+
+
+# Cart totals for a user, computed in one aggregate query
+@cart_bp.route('/cart/user/<int:user_id>/summary', methods=['GET'])
+def get_user_cart_summary(user_id):
+    line_total = func.sum(Cart.quantity) * Product.price
+    rows = db.session.query(
+        Product.product_id,
+        Product.name,
+        Product.price,
+        func.sum(Cart.quantity).label('quantity'),
+        line_total.label('line_total')
+    ).join(Product, Product.product_id == Cart.product_id) \
+     .filter(Cart.user_id == user_id) \
+     .group_by(Product.product_id, Product.name, Product.price) \
+     .order_by(Product.product_id) \
+     .all()
+
+    lines = [{
+        'product_id': row.product_id,
+        'name': row.name,
+        'price': float(row.price),
+        'quantity': int(row.quantity),
+        'line_total': float(row.line_total)
+    } for row in rows]
+
+    return jsonify({
+        'user_id': user_id,
+        'items': lines,
+        'item_count': sum(line['quantity'] for line in lines),
+        'grand_total': float(sum(row.line_total for row in rows))
+    })
 
 
 # Update cart item quantity
@@ -76,3 +114,58 @@ def remove_from_cart(cart_id):
     db.session.delete(cart_item)
     db.session.commit()
     return jsonify({'message': 'Item removed from cart'})
+
+
+# Convert a user's cart into an order in one transaction
+@cart_bp.route('/cart/user/<int:user_id>/checkout', methods=['POST'])
+@idempotent
+def checkout_cart(user_id):
+    data = request.get_json(silent=True) or {}
+
+    try:
+        cart_items = Cart.query.filter_by(user_id=user_id).all()
+        if not cart_items:
+            return jsonify({'error': 'Cart is empty'}), 400
+
+        items = [{'product_id': item.product_id, 'quantity': item.quantity} for item in cart_items]
+        cart_ids = [item.cart_id for item in cart_items]
+
+        shortfalls = reserve_stock(items)
+        if shortfalls:
+            return jsonify({'error': 'Insufficient stock for some items', 'shortages': shortfalls}), 409
+
+        # Price server-side from the catalog, never from the client
+        quantities = aggregate_quantities(items)
+        prices = dict(
+            db.session.query(Product.product_id, Product.price)
+            .filter(Product.product_id.in_(list(quantities)))
+        )
+        total_amount = sum(prices[pid] * quantity for pid, quantity in quantities.items())
+
+        new_order = Order(
+            user_id=user_id,
+            total_amount=total_amount,
+            status='Pending',
+            payment_status=data.get('payment_status', 'Pending'),
+            payment_method=data.get('payment_method')
+        )
+        db.session.add(new_order)
+        db.session.flush()
+
+        db.session.add_all([
+            OrderProduct(order_id=new_order.order_id, product_id=pid, quantity=quantity, unit_price=prices[pid])
+            for pid, quantity in quantities.items()
+        ])
+        order_placed(new_order, quantities, prices)
+        Cart.query.filter(Cart.cart_id.in_(cart_ids)).delete(synchronize_session=False)
+
+        db.session.commit()
+        product_cache.stock_changed(*quantities)
+
+        order = Order.with_items().get(new_order.order_id)
+        return jsonify(order.to_dict()), 201
+
+    except Exception:
+        db.session.rollback()
+        logger.exception('Checkout failed for user %s', user_id)
+        return jsonify({'error': 'Checkout failed'}), 500
@@ -1,6 +1,9 @@
 from flask import Blueprint, request, jsonify
 from database import db
 from models.order_product import OrderProduct
+from models.order import Order
+from utils.analytics import unit_prices
+from utils.order_events import order_lines_changed
 
 order_product_bp = Blueprint('order_product_bp', __name__)
 
@@ -15,10 +18,14 @@ def add_product_to_order():
     new_entry = OrderProduct(
         order_id=data['order_id'],
         product_id=data['product_id'],
-        quantity=data['quantity']
+        quantity=data['quantity'],
+        unit_price=unit_prices([data['product_id']]).get(data['product_id'])
     )
 
     db.session.add(new_entry)
+    order = db.session.get(Order, data['order_id'])
+    if order:
+        order_lines_changed(order, [(new_entry.product_id, new_entry.quantity, new_entry.unit_price)], 1)
     db.session.commit()
     return jsonify({'message': 'Product added to order successfully', 'order_product': new_entry.to_dict()}), 201
 
@@ -40,6 +47,9 @@ def delete_order_product():
     if not entry:
         return jsonify({'error': 'Entry not found'}), 404
 
+    order = db.session.get(Order, order_id)
+    if order:
+        order_lines_changed(order, [(entry.product_id, entry.quantity, entry.unit_price)], -1)
     db.session.delete(entry)
     db.session.commit()
     return jsonify({'message': 'Order product deleted successfully'})
@@ -1,17 +1,27 @@
-from flask import Blueprint, request, jsonify
+import logging
+from flask import Blueprint, request, jsonify, current_app
 from database import db
 from models.order import Order
 from models.order_product import OrderProduct
 from models.product import Product  # ✅ KEEP THIS
+from utils.pagination import paginated_response
+from utils.product_cache import product_cache
+from utils.stock import aggregate_quantities, reserve_stock
+from utils.analytics import counts_toward_sales, unit_prices
+from utils.order_events import order_placed, order_status_changed, order_deleted
+from utils.idempotency import idempotent
 
 order_bp = Blueprint('order_bp', __name__)
+logger = logging.getLogger(__name__)
 
 # Create a new order
 @order_bp.route('/orders', methods=['POST'])
+@idempotent
 def create_order():
+    reservation = None
     try:
         data = request.get_json()
-        print("Received order data:", data)  # Debug log
+        logger.debug("Received order data: %s", data)
 
         user_id = data.get('user_id')
         total_amount = data.get('total_amount')
@@ -19,23 +29,41 @@ def create_order():
         payment_status = data.get('payment_status', 'Pending')
         payment_method = data.get('payment_method')
 
-        print(f"User ID: {user_id}, Total Amount: {total_amount}, Items: {items}, Payment Status: {payment_status}, Payment Method: {payment_method}")
+        logger.debug("User ID: %s, Total Amount: %s, Items: %s, Payment Status: %s, Payment Method: %s",
+                     user_id, total_amount, items, payment_status, payment_method)
 
         if not user_id or not total_amount or not items:
-            print("Missing required fields")
+            logger.info("Order rejected: missing required fields")
             return jsonify({'message': 'Missing required fields'}), 400
 
-        # ✅ CHECK & REDUCE STOCK
         for item in items:
-            product = Product.query.get(item['product_id'])
-            if not product:
-                return jsonify({'message': f'Product {item["product_id"]} not found'}), 404
-
-            if product.stock < item['quantity']:
-                return jsonify({'message': f'Insufficient stock for product {product.name}. Available: {product.stock}, Requested: {item["quantity"]}'}), 400
-
-            product.stock -= item['quantity']
-            print(f"Reduced stock for product {product.name} by {item['quantity']}. New stock: {product.stock}")
+            if 'product_id' not in item or not isinstance(item.get('quantity'), int) or item['quantity'] <= 0:
+                logger.info("Order rejected: invalid item %s", item)
+                return jsonify({'message': 'product_id and a positive quantity are required for each item'}), 400
+
+        # ✅ CHECK & REDUCE STOCK: flash-sale products from the in-memory ledger,
+        # everything else in one conditional UPDATE
+        quantities = aggregate_quantities(items)
+        ledger = current_app.extensions.get('flash_sale')
+        flash_quantities = ledger.flagged(quantities) if ledger else {}
+        shortfalls = []
+        if flash_quantities:
+            reservation, shortfalls = ledger.reserve(flash_quantities)
+        if not shortfalls:
+            shortfalls = reserve_stock([{'product_id': product_id, 'quantity': quantity}
+                                        for product_id, quantity in quantities.items()
+                                        if product_id not in flash_quantities])
+        if shortfalls:
+            if reservation:
+                reservation.cancel()
+            missing = [s for s in shortfalls if s['name'] is None]
+            if missing:
+                return jsonify({'message': f'Product {missing[0]["product_id"]} not found',
+                                'shortages': shortfalls}), 404
+            first = shortfalls[0]
+            return jsonify({'message': f'Insufficient stock for product {first["name"]}. Available: {first["available"]}, Requested: {first["requested"]}',
+                            'shortages': shortfalls}), 400
+        logger.debug("Reserved stock for items: %s", items)
 
         new_order = Order(
             user_id=user_id,
@@ -47,50 +75,46 @@ def create_order():
         db.session.add(new_order)
         db.session.flush()
 
-        print(f"Created order with ID: {new_order.order_id}")
+        logger.debug("Created order with ID: %s", new_order.order_id)
 
-        for item in items:
-            print(f"Creating order_product entry: {item}")
-            try:
-                if 'product_id' not in item:
-                    print(f"Error: product_id missing in item: {item}")
-                    db.session.rollback()
-                    return jsonify({'message': 'product_id is required for each item'}), 400
-
-                order_product = OrderProduct(
-                    order_id=new_order.order_id,
-                    product_id=item['product_id'],
-                    quantity=item['quantity']
-                )
-                db.session.add(order_product)
-            except Exception as e:
-                print(f"Error creating order_product entry: {str(e)}")
-                db.session.rollback()
-                return jsonify({'message': f'Error creating order_product entry: {str(e)}'}), 500
+        # Flash-sale lines are written to order_product by the ledger's flusher
+        prices = unit_prices(quantities)
+        db.session.add_all([
+            OrderProduct(order_id=new_order.order_id, product_id=product_id, quantity=quantity,
+                         unit_price=prices.get(product_id))
+            for product_id, quantity in quantities.items() if product_id not in flash_quantities
+        ])
+        if reservation:
+            reservation.record(new_order.order_id)
+        order_placed(new_order, quantities, prices)
 
         db.session.commit()
-        print("Order and order_product entries committed successfully")
+        if reservation:
+            reservation.confirm()
+        product_cache.stock_changed(*[product_id for product_id in quantities if product_id not in flash_quantities])
+        logger.info("Order %s committed with %d products", new_order.order_id, len(quantities))
 
-        order_with_items = Order.query.get(new_order.order_id)
-        return jsonify(order_with_items.to_dict()), 201
+        order = Order.with_items().get(new_order.order_id).to_dict()
+        if reservation:
+            order['items'] += reservation.items()
+        return jsonify(order), 201
 
     except Exception as e:
         db.session.rollback()
-        print(f"Error creating order: {str(e)}")
-        import traceback
-        traceback.print_exc()
+        if reservation:
+            reservation.cancel()
+        logger.exception("Error creating order")
         return jsonify({'message': f'Error creating order: {str(e)}'}), 500
 
 # Get All Orders
 @order_bp.route('/orders', methods=['GET'])
 def get_orders():
-    orders = Order.query.all()
-    return jsonify([order.to_dict() for order in orders])
+    return paginated_response(Order.query.with_entities(*Order.projection()), Order.order_id, Order.encode_rows)
 
 # Get Single Order by ID
 @order_bp.route('/orders/<int:order_id>', methods=['GET'])
 def get_order(order_id):
-    order = Order.query.get(order_id)
+    order = Order.with_items().get(order_id)
     if not order:
         return jsonify({'error': 'Order not found'}), 404
     return jsonify(order.to_dict())
@@ -98,8 +122,8 @@ def get_order(order_id):
 # Get all orders of a specific user
 @order_bp.route('/orders/user/<int:user_id>', methods=['GET'])
 def get_orders_by_user(user_id):
-    orders = Order.query.filter_by(user_id=user_id).all()
-    return jsonify([order.to_dict() for order in orders])
+    query = Order.query.with_entities(*Order.projection()).filter(Order.user_id == user_id)
+    return paginated_response(query, Order.order_id, Order.encode_rows)
 
 # Update Order (Change Status)
 @order_bp.route('/orders/<int:order_id>', methods=['PUT'])
@@ -109,10 +133,23 @@ def update_order(order_id):
         return jsonify({'error': 'Order not found'}), 404
 
     data = request.get_json()
-    if data.get('status') and data['status'] in ['Pending', 'Shipped', 'Delivered', 'Cancelled']:
+    reserved = []
+    if data.get('status') and data['status'] in ['Pending', 'Shipped', 'Delivered', 'Cancelled'] \
+            and data['status'] != order.status:
+        old_status = order.status
+        lines = [(line.product_id, line.quantity, line.unit_price) for line in order.order_products]
+        if counts_toward_sales(data['status']) and not counts_toward_sales(old_status):
+            # Reinstating a cancelled order takes its stock again
+            shortfalls = reserve_stock([{'product_id': pid, 'quantity': qty} for pid, qty, _ in lines])
+            if shortfalls:
+                return jsonify({'error': 'Insufficient stock to reinstate order', 'shortages': shortfalls}), 409
+            reserved = [pid for pid, _, _ in lines]
         order.status = data['status']
+        order_status_changed(order, old_status, lines)
 
     db.session.commit()
+    if reserved:
+        product_cache.stock_changed(*reserved)
     return jsonify({'message': 'Order updated successfully', 'order': order.to_dict()})
 
 # Delete Order
@@ -122,6 +159,7 @@ def delete_order(order_id):
     if not order:
         return jsonify({'error': 'Order not found'}), 404
 
+    order_deleted(order, [(line.product_id, line.quantity, line.unit_price) for line in order.order_products])
     db.session.delete(order)
     db.session.commit()
     return jsonify({'message': 'Order deleted successfully'})
@@ -1,10 +1,20 @@
-from flask import Blueprint, request, jsonify
+from flask import Blueprint, request, jsonify, current_app
 from database import db
-from models.product import Product
-from sqlalchemy import or_
+from models.product import Product, ProductDeletion
+from config import SEARCH_DEFAULT_LIMIT
+from utils.pagination import paginated_response, encode_projected, unpaged_response, UNPAGED_LIMIT, MAX_PAGE_SIZE
+from utils.search_index import search_index
+from utils.product_cache import product_cache
+from utils.http_cache import catalog_cached
+from utils.product_filters import is_filter_request, filtered_products_response
+from utils.product_import import CONTENT_TYPES, ProductImport, StockUpdate
+from utils.flash_sale import held_products, STOCK_HELD_ERROR
 
 product_bp = Blueprint('product_bp', __name__)
 
+# Upper bound on IDs accepted by the batch lookup
+MAX_BATCH_IDS = 100
+
 # Create Product
 @product_bp.route('/products', methods=['POST'])
 def create_product():
@@ -24,63 +34,144 @@ def create_product():
         price=data['price'],
         category=data['category'],
         stock=data['stock'],
-        image_url=data['image_url']
+        image_url=data['image_url'],
+        flash_sale=bool(data.get('flash_sale', False))
     )
 
     db.session.add(new_product)
     db.session.commit()
+    search_index.add(new_product)
+    product_cache.put(new_product)
 
     return jsonify({'message': 'Product created successfully', 'product': new_product.to_dict()}), 201
 
-# Get All Products
+# Bulk import: a streamed NDJSON or CSV body of products, created or
+# upserted by product_id in batches, answered with a per-row error report
+@product_bp.route('/products/bulk', methods=['POST'])
+def import_products():
+    return bulk_response(ProductImport(current_app.extensions.get('flash_sale')))
+
+# Bulk stock update: a streamed NDJSON or CSV body of product_id, stock rows
+@product_bp.route('/products/bulk/stock', methods=['POST'])
+def update_stock_bulk():
+    return bulk_response(StockUpdate())
+
+def bulk_response(job):
+    fmt = CONTENT_TYPES.get(request.mimetype)
+    if fmt is None:
+        return jsonify({'error': f'Content-Type must be one of: {", ".join(CONTENT_TYPES)}'}), 415
+
+    report = job.run(request.stream, fmt)
+    return jsonify(report), 400 if 'error' in report else 200
+
+# Get All Products, a batch of products with ?ids=1,2,3, or a filtered,
+# sorted page with facet counts (?category=&min_price=&max_price=&in_stock=&sort=&limit=)
 @product_bp.route('/products', methods=['GET'])
+@catalog_cached
 def get_products():
-    products = Product.query.all()
-    return jsonify([product.to_dict() for product in products])
+    if 'ids' in request.args:
+        return get_products_by_ids(request.args['ids'])
+    if is_filter_request():
+        return filtered_products_response()
+    if not request.args:
+        return unpaged_response(product_cache.get_list('all', unpaged_products(Product.query)), 'product_id')
+    return paginated_response(Product.query.with_entities(*Product.projection()), Product.product_id, encode_projected)
+
+def unpaged_products(query):
+    """The first UNPAGED_LIMIT + 1 products of query, for unpaged_response."""
+    return query.order_by(Product.product_id).limit(UNPAGED_LIMIT + 1)
+
+def parse_product_ids(raw_ids):
+    """Parse ?ids=1,2,3 into a de-duplicated list, or raise ValueError with a 400 message."""
+    parts = [part.strip() for part in raw_ids.split(',') if part.strip()]
+    if not parts or not all(part.isdigit() for part in parts):
+        raise ValueError('ids must be a comma-separated list of product IDs')
+
+    # De-duplicate while keeping the order the client asked for
+    product_ids = list(dict.fromkeys(int(part) for part in parts))
+    if len(product_ids) > MAX_BATCH_IDS:
+        raise ValueError(f'At most {MAX_BATCH_IDS} product IDs per request')
+    return product_ids
+
+def parse_search_limit(args):
+    """Read ?limit for a search: SEARCH_DEFAULT_LIMIT if absent, at most MAX_PAGE_SIZE.
+
+    Raises ValueError with a 400 message for anything but a positive integer.
+    """
+    limit = args.get('limit')
+    if limit is None:
+        return SEARCH_DEFAULT_LIMIT
+    if not limit.isdigit() or int(limit) <= 0:
+        raise ValueError('limit must be a positive integer')
+    return min(int(limit), MAX_PAGE_SIZE)
+
+def get_products_by_ids(raw_ids):
+    try:
+        product_ids = parse_product_ids(raw_ids)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
+    found = product_cache.get_many(product_ids)
+    return jsonify({
+        'products': [found[pid] for pid in product_ids if pid in found],
+        'missing': [pid for pid in product_ids if pid not in found]
+    })
 
 # Get Products by Categories
 @product_bp.route('/products/categories', methods=['GET'])
+@catalog_cached
 def get_products_by_categories():
     categories = request.args.get('categories', '').split(',')
     if not categories or categories[0] == '':
         return jsonify({'error': 'No categories provided'}), 400
     
-    products = Product.query.filter(Product.category.in_(categories)).all()
-    return jsonify([product.to_dict() for product in products])
+    query = Product.query.filter(Product.category.in_(categories))
+    if set(request.args) == {'categories'}:
+        key = ('categories',) + tuple(sorted(set(categories)))
+        return unpaged_response(product_cache.get_list(key, unpaged_products(query)), 'product_id')
+    return paginated_response(query.with_entities(*Product.projection()), Product.product_id, encode_projected)
 
 # Search Products
 @product_bp.route('/products/search', methods=['GET'])
+@catalog_cached
 def search_products():
     query = request.args.get('q', '').strip()
     if not query:
         return jsonify({'error': 'No search query provided'}), 400
     
-    # Search in both name and description
-    products = Product.query.filter(
-        or_(
-            Product.name.ilike(f'%{query}%'),
-            Product.description.ilike(f'%{query}%')
-        )
-    ).all()
-    
-    return jsonify([product.to_dict() for product in products])
+    try:
+        limit = parse_search_limit(request.args)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
+    # Rank matches on name and description from the in-memory index
+    product_ids = search_index.search(query, limit=limit)
+    if not product_ids:
+        return jsonify([])
+
+    products = {p.product_id: p for p in Product.query.filter(Product.product_id.in_(product_ids))}
+    return jsonify([products[pid].to_dict() for pid in product_ids if pid in products])
 
 # Get Single Product by ID
 @product_bp.route('/products/<int:product_id>', methods=['GET'])
+@catalog_cached
 def get_product(product_id):
-    product = Product.query.get(product_id)
+    product = product_cache.get_product(product_id)
     if not product:
         return jsonify({'error': 'Product not found'}), 404
-    return jsonify(product.to_dict())
+    return jsonify(product)
 
 # Update Product
 @product_bp.route('/products/<int:product_id>', methods=['PUT'])
 def update_product(product_id):
-    product = Product.query.get(product_id)
+    data = request.get_json()
+    # A stock write locks the row so no flash-sale allocation can start before it commits
+    product = db.session.get(Product, product_id, with_for_update='stock' in data)
     if not product:
         return jsonify({'error': 'Product not found'}), 404
-
-    data = request.get_json()
+    if 'stock' in data and held_products([product_id]):
+        db.session.rollback()
+        return jsonify({'error': STOCK_HELD_ERROR}), 409
 
     if 'name' in data:
         product.name = data['name']
@@ -94,8 +185,16 @@ def update_product(product_id):
         product.stock = data['stock']
     if 'image_url' in data:
         product.image_url = data['image_url']
+    if 'flash_sale' in data:
+        product.flash_sale = bool(data['flash_sale'])
 
     db.session.commit()
+    ledger = current_app.extensions.get('flash_sale')
+    if ledger and 'flash_sale' in data:
+        ledger.refresh()
+    if 'name' in data or 'description' in data:
+        search_index.add(product)
+    product_cache.put(product)
     return jsonify({'message': 'Product updated successfully', 'product': product.to_dict()})
 
 # Delete Product
@@ -106,5 +205,13 @@ def delete_product(product_id):
         return jsonify({'error': 'Product not found'}), 404
 
     db.session.delete(product)
+    db.session.add(ProductDeletion(product_id=product_id))
     db.session.commit()
+    search_index.remove(product_id)
+    product_cache.invalidate(product_id)
     return jsonify({'message': 'Product deleted successfully'})
+
+# Product cache statistics
+@product_bp.route('/products/cache/stats', methods=['GET'])
+def get_product_cache_stats():
+    return jsonify(product_cache.stats())
@@ -1,10 +1,14 @@
+import logging
 from flask import Blueprint, request, jsonify
 from database import db
 from models.user import User
-from werkzeug.security import generate_password_hash, check_password_hash
 from flask_cors import CORS, cross_origin
+from utils.pagination import paginated_response, encode_projected
+from utils.auth import (issue_token, hash_password, verify_password, find_user_by_email,
+                        forget_user, PasswordPoolBusy)
 
 user_bp = Blueprint('user_bp', __name__)
+logger = logging.getLogger(__name__)
 
 @user_bp.route('/users', methods=['POST'])
 def create_user():
@@ -16,12 +20,12 @@ def create_user():
             return jsonify({'error': 'Missing required fields'}), 400
 
         # Check if user with same email exists
-        existing_user = User.query.filter_by(email=data['email']).first()
+        existing_user = find_user_by_email(data['email'])
         if existing_user:
             return jsonify({'error': 'Email already exists'}), 409  # Conflict error
 
-        # Hash the password before storing
-        hashed_password = generate_password_hash(data['password'])
+        # Hash the password before storing (on the bounded hashing pool)
+        hashed_password = hash_password(data['password'])
 
         # Create new user
         new_user = User(
@@ -37,9 +41,12 @@ def create_user():
 
         return jsonify({'message': 'User created successfully', 'user': new_user.to_dict()}), 201
 
+    except PasswordPoolBusy:
+        return jsonify({'error': 'Server busy, please retry'}), 503, {'Retry-After': '1'}
+
     except Exception as e:
         db.session.rollback()  # Prevent transaction failure
-        print("Error:", str(e))  # Log the error in terminal
+        logger.exception("Error creating user")
         return jsonify({'error': 'Internal Server Error', 'message': str(e)}), 500
 
 # Add login route
@@ -52,32 +59,33 @@ def login():
         if not data or not data.get('email') or not data.get('password'):
             return jsonify({'error': 'Missing email or password'}), 400
             
-        # Find user by email
-        user = User.query.filter_by(email=data['email']).first()
+        # Find user by email (cached per email)
+        user = find_user_by_email(data['email'])
         
         # Check if user exists and password is correct
-        if not user or not check_password_hash(user.password, data['password']):
+        if not user or not verify_password(user['password'], data['password']):
             return jsonify({'error': 'Invalid email or password'}), 401
             
-        # In a real app, you would generate a JWT token here
-        # For now, just return a dummy token
-        token = "dummy_token_" + str(user.user_id)
+        # Signed, expiring token; verified per request without a DB lookup
+        token = issue_token(user['user_id'])
         
         return jsonify({
             'message': 'Login successful',
             'token': token,
-            'user': user.to_dict()
+            'user': user['user']
         }), 200
         
+    except PasswordPoolBusy:
+        return jsonify({'error': 'Server busy, please retry'}), 503, {'Retry-After': '1'}
+
     except Exception as e:
-        print("Error:", str(e))
+        logger.exception("Error logging in")
         return jsonify({'error': 'Internal Server Error', 'message': str(e)}), 500
 
 # Get All Users
 @user_bp.route('/users', methods=['GET'])
 def get_users():
-    users = User.query.all()
-    return jsonify([user.to_dict() for user in users])
+    return paginated_response(User.query.with_entities(*User.projection()), User.user_id, encode_projected)
 
 # Get Single User by ID
 @user_bp.route('/users/<int:user_id>', methods=['GET'])
@@ -95,6 +103,7 @@ def update_user(user_id):
         return jsonify({'error': 'User not found'}), 404
 
     data = request.get_json()
+    old_email = user.email
     if data.get('fname'):
         user.fname = data['fname']
     if data.get('lname'):
@@ -103,6 +112,7 @@ def update_user(user_id):
         user.email = data['email']
 
     db.session.commit()
+    forget_user(old_email, user.email)
     return jsonify({'message': 'User updated', 'user': user.to_dict()})
 
 # Delete User
@@ -112,6 +122,8 @@ def delete_user(user_id):
     if not user:
         return jsonify({'error': 'User not found'}), 404
 
+    email = user.email
     db.session.delete(user)
     db.session.commit()
+    forget_user(email)
     return jsonify({'message': 'User deleted successfully'})
@@ -0,0 +1,61 @@
+import pytest
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from app import create_app
+from database import db
+from benchmarks.seed import seed
+from utils.product_cache import product_cache
+from utils.search_index import search_index
+
+
+@pytest.fixture
+def app(tmp_path):
+    """The API on a fresh SQLite file with a small seeded dataset."""
+    app = create_app({
+        'TESTING': True,
+        'DEBUG': False,
+        'SQLALCHEMY_DATABASE_URI': f'sqlite:///{tmp_path / "test.db"}',
+        'OUTBOX_WORKERS': 0,
+        'ADMISSION_CONTROL': False,
+    })
+    with app.app_context():
+        db.create_all()
+        seed(users=10, products=20, carts=0, orders=30, items_per_order=3, seed=1)
+    search_index.__init__()  # the index is per process; drop one built over an earlier test's database
+    product_cache.__init__()  # likewise the cache and the catalog version it has caught up with
+    yield app
+    with app.app_context():
+        db.session.remove()
+        for engine in db.engines.values():
+            engine.dispose()
+
+
+@pytest.fixture
+def client(app):
+    return app.test_client()
+
+
+class StatementCounter:
+    """Counts SQL statements sent to any engine while active."""
+
+    def __init__(self):
+        self.statements = []
+
+    def _record(self, conn, cursor, statement, parameters, context, executemany):
+        self.statements.append(statement)
+
+    def __enter__(self):
+        event.listen(Engine, 'before_cursor_execute', self._record)
+        return self
+
+    def __exit__(self, *exc):
+        event.remove(Engine, 'before_cursor_execute', self._record)
+
+    @property
+    def count(self):
+        return len(self.statements)
+
+
+@pytest.fixture
+def count_statements():
+    return StatementCounter
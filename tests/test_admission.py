@@ -0,0 +1,139 @@
+import asyncio
+import pytest
+from app import create_app
+from database import db
+from benchmarks.seed import seed
+from utils import admission as admission_module
+from utils.admission import AdmissionController, ConcurrencyLimit, MemoryRateLimitStore, client_address
+from utils.search_index import search_index
+
+
+@pytest.fixture
+def limited_app(tmp_path):
+    """The API with admission control on, behind one trusted proxy."""
+    app = create_app({
+        'TESTING': True,
+        'DEBUG': False,
+        'SQLALCHEMY_DATABASE_URI': f'sqlite:///{tmp_path / "admission.db"}',
+        'OUTBOX_WORKERS': 0,
+        'ADMISSION_CONTROL': True,
+        'TRUSTED_PROXIES': 1,
+    })
+    with app.app_context():
+        db.create_all()
+        seed(users=2, products=5, carts=0, orders=0, seed=1)
+    search_index.__init__()
+    app.extensions['admission'].rate_limits = {'default': (1, 3), 'search': (0.5, 1)}
+    yield app
+    with app.app_context():
+        db.session.remove()
+        for engine in db.engines.values():
+            engine.dispose()
+
+
+def _from(address):
+    return {'X-Forwarded-For': address}
+
+
+def test_token_bucket_refills_at_its_rate(monkeypatch):
+    now = [100.0]
+    monkeypatch.setattr(admission_module.time, 'monotonic', lambda: now[0])
+    store = MemoryRateLimitStore()
+
+    assert [store.take('client', 2, 2)[0] for _ in range(3)] == [True, True, False]
+    assert store.take('client', 2, 2) == (False, 0.5)
+    now[0] += 0.5
+    assert store.take('client', 2, 2) == (True, 0.0)
+    now[0] += 60
+    assert [store.take('client', 2, 2)[0] for _ in range(3)] == [True, True, False]  # capped at the burst
+
+
+def test_rate_limits_are_per_class_and_answer_429_with_retry_after(limited_app):
+    client = limited_app.test_client()
+    assert client.get('/api/products/search?q=a', headers=_from('10.0.0.1')).status_code == 200
+
+    response = client.get('/api/products/search?q=b', headers=_from('10.0.0.1'))
+    assert response.status_code == 429
+    assert response.headers['Retry-After'] == '2'
+    # Another class has its own bucket
+    assert client.get('/api/products/1', headers=_from('10.0.0.1')).status_code == 200
+    stats = limited_app.extensions['admission'].stats()
+    assert stats['rejections'] == [{'route_class': 'search', 'reason': 'rate_limited', 'count': 1}]
+
+
+def test_anonymous_clients_behind_the_proxy_get_their_own_buckets(limited_app):
+    client = limited_app.test_client()
+    assert client.get('/api/products/search?q=a', headers=_from('10.0.0.1')).status_code == 200
+    assert client.get('/api/products/search?q=a', headers=_from('10.0.0.2')).status_code == 200
+    # A client cannot pick its bucket by prepending hops; only the proxy's entry is trusted
+    assert client.get('/api/products/search?q=a', headers=_from('10.0.0.9, 10.0.0.1')).status_code == 429
+
+
+def test_client_address_trusts_only_the_configured_hops():
+    assert client_address('192.0.2.1', '10.0.0.9, 10.0.0.1', 0) == '192.0.2.1'
+    assert client_address('192.0.2.1', '10.0.0.9, 10.0.0.1', 1) == '10.0.0.1'
+    assert client_address('192.0.2.1', '10.0.0.9, 10.0.0.1', 2) == '10.0.0.9'
+    assert client_address('192.0.2.1', '10.0.0.1', 2) == '192.0.2.1'
+    assert client_address('192.0.2.1', None, 1) == '192.0.2.1'
+
+
+def test_concurrency_limits_are_shares_of_the_pool():
+    controller = AdmissionController(20, MemoryRateLimitStore(), shares={'default': 0.5, 'search': 0.25},
+                                     max_queue=1)
+    assert {name: limit.limit for name, limit in controller.limits.items()} == {'default': 10, 'search': 5}
+
+    search = controller.limits['search']
+    assert all(search.acquire(timeout=0) for _ in range(5))
+    assert not search.acquire(timeout=0.01)  # queued, then timed out
+    assert controller.limits['default'].acquire(timeout=0)
+    search.release()
+    assert search.acquire(timeout=0)
+
+
+def test_full_class_sheds_with_503(limited_app):
+    controller = limited_app.extensions['admission']
+    controller.limits['search'] = ConcurrencyLimit(1, 0)
+    assert controller.limits['search'].acquire(timeout=0)  # held by a slow search
+
+    response = limited_app.test_client().get('/api/products/search?q=a', headers=_from('10.0.0.1'))
+    assert response.status_code == 503
+    assert response.headers['Retry-After'] == '1'
+    assert limited_app.test_client().get('/api/products/1', headers=_from('10.0.0.1')).status_code == 200
+
+
+def test_async_read_path_applies_the_same_limits(limited_app):
+    pytest.importorskip('asgiref')
+    pytest.importorskip('aiosqlite')
+    from utils.async_reads import AsyncReadApp
+    asgi = AsyncReadApp(limited_app)
+
+    async def get(path, query, address):
+        scope = {'type': 'http', 'method': 'GET', 'path': path, 'raw_path': path.encode(),
+                 'query_string': query.encode(), 'headers': [(b'x-forwarded-for', address.encode())],
+                 'http_version': '1.1', 'scheme': 'http', 'root_path': '',
+                 'server': ('testserver', 80), 'client': ('127.0.0.1', 1)}
+        messages = []
+
+        async def receive():
+            return {'type': 'http.request', 'body': b'', 'more_body': False}
+
+        async def send(message):
+            messages.append(message)
+
+        await asgi(scope, receive, send)
+        return messages[0]['status'], dict(messages[0]['headers'])
+
+    async def run():
+        first = await get('/api/products/search', 'q=a', '10.0.0.1')
+        second = await get('/api/products/search', 'q=a', '10.0.0.1')
+        other = await get('/api/products/search', 'q=a', '10.0.0.2')
+        await asgi.engine.dispose()
+        return first, second, other
+
+    first, second, other = asyncio.run(run())
+    assert first[0] == 200
+    assert second[0] == 429 and second[1][b'Retry-After'] == b'2'
+    assert other[0] == 200
+    # The bucket is the one Flask uses
+    assert limited_app.test_client().get('/api/products/search?q=a', headers=_from('10.0.0.2')).status_code == 429
+    assert set(limited_app.extensions['admission'].stats()['async_limits']) == {'default', 'search', 'checkout'}
@@ -0,0 +1,45 @@
+from database import db
+from models.sales_rollup import ProductSalesTotal
+from utils.outbox import drain
+
+
+def _drain(app):
+    with app.app_context():
+        while drain():
+            pass
+
+
+def _total(app, product_id):
+    with app.app_context():
+        row = db.session.get(ProductSalesTotal, product_id)
+        return (row.units, float(row.revenue)) if row else (0, 0.0)
+
+
+def test_cancel_after_price_change_subtracts_the_ordered_revenue(app, client):
+    _drain(app)
+    before = _total(app, 5)
+    price = client.get('/api/products/5').get_json()['price']
+
+    order = client.post('/api/orders', json={
+        'user_id': 1, 'total_amount': 2 * price, 'payment_status': 'Success',
+        'items': [{'product_id': 5, 'quantity': 2}]}).get_json()
+    _drain(app)
+    assert _total(app, 5) == (before[0] + 2, round(before[1] + 2 * price, 2))
+
+    assert client.put('/api/products/5', json={'price': price + 100}).status_code == 200
+    assert client.put(f"/api/orders/{order['order_id']}", json={'status': 'Cancelled'}).status_code == 200
+    _drain(app)
+    assert _total(app, 5) == before
+
+
+def test_top_sellers_limit_is_clamped(app, client):
+    for product_id in (1, 2, 3, 4):
+        price = client.get(f'/api/products/{product_id}').get_json()['price']
+        assert client.post('/api/orders', json={
+            'user_id': 1, 'total_amount': price, 'payment_status': 'Success',
+            'items': [{'product_id': product_id, 'quantity': 1}]}).status_code == 201
+    _drain(app)
+    assert len(client.get('/api/analytics/top-sellers?limit=0').get_json()) == 1
+    assert len(client.get('/api/analytics/top-sellers?limit=-5').get_json()) == 1
+    assert len(client.get('/api/analytics/top-sellers?limit=1000').get_json()) == 4
+    assert len(client.get('/api/analytics/top-sellers?limit=3').get_json()) == 3
@@ -0,0 +1,53 @@
+from sqlalchemy import inspect
+from app import create_app
+from database import db
+from models.order import Order
+from models.product import Product
+from models.sales_rollup import ProductSalesTotal
+
+
+def _app(path, **overrides):
+    return create_app({'TESTING': True, 'SQLALCHEMY_DATABASE_URI': f'sqlite:///{path}', 'OUTBOX_WORKERS': 0,
+                       'ADMISSION_CONTROL': False, **overrides})
+
+
+def _dispose(app):
+    with app.app_context():
+        db.session.remove()
+        for engine in db.engines.values():
+            engine.dispose()
+
+
+def test_apps_keep_their_own_config_and_database(app, tmp_path):
+    other = _app(tmp_path / 'other.db', PROFILE_TOKEN='other-only', ADMISSION_CONTROL=True)
+    assert other.config['PROFILE_TOKEN'] == 'other-only'
+    assert app.config['PROFILE_TOKEN'] is None
+    assert 'admission' in other.extensions and 'admission' not in app.extensions
+
+    result = other.test_cli_runner().invoke(args=['init-db'])
+    assert result.exit_code == 0
+    assert 'Database tables created.' in result.output
+    with other.app_context():
+        assert 'product' in inspect(db.engine).get_table_names()
+        assert db.session.query(Product).count() == 0
+    with app.app_context():
+        assert db.session.query(Product).count() == 20
+    _dispose(other)
+
+
+def test_create_app_accepts_a_profile_name():
+    testing = create_app('testing')
+    assert testing.testing and testing.config['SQLALCHEMY_DATABASE_URI'] == 'sqlite://'
+    assert testing.config['OUTBOX_WORKERS'] == 0
+    _dispose(testing)
+
+
+def test_rebuild_analytics_command(app):
+    with app.app_context():
+        orders = db.session.query(Order).filter(Order.status != 'Cancelled').count()
+
+    result = app.test_cli_runner().invoke(args=['rebuild-analytics', '--batch-size', '7'])
+    assert result.exit_code == 0, result.output
+    assert result.output == f'Rebuilt analytics from {orders} orders.\n'
+    with app.app_context():
+        assert db.session.query(ProductSalesTotal).count() > 0
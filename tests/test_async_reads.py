@@ -0,0 +1,39 @@
+import asyncio
+import threading
+import time
+import pytest
+
+pytest.importorskip('asgiref')
+pytest.importorskip('aiosqlite')
+from utils.async_reads import AsyncReadApp  # noqa: E402
+
+
+async def _get(asgi, path):
+    scope = {'type': 'http', 'method': 'GET', 'path': path, 'raw_path': path.encode(), 'query_string': b'',
+             'headers': [], 'http_version': '1.1', 'scheme': 'http', 'root_path': '',
+             'server': ('testserver', 80), 'client': ('127.0.0.1', 1)}
+    messages = []
+
+    async def receive():
+        return {'type': 'http.request', 'body': b'', 'more_body': False}
+
+    async def send(message):
+        messages.append(message)
+
+    await asgi(scope, receive, send)
+    return b''.join(message.get('body', b'') for message in messages[1:]).decode()
+
+
+def test_flask_requests_run_concurrently_on_the_thread_pool(app):
+    app.add_url_rule('/api/test-sleep', 'test_sleep',
+                     lambda: (time.sleep(0.3), threading.current_thread().name)[1])
+    asgi = AsyncReadApp(app)
+
+    async def run():
+        start = time.perf_counter()
+        names = await asyncio.gather(*[_get(asgi, '/api/test-sleep') for _ in range(4)])
+        return time.perf_counter() - start, names
+
+    elapsed, names = asyncio.run(run())
+    assert len(set(names)) == 4
+    assert elapsed < 1.0
@@ -0,0 +1,19 @@
+import pytest
+from app import create_app
+from config import ProductionConfig
+
+
+def test_create_app_requires_secret_key_outside_debug_and_testing(tmp_path):
+    config = {'SQLALCHEMY_DATABASE_URI': f'sqlite:///{tmp_path / "auth.db"}', 'OUTBOX_WORKERS': 0,
+              'DEBUG': False, 'TESTING': False, 'SECRET_KEY': None}
+    with pytest.raises(RuntimeError, match='SECRET_KEY'):
+        create_app(config)
+
+    assert create_app({**config, 'SECRET_KEY': 'configured'}).config['SECRET_KEY'] == 'configured'
+
+
+def test_entry_points_default_to_the_production_profile(monkeypatch):
+    monkeypatch.setattr(ProductionConfig, 'SQLALCHEMY_DATABASE_URI', 'sqlite://')
+    monkeypatch.setattr(ProductionConfig, 'SECRET_KEY', None)
+    with pytest.raises(RuntimeError, match='SECRET_KEY'):
+        create_app()
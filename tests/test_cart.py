@@ -0,0 +1,65 @@
+from decimal import Decimal
+from types import SimpleNamespace
+import pytest
+from sqlalchemy.dialects import mysql, postgresql
+from database import db
+from models.cart import Cart
+from models.product import Product
+
+USER_ID = 2
+
+
+def _add(client, product_id, quantity):
+    response = client.post('/api/cart', json={'user_id': USER_ID, 'product_id': product_id, 'quantity': quantity})
+    assert response.status_code == 201
+    return response.get_json()['cart']
+
+
+def _stock_up(app, *product_ids):
+    with app.app_context():
+        for product_id in product_ids:
+            db.session.get(Product, product_id).stock = 100
+        db.session.commit()
+
+
+def test_adding_a_product_twice_adds_to_its_line(app, client):
+    _stock_up(app, 1)
+    first = _add(client, 1, 2)
+    second = _add(client, 1, 3)
+
+    assert second['cart_id'] == first['cart_id']
+    assert second['quantity'] == 5
+    with app.app_context():
+        assert Cart.query.filter_by(user_id=USER_ID).count() == 1
+
+
+@pytest.mark.parametrize('dialect, expected', [
+    (mysql.dialect(), 'ON DUPLICATE KEY UPDATE quantity = (cart.quantity + VALUES(quantity))'),
+    (postgresql.dialect(), 'ON CONFLICT (user_id, product_id) DO UPDATE SET quantity = (cart.quantity + excluded.quantity)'),
+])
+def test_upsert_uses_the_dialects_own_statement(app, monkeypatch, dialect, expected):
+    executed = []
+    with app.app_context():
+        monkeypatch.setattr(db.session, 'get_bind', lambda: SimpleNamespace(dialect=SimpleNamespace(name=dialect.name)))
+        monkeypatch.setattr(db.session, 'execute', executed.append)
+        Cart.upsert(USER_ID, 1, 2)
+
+    assert expected in str(executed[0].compile(dialect=dialect))
+
+
+def test_summary_totals_the_cart_in_one_query(app, client, count_statements):
+    _stock_up(app, 3, 4)
+    _add(client, 3, 2)
+    _add(client, 4, 1)
+    with app.app_context():
+        prices = {pid: db.session.get(Product, pid).price for pid in (3, 4)}
+
+    with count_statements() as counter:
+        summary = client.get(f'/api/cart/user/{USER_ID}/summary').get_json()
+    assert counter.count == 1, counter.statements
+    assert [(line['product_id'], line['quantity']) for line in summary['items']] == [(3, 2), (4, 1)]
+    assert summary['item_count'] == 3
+    assert Decimal(str(summary['grand_total'])) == prices[3] * 2 + prices[4]
+
+    assert client.get('/api/cart/user/9/summary').get_json() == {
+        'user_id': 9, 'items': [], 'item_count': 0, 'grand_total': 0.0}
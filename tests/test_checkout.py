@@ -0,0 +1,70 @@
+from decimal import Decimal
+from database import db
+from models.cart import Cart
+from models.product import Product
+import routes.cart_routes as cart_routes
+
+USER_ID = 1
+
+
+def _stock(product_id):
+    return db.session.get(Product, product_id, populate_existing=True).stock
+
+
+def _fill_cart(app, client, stock):
+    with app.app_context():
+        for product_id, units in stock.items():
+            db.session.get(Product, product_id).stock = units
+        db.session.commit()
+    for product_id in stock:
+        assert client.post('/api/cart', json={'user_id': USER_ID, 'product_id': product_id,
+                                              'quantity': 2}).status_code == 201
+
+
+def _cart(app):
+    with app.app_context():
+        return sorted((item.product_id, item.quantity) for item in Cart.query.filter_by(user_id=USER_ID))
+
+
+def test_checkout_prices_server_side_and_clears_the_cart(app, client):
+    _fill_cart(app, client, {1: 10, 2: 10})
+    with app.app_context():
+        expected = sum(db.session.get(Product, pid).price * 2 for pid in (1, 2))
+
+    response = client.post(f'/api/cart/user/{USER_ID}/checkout', json={'total_amount': 0.01})
+    assert response.status_code == 201
+    order = response.get_json()
+    assert Decimal(str(order['total_amount'])) == expected
+    assert sorted((item['product_id'], item['quantity']) for item in order['items']) == [(1, 2), (2, 2)]
+    assert _cart(app) == []
+    with app.app_context():
+        assert (_stock(1), _stock(2)) == (8, 8)
+
+
+def test_shortfall_leaves_stock_and_cart_unchanged(app, client):
+    _fill_cart(app, client, {1: 10, 2: 10})
+    with app.app_context():
+        db.session.get(Product, 2).stock = 1
+        db.session.commit()
+
+    response = client.post(f'/api/cart/user/{USER_ID}/checkout')
+    assert response.status_code == 409
+    assert [shortage['product_id'] for shortage in response.get_json()['shortages']] == [2]
+    assert _cart(app) == [(1, 2), (2, 2)]
+    with app.app_context():
+        assert (_stock(1), _stock(2)) == (10, 1)
+
+
+def test_failure_returns_a_generic_message(app, client, monkeypatch):
+    _fill_cart(app, client, {1: 10})
+
+    def fail(*args):
+        raise RuntimeError('secret connection string')
+
+    monkeypatch.setattr(cart_routes, 'order_placed', fail)
+    response = client.post(f'/api/cart/user/{USER_ID}/checkout')
+    assert response.status_code == 500
+    assert response.get_json() == {'error': 'Checkout failed'}
+    assert _cart(app) == [(1, 2)]
+    with app.app_context():
+        assert _stock(1) == 10
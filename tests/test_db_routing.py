@@ -0,0 +1,104 @@
+import shutil
+from types import SimpleNamespace
+import pytest
+from flask import jsonify
+from sqlalchemy import select, update
+from app import create_app
+from database import db
+from models.product import Product
+from utils import db_routing
+from utils.db_routing import replica_lag
+from utils.search_index import search_index
+
+
+def _name():
+    return db.session.execute(select(Product.name).where(Product.product_id == 1)).scalar_one()
+
+
+@pytest.fixture
+def replicated_app(app, tmp_path):
+    """An app on a copy of the seeded database plus a replica whose product 1 is renamed."""
+    primary, replica = tmp_path / 'test.db', tmp_path / 'replica.db'
+    shutil.copy(primary, replica)
+    replicated = create_app({
+        'TESTING': True,
+        'DEBUG': False,
+        'SQLALCHEMY_DATABASE_URI': f'sqlite:///{primary}',
+        'DB_REPLICA_URIS': f'sqlite:///{replica}',
+        'OUTBOX_WORKERS': 0,
+        'ADMISSION_CONTROL': False,
+    })
+    with replicated.app_context():
+        db.session.execute(update(Product).where(Product.product_id == 1).values(name='On the primary'))
+        db.session.commit()
+        with db.engines['replica_0'].begin() as conn:
+            conn.execute(update(Product).where(Product.product_id == 1).values(name='On the replica'))
+
+    def read_name():
+        return jsonify(_name())
+
+    def write_then_read():
+        db.session.execute(update(Product).where(Product.product_id == 2).values(stock=Product.stock + 1))
+        name = _name()
+        db.session.commit()
+        return jsonify(name)
+
+    replicated.add_url_rule('/api/test-name', 'test_name', read_name, methods=['GET', 'POST'])
+    replicated.add_url_rule('/api/test-write-then-read', 'test_write_then_read', write_then_read)
+    search_index.__init__()
+    yield replicated
+    with replicated.app_context():
+        db.session.remove()
+        for engine in db.engines.values():
+            engine.dispose()
+    db.metadatas.pop('replica_0', None)  # registered on the shared db; later apps have no such bind
+
+
+def test_get_reads_from_the_replica(replicated_app):
+    client = replicated_app.test_client()
+    assert client.get('/api/test-name').get_json() == 'On the replica'
+    assert client.post('/api/test-name').get_json() == 'On the primary'
+
+
+def test_reads_after_a_write_in_the_request_go_to_the_primary(replicated_app):
+    assert replicated_app.test_client().get('/api/test-write-then-read').get_json() == 'On the primary'
+
+
+@pytest.mark.parametrize('lag', [30.0, None])
+def test_lagging_or_unreachable_replica_falls_back_to_the_primary(replicated_app, monkeypatch, lag):
+    replicated_app.extensions['db_router'].max_lag = 5
+    monkeypatch.setattr(db_routing, 'replica_lag', lambda engine: lag)
+    assert replicated_app.test_client().get('/api/test-name').get_json() == 'On the primary'
+
+    monkeypatch.setattr(db_routing, 'replica_lag', lambda engine: 1.0)
+    replicated_app.extensions['db_router'].check_interval = 0
+    assert replicated_app.test_client().get('/api/test-name').get_json() == 'On the replica'
+
+
+class FakeConnection:
+    def __init__(self, row):
+        self.row = row
+
+    def __enter__(self):
+        if isinstance(self.row, Exception):
+            raise self.row
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def execute(self, statement):
+        assert str(statement) == 'SHOW REPLICA STATUS'
+        return SimpleNamespace(mappings=lambda: SimpleNamespace(first=lambda: self.row))
+
+
+def _mysql_engine(row):
+    return SimpleNamespace(dialect=SimpleNamespace(name='mysql'), url='mysql://replica',
+                           connect=lambda: FakeConnection(row))
+
+
+def test_replica_lag_reads_show_replica_status():
+    assert replica_lag(_mysql_engine({'Seconds_Behind_Source': 3})) == 3.0
+    assert replica_lag(_mysql_engine({'Seconds_Behind_Source': None})) is None  # replication stopped
+    assert replica_lag(_mysql_engine(None)) is None  # not a replica
+    assert replica_lag(_mysql_engine(OSError('connection refused'))) is None
@@ -0,0 +1,108 @@
+import json
+import threading
+import pytest
+from sqlalchemy import func, select
+from database import db
+from models.flash_sale import FlashSaleAllocation
+from models.order import Order
+from models.order_product import OrderProduct
+from models.product import Product
+from utils.flash_sale import FlashSaleLedger, _host, held_products, recover
+
+THREADS = 8
+ATTEMPTS = 10
+STARTING_STOCK = 50
+SEEDED_ORDERS = 30
+
+
+def test_absolute_stock_writes_are_refused_while_a_sale_holds_units(app, client):
+    with app.app_context():
+        db.session.add(FlashSaleAllocation(owner='other-worker', product_id=2, quantity=50))
+        db.session.commit()
+        stock = db.session.get(Product, 2).stock
+
+    assert client.put('/api/products/2', json={'stock': 999}).status_code == 409
+    assert client.put('/api/products/2', json={'name': 'Renamed'}).status_code == 200
+
+    body = ''.join(json.dumps(row) + '\n' for row in ({'product_id': 2, 'stock': 999}, {'product_id': 3, 'stock': 7}))
+    report = client.post('/api/products/bulk/stock', data=body, content_type='application/x-ndjson').get_json()
+    assert (report['updated'], report['failed']) == (1, 1)
+    assert report['errors'][0]['product_id'] == 2
+
+    with app.app_context():
+        assert db.session.get(Product, 2).stock == stock
+        assert db.session.get(Product, 3).stock == 7
+
+
+@pytest.fixture
+def ledger(app, tmp_path):
+    """A started ledger selling product 1, with small blocks so checkouts keep allocating."""
+    with app.app_context():
+        product = db.session.get(Product, 1)
+        product.flash_sale = True
+        product.stock = STARTING_STOCK
+        db.session.commit()
+    ledger = FlashSaleLedger(app, allocation=7, shards=2, flush_interval=0.05, log_dir=str(tmp_path / 'log'))
+    app.extensions['flash_sale'] = ledger
+    ledger.ensure_started()
+    yield ledger
+    ledger.stop()
+
+
+def test_concurrent_checkouts_never_oversell(app, ledger):
+    start = threading.Barrier(THREADS)
+    statuses = []
+
+    def checkout():
+        client = app.test_client()
+        start.wait()
+        for _ in range(ATTEMPTS):
+            response = client.post('/api/orders', json={'user_id': 1, 'total_amount': 10,
+                                                        'items': [{'product_id': 1, 'quantity': 1}]})
+            statuses.append(response.status_code)
+
+    threads = [threading.Thread(target=checkout) for _ in range(THREADS)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    ledger.stop()
+
+    assert statuses.count(201) == STARTING_STOCK
+    assert statuses.count(400) == THREADS * ATTEMPTS - STARTING_STOCK
+    with app.app_context():
+        assert db.session.get(Product, 1).stock == 0
+        assert held_products([1]) == set()
+        sold = db.session.execute(select(func.sum(OrderProduct.quantity))
+                                  .where(OrderProduct.product_id == 1, OrderProduct.order_id > SEEDED_ORDERS))
+        assert sold.scalar() == STARTING_STOCK
+
+
+def test_recovery_replays_a_dead_process_log(app, tmp_path):
+    owner = f'{_host()}-1-dead'
+    with app.app_context():
+        db.session.get(Product, 1).stock = 90
+        db.session.add(FlashSaleAllocation(owner=owner, product_id=1, quantity=10))
+        committed = Order(user_id=1, total_amount=10, payment_status='Success')
+        db.session.add(committed)
+        db.session.commit()
+        committed_id = committed.order_id
+
+    log_dir = tmp_path / 'log'
+    log_dir.mkdir()
+    records = [
+        {'op': 'reserve', 'order_id': committed_id, 'lines': [[1, 3]]},  # committed, never flushed
+        {'op': 'reserve', 'order_id': committed_id + 100, 'lines': [[1, 2]]},  # rolled back
+        {'op': 'reserve', 'order_id': committed_id + 101, 'lines': [[1, 4]]},
+        {'op': 'cancel', 'order_id': committed_id + 101},
+    ]
+    (log_dir / f'{owner}.log').write_text(
+        ''.join(json.dumps(record) + '\n' for record in records) + '{"op": "reserve", "order_id"')
+
+    with app.app_context():
+        assert recover(str(log_dir)) == {owner: {1: 7}}
+        assert db.session.get(Product, 1).stock == 97
+        assert db.session.execute(select(OrderProduct.quantity).where(
+            OrderProduct.order_id == committed_id, OrderProduct.product_id == 1)).scalar_one() == 3
+        assert held_products([1]) == set()
+    assert not (log_dir / f'{owner}.log').exists()
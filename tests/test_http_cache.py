@@ -0,0 +1,71 @@
+import time
+from database import db
+from models.product import Product
+from utils.product_cache import product_cache
+
+
+def test_etag_follows_writes_made_by_other_workers(app, client):
+    etag = client.get('/api/products/3').headers['ETag']
+    assert client.get('/api/products/3', headers={'If-None-Match': etag}).status_code == 304
+
+    with app.app_context():
+        # Straight to the database, as another worker would, bypassing this process's cache hooks
+        db.session.query(Product).filter_by(product_id=3).update({Product.stock: Product.stock + 1})
+        db.session.commit()
+    assert client.get('/api/products/3', headers={'If-None-Match': etag}).status_code == 200
+
+    etag = client.get('/api/products/3').headers['ETag']
+    assert client.delete('/api/products/4').status_code == 200
+    assert client.get('/api/products/3', headers={'If-None-Match': etag}).status_code == 200
+
+
+def test_not_modified_returns_the_compressed_variant_etag(client):
+    response = client.get('/api/products', headers={'Accept-Encoding': 'gzip'})
+    assert response.headers['Content-Encoding'] == 'gzip'
+    etag = response.headers['ETag']
+    assert etag.endswith('-gzip"')
+
+    response = client.get('/api/products', headers={'Accept-Encoding': 'gzip', 'If-None-Match': etag})
+    assert response.status_code == 304
+    assert response.headers['ETag'] == etag
+
+
+def test_etag_depends_only_on_the_catalog(client, monkeypatch):
+    etag = client.get('/api/products/3').headers['ETag']
+    # An hour on, with no writes, clients still revalidate to 304
+    later = time.time() + 3600
+    monkeypatch.setattr(time, 'time', lambda: later)
+    assert client.get('/api/products/3', headers={'If-None-Match': etag}).status_code == 304
+
+
+def test_every_compressible_response_varies_on_accept_encoding(client):
+    plain = client.get('/api/products', headers={'Accept-Encoding': 'identity'})
+    assert 'Content-Encoding' not in plain.headers
+    assert plain.headers['Vary'] == 'Accept-Encoding'
+
+    not_modified = client.get('/api/products', headers={'If-None-Match': plain.headers['ETag']})
+    assert not_modified.status_code == 304
+    assert not_modified.headers['Vary'] == 'Accept-Encoding'
+
+
+def test_product_cache_catches_up_with_other_workers_writes(app, client):
+    product_cache.cache.clear()
+    client.get('/api/products')
+    client.get('/api/products/3')
+    cached = product_cache.cached_list('all')
+
+    with app.app_context():
+        # Another worker's writes: a stock change, then a rename
+        db.session.query(Product).filter_by(product_id=3).update({Product.stock: 77})
+        db.session.commit()
+    listing = client.get('/api/products').get_json()
+    assert next(p for p in listing if p['product_id'] == 3)['stock'] == 77
+    assert client.get('/api/products/3').get_json()['stock'] == 77
+    assert product_cache.cached_list('all') is cached  # updated in place, not rebuilt
+
+    with app.app_context():
+        db.session.query(Product).filter_by(product_id=3).update({Product.name: 'Renamed elsewhere'})
+        db.session.commit()
+    listing = client.get('/api/products').get_json()
+    assert next(p for p in listing if p['product_id'] == 3)['name'] == 'Renamed elsewhere'
+    assert client.get('/api/products/3').get_json()['name'] == 'Renamed elsewhere'
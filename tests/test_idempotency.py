@@ -0,0 +1,79 @@
+import threading
+from database import db
+from models.order import Order
+from models.product import Product
+import routes.order_routes as order_routes
+
+ORDER = {'user_id': 1, 'total_amount': 10, 'items': [{'product_id': 1, 'quantity': 1}]}
+
+
+def _order_count(app):
+    with app.app_context():
+        return db.session.query(Order).count()
+
+
+def _stock_up(app):
+    with app.app_context():
+        db.session.get(Product, 1).stock = 100
+        db.session.commit()
+
+
+def test_repeat_replays_the_stored_response(app, client):
+    _stock_up(app)
+    before = _order_count(app)
+
+    first = client.post('/api/orders', json=ORDER, headers={'Idempotency-Key': 'order-1'})
+    second = client.post('/api/orders', json=ORDER, headers={'Idempotency-Key': 'order-1'})
+
+    assert first.status_code == second.status_code == 201
+    assert second.get_data() == first.get_data()
+    assert second.headers['Idempotent-Replayed'] == 'true'
+    assert _order_count(app) == before + 1
+
+
+def test_key_reused_with_a_different_body_is_rejected(app, client):
+    _stock_up(app)
+    assert client.post('/api/orders', json=ORDER, headers={'Idempotency-Key': 'order-1'}).status_code == 201
+
+    response = client.post('/api/orders', json={**ORDER, 'total_amount': 20}, headers={'Idempotency-Key': 'order-1'})
+    assert response.status_code == 422
+
+
+def test_concurrent_requests_with_one_key_place_one_order(app):
+    _stock_up(app)
+    before = _order_count(app)
+    start = threading.Barrier(4)
+    responses = []
+
+    def post():
+        client = app.test_client()
+        start.wait()
+        response = client.post('/api/orders', json=ORDER, headers={'Idempotency-Key': 'order-1'})
+        responses.append((response.status_code, response.get_data()))
+
+    threads = [threading.Thread(target=post) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert _order_count(app) == before + 1
+    assert len(set(responses)) == 1
+    assert responses[0][0] == 201
+
+
+def test_server_error_releases_the_key(app, client, monkeypatch):
+    _stock_up(app)
+    before = _order_count(app)
+
+    def fail(*args):
+        raise RuntimeError('event bus down')
+
+    monkeypatch.setattr(order_routes, 'order_placed', fail)
+    assert client.post('/api/orders', json=ORDER, headers={'Idempotency-Key': 'order-1'}).status_code == 500
+    monkeypatch.undo()
+
+    response = client.post('/api/orders', json=ORDER, headers={'Idempotency-Key': 'order-1'})
+    assert response.status_code == 201
+    assert 'Idempotent-Replayed' not in response.headers
+    assert _order_count(app) == before + 1
@@ -0,0 +1,41 @@
+import pytest
+from app import create_app
+from database import db
+from utils import metrics
+
+
+@pytest.fixture
+def slow_query():
+    metrics.slow_queries.append({'statement': 'SELECT * FROM user WHERE email = ?', 'duration_ms': 900})
+    yield
+    metrics.slow_queries.clear()
+
+
+def test_slow_queries_are_not_exposed_without_a_token(client, slow_query):
+    assert client.get('/metrics/slow-queries').status_code == 404
+    assert client.get('/metrics').status_code == 200
+
+
+def test_slow_queries_need_the_metrics_token(tmp_path, slow_query):
+    app = create_app({
+        'TESTING': True,
+        'SQLALCHEMY_DATABASE_URI': f'sqlite:///{tmp_path / "metrics.db"}',
+        'OUTBOX_WORKERS': 0,
+        'ADMISSION_CONTROL': False,
+        'SECRET_KEY': 'testing-secret',
+        'METRICS_TOKEN': 'metrics-secret',
+    })
+    with app.app_context():
+        db.create_all()
+    client = app.test_client()
+
+    assert client.get('/metrics/slow-queries').status_code == 401
+    assert client.get('/metrics/slow-queries', headers={'Authorization': 'Bearer wrong'}).status_code == 401
+    response = client.get('/metrics/slow-queries', headers={'Authorization': 'Bearer metrics-secret'})
+    assert response.status_code == 200
+    assert response.get_json()[-1]['statement'].startswith('SELECT * FROM user')
+
+    with app.app_context():
+        db.session.remove()
+        for engine in db.engines.values():
+            engine.dispose()
@@ -0,0 +1,39 @@
+"""Serializing orders must not issue one query per order or per line item."""
+
+
+def test_order_list_query_count_is_constant(client, count_statements):
+    with count_statements() as few:
+        response = client.get('/api/orders?limit=5')
+    assert response.status_code == 200
+    assert len(response.get_json()['items']) == 5
+
+    with count_statements() as many:
+        response = client.get('/api/orders')
+    assert response.status_code == 200
+    orders = response.get_json()
+    assert len(orders) == 30
+    assert all(len(order['items']) == 3 for order in orders)
+
+    # One query for the orders and one for all of their items
+    assert many.count == few.count == 2, many.statements
+
+
+def test_order_detail_query_count(client, count_statements):
+    with count_statements() as counter:
+        response = client.get('/api/orders/7')
+    assert response.status_code == 200
+    order = response.get_json()
+    assert len(order['items']) == 3
+    assert all(item['product_name'] for item in order['items'])
+
+    # The order, its lines, and their products
+    assert counter.count == 3, counter.statements
+
+
+def test_user_order_history_query_count(client, count_statements):
+    user_id = client.get('/api/orders/1').get_json()['user_id']
+    with count_statements() as counter:
+        response = client.get(f'/api/orders/user/{user_id}')
+    assert response.status_code == 200
+    assert response.get_json()
+    assert counter.count == 2, counter.statements
@@ -0,0 +1,34 @@
+from database import db
+from models.outbox import OutboxEvent
+from models.product import Product
+from utils import outbox
+from utils.outbox import enqueue, drain
+
+
+def _stock(product_id):
+    return db.session.get(Product, product_id, populate_existing=True).stock
+
+
+def test_handler_changes_roll_back_when_the_lease_was_lost(app):
+    with app.app_context():
+        while drain():
+            pass
+        before = _stock(3)
+        enqueue('stock.release', {'order_id': 1, 'lines': [[3, 5]]})
+        db.session.commit()
+
+        token, events = outbox._claim(10)
+        # The lease expired mid-run and another worker claimed the event
+        db.session.query(OutboxEvent).filter_by(event_id=events[0].event_id).update({'lease_token': 'other-worker'})
+        db.session.commit()
+
+        outbox._process('stock.release', events, token)
+        event = db.session.get(OutboxEvent, events[0].event_id, populate_existing=True)
+        assert (event.status, event.lease_token, event.last_error) == ('pending', 'other-worker', None)
+        assert _stock(3) == before
+
+        db.session.query(OutboxEvent).filter_by(event_id=event.event_id).update({'lease_token': token})
+        db.session.commit()
+        outbox._process('stock.release', [event], token)
+        assert db.session.get(OutboxEvent, event.event_id, populate_existing=True).status == 'done'
+        assert _stock(3) == before + 5
@@ -0,0 +1,39 @@
+import json
+from utils import pagination
+
+
+def test_unpaged_list_is_capped_with_next_cursor(client, monkeypatch):
+    monkeypatch.setattr(pagination, 'UNPAGED_LIMIT', 7)
+    monkeypatch.setattr('routes.product_routes.UNPAGED_LIMIT', 7)
+
+    response = client.get('/api/users')
+    assert [user['user_id'] for user in response.get_json()] == list(range(1, 8))
+    assert response.headers['X-Next-Cursor'] == '7'
+
+    rest = client.get('/api/users?cursor=7').get_json()
+    assert [user['user_id'] for user in rest['items']] == [8, 9, 10]
+
+    response = client.get('/api/products')
+    assert len(response.get_json()) == 7
+    assert response.headers['X-Next-Cursor'] == '7'
+
+
+def test_unpaged_list_below_the_cap_has_no_cursor(client):
+    response = client.get('/api/orders')
+    assert len(response.get_json()) == 30
+    assert 'X-Next-Cursor' not in response.headers
+
+
+def test_stream_fetches_keyset_batches(client, monkeypatch, count_statements):
+    monkeypatch.setattr(pagination, 'STREAM_BATCH_SIZE', 7)
+
+    with count_statements() as counter:
+        lines = client.get('/api/orders?stream=ndjson').get_data(as_text=True).splitlines()
+    orders = [json.loads(line) for line in lines]
+    assert [order['order_id'] for order in orders] == list(range(1, 31))
+    assert all(len(order['items']) == 3 for order in orders)
+    # 5 batches (the last one short), each followed by its item query
+    assert counter.count == 10
+
+    orders = client.get('/api/orders?stream=json&cursor=5&limit=10').get_json()
+    assert [order['order_id'] for order in orders] == list(range(6, 16))
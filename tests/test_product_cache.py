@@ -0,0 +1,79 @@
+from database import db
+from models.product import Product
+from routes.product_routes import MAX_BATCH_IDS
+from utils import product_cache as product_cache_module
+from utils.product_cache import LRUCache, ProductCache, product_cache
+
+
+def test_lru_evicts_the_least_recently_used():
+    cache = LRUCache(maxsize=2, ttl=60)
+    cache.set('a', 1)
+    cache.set('b', 2)
+    assert cache.get('a') == 1  # 'b' is now the least recently used
+    cache.set('c', 3)
+
+    assert cache.get('b') is None
+    assert (cache.get('a'), cache.get('c')) == (1, 3)
+    assert cache.stats()['evictions'] == 1
+
+
+def test_entries_expire_after_the_ttl(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(product_cache_module.time, 'monotonic', lambda: now[0])
+    cache = LRUCache(maxsize=10, ttl=60)
+    cache.set('a', 1)
+
+    now[0] += 59
+    assert cache.get('a') == 1
+    now[0] += 2
+    assert cache.get('a') is None
+    assert cache.stats()['expirations'] == 1
+
+
+def test_stock_changes_keep_listings_and_writes_drop_them():
+    cache = ProductCache(maxsize=10, ttl=60)
+    cache.cache_product({'product_id': 1, 'stock': 5})
+    cache.cache_product({'product_id': 2, 'stock': 5})
+    cache.cache_list('all', [{'product_id': 1, 'stock': 5}])
+
+    cache.stock_changed(1)
+    assert cache.cached_product(1) is None
+    assert cache.cached_product(2) is not None
+    assert cache.cached_list('all') is not None
+
+    cache.invalidate(2)
+    assert cache.cached_product(2) is None
+    assert cache.cached_list('all') is None
+
+
+def test_an_order_leaves_the_listing_cache_warm(app, client):
+    product_cache.cache.clear()
+    with app.app_context():
+        db.session.get(Product, 1).stock = 10
+        db.session.commit()
+    client.get('/api/products')
+    client.get('/api/products/1')
+
+    order = {'user_id': 1, 'total_amount': 10, 'items': [{'product_id': 1, 'quantity': 1}]}
+    assert client.post('/api/orders', json=order).status_code == 201
+
+    assert product_cache.cached_list('all') is not None
+    assert product_cache.cached_product(1) is None
+    assert client.get('/api/products/1').get_json()['stock'] == 9
+
+
+def test_batch_lookup_loads_the_misses_in_one_query(client, count_statements):
+    client.get('/api/products/2')  # cached; 5 and 7 are not
+
+    with count_statements() as counter:
+        response = client.get('/api/products?ids=5,2,999,7,5')
+    assert response.status_code == 200
+    body = response.get_json()
+    assert [product['product_id'] for product in body['products']] == [5, 2, 7]
+    assert body['missing'] == [999]
+    product_queries = [statement for statement in counter.statements if 'FROM product' in statement
+                       and 'max(' not in statement]
+    assert len(product_queries) == 1, counter.statements
+
+    assert client.get('/api/products?ids=1,x').status_code == 400
+    assert client.get('/api/products?ids=' + ','.join(map(str, range(1, MAX_BATCH_IDS + 2)))).status_code == 400
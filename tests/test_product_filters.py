@@ -0,0 +1,71 @@
+from decimal import Decimal
+import pytest
+from database import db
+from models.product import Product
+from utils.product_filters import PRICE_BUCKETS
+
+CATEGORIES = Product.category.type.enums
+BOUNDS = (0,) + PRICE_BUCKETS + (None,)
+
+
+@pytest.fixture
+def catalog(app):
+    """The 20 seeded products with known categories, prices and stock."""
+    with app.app_context():
+        products = db.session.query(Product).order_by(Product.product_id).all()
+        for index, product in enumerate(products):
+            product.category = CATEGORIES[index % len(CATEGORIES)]
+            product.price = Decimal(10 + 17 * index)  # 10 .. 333, across every bucket
+            product.stock = index % 3  # every third product is out of stock
+        db.session.commit()
+        return [{'product_id': p.product_id, 'category': p.category, 'price': p.price, 'stock': p.stock}
+                for p in products]
+
+
+def _expected(catalog, categories=(), min_price=None, max_price=None, in_stock=False):
+    """The filtered products and facet counts, computed in Python."""
+    def in_range(p):
+        return (min_price is None or p['price'] >= min_price) and (max_price is None or p['price'] <= max_price)
+
+    def in_categories(p):
+        return not categories or p['category'] in categories
+
+    stocked = [p for p in catalog if not in_stock or p['stock'] > 0]
+    matching = [p for p in stocked if in_range(p) and in_categories(p)]
+    category_counts = {name: sum(1 for p in stocked if in_range(p) and p['category'] == name)
+                       for name in CATEGORIES}
+    price_counts = [sum(1 for p in stocked
+                        if in_categories(p) and low <= p['price'] and (high is None or p['price'] < high))
+                    for low, high in zip(BOUNDS, BOUNDS[1:])]
+    return matching, category_counts, price_counts
+
+
+@pytest.mark.parametrize('query, filters', [
+    ('in_stock=true', {'in_stock': True}),
+    ('category=Fitness Equipment', {'categories': ('Fitness Equipment',)}),
+    ('min_price=50&max_price=200', {'min_price': 50, 'max_price': 200}),
+    ('category=Fitness Equipment,Health Supplements&min_price=30&in_stock=1',
+     {'categories': ('Fitness Equipment', 'Health Supplements'), 'min_price': 30, 'in_stock': True}),
+    ('max_price=100&in_stock=true&sort=-price', {'max_price': 100, 'in_stock': True}),
+])
+def test_filters_and_facets_agree_with_the_catalog(client, catalog, query, filters):
+    body = client.get(f'/api/products?{query}&limit=100').get_json()
+    matching, category_counts, price_counts = _expected(catalog, **filters)
+
+    assert sorted(p['product_id'] for p in body['products']) == sorted(p['product_id'] for p in matching)
+    assert body['total'] == len(matching)
+    assert body['facets']['category'] == category_counts
+    assert [bucket['count'] for bucket in body['facets']['price']] == price_counts
+
+
+def test_sort_and_limit(client, catalog):
+    body = client.get('/api/products?sort=-price&limit=3').get_json()
+    prices = sorted((p['price'] for p in catalog), reverse=True)[:3]
+    assert [Decimal(str(p['price'])) for p in body['products']] == prices
+    assert body['total'] == len(catalog)
+
+
+@pytest.mark.parametrize('query', ['min_price=-1', 'min_price=10&max_price=5', 'in_stock=maybe',
+                                   'category=Toys', 'sort=colour', 'sort=name&limit=0'])
+def test_invalid_filters_are_rejected(client, query):
+    assert client.get(f'/api/products?{query}').status_code == 400
@@ -0,0 +1,79 @@
+import json
+from sqlalchemy import text
+from database import db
+from models.product import Product
+from utils import product_import
+
+NDJSON = {'Content-Type': 'application/x-ndjson'}
+NEW = {'name': 'Kettlebell', 'description': '16 kg', 'price': '39.90', 'category': 'Fitness Equipment',
+       'stock': 12, 'image_url': 'https://example.com/kettlebell.png'}
+
+
+def _ndjson(*rows):
+    return ''.join(json.dumps(row) + '\n' for row in rows)
+
+
+def _product(app, product_id):
+    with app.app_context():
+        return db.session.get(Product, product_id).to_dict()
+
+
+def test_invalid_rows_are_reported_and_valid_ones_written(app, client):
+    body = _ndjson(NEW, {**NEW, 'price': '1.999'}, {**NEW, 'category': 'Toys'}, {'name': 'No fields'}) \
+        + 'not json\n'
+    report = client.post('/api/products/bulk', data=body, headers=NDJSON).get_json()
+
+    assert (report['rows'], report['created'], report['failed']) == (5, 1, 4)
+    assert report['errors'] == [
+        {'line': 2, 'product_id': None, 'errors': ['price must have at most two decimal places']},
+        {'line': 3, 'product_id': None, 'errors': [f'category must be one of: {", ".join(product_import.CATEGORIES)}']},
+        {'line': 4, 'product_id': None,
+         'errors': ['Missing required fields: description, price, category, stock, image_url']},
+        {'line': 5, 'product_id': None, 'errors': ['Invalid JSON']},
+    ]
+    assert client.get('/api/products/21').get_json()['name'] == 'Kettlebell'
+
+
+def test_partial_rows_update_only_their_fields(app, client):
+    before = _product(app, 3)
+    body = _ndjson({'product_id': 3, 'price': '5.50'}, {'product_id': 3, 'name': 'Renamed'},
+                   {'product_id': 999, 'stock': 1})
+    report = client.post('/api/products/bulk', data=body, headers=NDJSON).get_json()
+
+    assert (report['updated'], report['failed']) == (2, 1)
+    assert report['errors'][0]['errors'] == [
+        'Product not found; creating it needs: name, description, price, category, image_url']
+    assert _product(app, 3) == {**before, 'price': 5.5, 'name': 'Renamed'}
+    assert client.get('/api/products/3').get_json()['name'] == 'Renamed'
+
+
+def test_csv_stock_update(app, client):
+    body = 'product_id,stock\n1,40\n2,-1\n999,5\n4,\n'
+    response = client.post('/api/products/bulk/stock', data=body, headers={'Content-Type': 'text/csv'})
+    report = response.get_json()
+
+    assert response.status_code == 200
+    assert (report['rows'], report['updated'], report['failed']) == (4, 1, 3)
+    assert [(error['line'], error['errors']) for error in report['errors']] == [
+        (3, [f'stock must be between 0 and {product_import.MAX_INT}']),
+        (5, ['Missing required fields: stock']),
+        (4, ['Product not found']),
+    ]
+    assert _product(app, 1)['stock'] == 40
+
+
+def test_failed_batch_is_retried_row_by_row(app, client):
+    with app.app_context():
+        db.session.execute(text(
+            "CREATE TRIGGER reject_product BEFORE INSERT ON product WHEN NEW.name = 'Rejected' "
+            "BEGIN SELECT RAISE(ABORT, 'rejected by the database'); END"))
+        db.session.commit()
+
+    body = _ndjson({**NEW, 'name': 'First'}, {**NEW, 'name': 'Rejected'}, {**NEW, 'name': 'Third'})
+    report = client.post('/api/products/bulk', data=body, headers=NDJSON).get_json()
+
+    assert (report['created'], report['failed'], report['batches']) == (2, 1, 1)
+    assert report['errors'] == [{'line': 2, 'product_id': None, 'errors': ['rejected by the database']}]
+    with app.app_context():
+        assert sorted(db.session.execute(text('SELECT name FROM product WHERE product_id > 20')).scalars()) \
+            == ['First', 'Third']
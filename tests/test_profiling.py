@@ -0,0 +1,71 @@
+import json
+import time
+from functools import partial
+import pytest
+from flask import jsonify
+from sqlalchemy import text
+from app import create_app
+from database import db
+from utils import profiling
+
+
+@pytest.fixture
+def profile_dir(tmp_path, monkeypatch):
+    directory = tmp_path / 'profiles'
+    monkeypatch.setattr(profiling, 'write', partial(profiling.write, directory=str(directory)))
+    return directory
+
+
+def _app(tmp_path, **overrides):
+    app = create_app({'TESTING': True, 'SQLALCHEMY_DATABASE_URI': f'sqlite:///{tmp_path / "profiling.db"}',
+                      'OUTBOX_WORKERS': 0, 'ADMISSION_CONTROL': False, **overrides})
+
+    def slow():
+        time.sleep(0.05)
+        return jsonify(db.session.execute(text('SELECT 1')).scalar())
+
+    app.add_url_rule('/api/test-slow', 'test_slow', slow)
+    return app
+
+
+def _report(profile_dir, response):
+    with open(profile_dir / f"{response.headers['X-Profile-Id']}.json", encoding='utf-8') as f:
+        return json.load(f)
+
+
+def test_token_profiles_only_requests_that_send_it(tmp_path, profile_dir):
+    client = _app(tmp_path, PROFILE_TOKEN='profile-secret').test_client()
+
+    assert 'X-Profile-Id' not in client.get('/api/test-slow').headers
+    assert 'X-Profile-Id' not in client.get('/api/test-slow', headers={'X-Profile': 'guess'}).headers
+    response = client.get('/api/test-slow', headers={'X-Profile': 'profile-secret'})
+
+    report = _report(profile_dir, response)
+    assert (report['reason'], report['endpoint'], report['status']) == ('header', 'test_slow', 200)
+    assert report['wall_ms'] >= 50
+    assert report['sql_count'] == len(report['statements']) == 1
+    assert report['statements'][0]['statement'] == 'SELECT 1'
+    assert report['samples'] > 0
+
+    lines = (profile_dir / f"{response.headers['X-Profile-Id']}.collapsed").read_text().splitlines()
+    assert sum(int(line.rpartition(' ')[2]) for line in lines) == report['samples']
+    assert any('slow (tests/test_profiling.py' in line for line in lines)
+    assert sum(profiling.merge('test_slow', directory=str(profile_dir)).values()) == report['samples']
+    assert not profiling.merge('other_endpoint', directory=str(profile_dir))
+
+
+def test_sampling_profiles_without_a_header(tmp_path, profile_dir):
+    client = _app(tmp_path, PROFILE_SAMPLE_RATE=1.0).test_client()
+
+    response = client.get('/api/test-slow')
+    assert _report(profile_dir, response)['reason'] == 'sampled'
+    # A request naming a token is judged by the token alone, and there is none
+    assert 'X-Profile-Id' not in client.get('/api/test-slow', headers={'X-Profile': 'guess'}).headers
+    assert len(list(profile_dir.glob('*.json'))) == 1
+
+
+def test_profiling_off_registers_nothing(tmp_path, profile_dir):
+    app = _app(tmp_path)
+    response = app.test_client().get('/api/test-slow', headers={'X-Profile': 'anything'})
+    assert 'X-Profile-Id' not in response.headers
+    assert not profile_dir.exists()
@@ -0,0 +1,42 @@
+import pytest
+from benchmarks.explain import parse_args, run
+from utils.search_index import search_index
+
+# Probe -> indexes its plans must use
+EXPECTED_INDEXES = {
+    'product': {'ix_product_updated_at'},  # the catalog version behind the ETag
+    'products_filtered': {'ix_product_category_price'},
+    'products_in_stock': {'ix_product_stock'},
+    'user_orders': {'ix_order_user_id_order_id'},
+    'analytics_top_sellers': {'ix_sales_product_total_units'},
+}
+# Probes whose keyset pages must come off an index in order, without a sort
+NO_SORT = ('products_page', 'orders_page', 'user_orders')
+
+
+@pytest.fixture(scope='module')
+def report(tmp_path_factory):
+    database = tmp_path_factory.mktemp('plans') / 'plans.db'
+    report = run(parse_args(['--database-uri', f'sqlite:///{database}', '--users', '20', '--products', '300',
+                             '--carts', '50', '--orders', '300', '--min-rows', '100']))
+    search_index.__init__()
+    return report
+
+
+def _details(probe):
+    return [row['detail'] for statement in probe['statements'] for row in statement['plan']]
+
+
+def test_no_probe_fails_or_scans_a_table_unexpectedly(report):
+    assert report['failures'] == []
+
+
+@pytest.mark.parametrize('name, indexes', sorted(EXPECTED_INDEXES.items()))
+def test_probe_uses_its_index(report, name, indexes):
+    details = ' '.join(_details(report['probes'][name]))
+    assert {index for index in indexes if index in details} == indexes
+
+
+@pytest.mark.parametrize('name', NO_SORT)
+def test_keyset_pages_need_no_sort(report, name):
+    assert not [detail for detail in _details(report['probes'][name]) if 'FOR ORDER BY' in detail]
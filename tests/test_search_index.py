@@ -0,0 +1,42 @@
+from types import SimpleNamespace
+from database import db
+from models.product import Product
+import routes.product_routes as product_routes
+from utils import search_index as search_index_module
+from utils.search_index import ProductSearchIndex, search_index
+
+
+def _product(product_id, name, description=''):
+    return SimpleNamespace(product_id=product_id, name=name, description=description)
+
+
+def test_prefix_expansion_keeps_most_common_terms(monkeypatch):
+    monkeypatch.setattr(search_index_module, 'MAX_PREFIX_EXPANSIONS', 2)
+    index = ProductSearchIndex()
+    # 'lamp' is in three products and sorts after the rarer 'la...' terms
+    index.build([
+        _product(1, 'Label'), _product(2, 'Ladder'),
+        _product(3, 'Lamp'), _product(4, 'Lamp'), _product(5, 'Lamp'), _product(6, 'Lace Lace'),
+    ])
+    assert set(index.search('la')) >= {3, 4, 5}
+
+
+def test_index_rebuilds_after_ttl(app, client, monkeypatch):
+    client.get('/api/products/search?q=a')
+    with app.app_context():
+        db.session.add(Product(name='Zyzzyva Kettle', description='', price=10,
+                               category='Fitness Equipment', stock=1, image_url=''))
+        db.session.commit()  # written behind the index's back, as another worker would
+
+    assert client.get('/api/products/search?q=zyzzyva').get_json() == []
+    monkeypatch.setattr(search_index, '_built_at', search_index._built_at - search_index_module.SEARCH_INDEX_TTL)
+    assert [p['name'] for p in client.get('/api/products/search?q=zyzzyva').get_json()] == ['Zyzzyva Kettle']
+
+
+def test_search_limit_defaults_and_is_capped(client, monkeypatch):
+    monkeypatch.setattr(product_routes, 'SEARCH_DEFAULT_LIMIT', 3)
+    monkeypatch.setattr(product_routes, 'MAX_PAGE_SIZE', 5)
+    assert len(client.get('/api/products/search?q=a').get_json()) == 3
+    assert len(client.get('/api/products/search?q=a&limit=4').get_json()) == 4
+    assert len(client.get('/api/products/search?q=a&limit=1000').get_json()) == 5
+    assert client.get('/api/products/search?q=a&limit=-1').status_code == 400
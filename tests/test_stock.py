@@ -0,0 +1,73 @@
+import threading
+from database import db
+from models.product import Product
+from utils.stock import reserve_stock
+
+THREADS = 8
+ATTEMPTS = 10
+STARTING_STOCK = 25
+
+
+def test_concurrent_reservations_never_oversell(app):
+    with app.app_context():
+        db.session.query(Product).filter(Product.product_id.in_([1, 2])).update(
+            {Product.stock: STARTING_STOCK}, synchronize_session=False)
+        db.session.commit()
+
+    reserved = []
+    errors = []
+    start = threading.Barrier(THREADS)
+
+    def checkout(worker):
+        # Alternate the line order so lock ordering is what keeps this deadlock-free
+        items = [{'product_id': 1, 'quantity': 1}, {'product_id': 2, 'quantity': 1}]
+        if worker % 2:
+            items.reverse()
+        with app.app_context():
+            start.wait()
+            for _ in range(ATTEMPTS):
+                try:
+                    if not reserve_stock(items):
+                        db.session.commit()
+                        reserved.append(worker)
+                except Exception as exc:
+                    db.session.rollback()
+                    errors.append(exc)
+
+    threads = [threading.Thread(target=checkout, args=(worker,)) for worker in range(THREADS)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert errors == []
+    assert len(reserved) == STARTING_STOCK
+    with app.app_context():
+        stock = dict(db.session.query(Product.product_id, Product.stock).filter(Product.product_id.in_([1, 2])))
+    assert stock == {1: 0, 2: 0}
+
+
+def test_shortfall_rolls_back_only_the_reservation(app):
+    with app.app_context():
+        db.session.get(Product, 3).name = 'Renamed in the same transaction'
+        db.session.flush()
+        stock = db.session.get(Product, 1).stock
+
+        shortfalls = reserve_stock([{'product_id': 1, 'quantity': stock + 1}])
+        assert [s['product_id'] for s in shortfalls] == [1]
+        db.session.commit()
+
+    with app.app_context():
+        assert db.session.get(Product, 3).name == 'Renamed in the same transaction'
+        assert db.session.get(Product, 1).stock == stock
+
+
+def test_reservation_is_undone_with_the_callers_transaction(app):
+    with app.app_context():
+        stock = db.session.get(Product, 1).stock
+        db.session.rollback()
+        assert reserve_stock([{'product_id': 1, 'quantity': 1}]) == []
+        db.session.rollback()
+
+    with app.app_context():
+        assert db.session.get(Product, 1).stock == stock
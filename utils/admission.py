@@ -0,0 +1,299 @@
+"""Admission control: per-client rate limits and per-route concurrency limits.
+
+Every /api request is assigned a route class (ROUTE_CLASSES, else
+'default'). A request is admitted only when:
+
+1. the client's token bucket for that class has a token. The client is
+   the authenticated user, or the remote address. Behind a reverse proxy
+   or load balancer, set TRUSTED_PROXIES so that address is the client's
+   rather than the proxy's. Otherwise the answer is 429 with Retry-After.
+2. a concurrency slot for the class frees up within
+   ADMISSION_QUEUE_BUDGET seconds. Each class gets its share of the
+   process's connection pool, DB_POOL_SIZE + DB_MAX_OVERFLOW. Once a
+   class's queue is longer than ADMISSION_MAX_QUEUE per slot, further
+   requests are shed immediately. Both cases answer 503 with
+   Retry-After.
+
+Concurrency limits guard the pool of the process they run in, so they
+are always local. Rate limits must be shared between workers to mean
+anything in a multi-process deployment. They are kept in the store named
+by RATE_LIMIT_STORAGE_URI: memory:// (per process) or redis://.
+
+The async read path (utils/async_reads.py) applies the same rate limits,
+and concurrency limits of its own over its async pool
+(AsyncConcurrencyLimit).
+"""
+import asyncio
+import math
+import threading
+import time
+from collections import OrderedDict
+from flask import g, request, jsonify
+from config import (RATE_LIMIT_STORAGE_URI, RATE_LIMITS, ROUTE_CLASSES, ADMISSION_POOL_SHARES,
+                    ADMISSION_QUEUE_BUDGET, ADMISSION_MAX_QUEUE)
+
+try:
+    import redis
+except ImportError:  # optional dependency; only needed for redis:// storage
+    redis = None
+
+# Endpoints that are never limited
+EXEMPT_ENDPOINTS = {'metrics', 'slow_queries', 'static'}
+
+
+# --- Rate limit storage -----------------------------------------------------
+
+class MemoryRateLimitStore:
+    """Token buckets in this process's memory. Least recently seen clients are dropped past maxsize."""
+
+    def __init__(self, maxsize=100000):
+        self.maxsize = maxsize
+        self._buckets = OrderedDict()  # key -> (tokens, updated_at)
+        self._lock = threading.Lock()
+
+    def take(self, key, rate, burst):
+        """Take one token from key's bucket. Returns (allowed, seconds until a token is available)."""
+        now = time.monotonic()
+        with self._lock:
+            tokens, updated_at = self._buckets.pop(key, (burst, now))
+            tokens = min(burst, tokens + (now - updated_at) * rate)
+            allowed = tokens >= 1
+            if allowed:
+                tokens -= 1
+            self._buckets[key] = (tokens, now)
+            if len(self._buckets) > self.maxsize:
+                self._buckets.popitem(last=False)
+        return allowed, 0.0 if allowed else (1 - tokens) / rate
+
+
+class RedisRateLimitStore:
+    """Token buckets in Redis, shared by every worker process.
+
+    Each take is a single Lua script run, so it is atomic. Time comes from
+    the Redis server, so the workers' clocks do not need to agree.
+    """
+
+    SCRIPT = """
+    local rate = tonumber(ARGV[1])
+    local burst = tonumber(ARGV[2])
+    local clock = redis.call('TIME')
+    local now = tonumber(clock[1]) + tonumber(clock[2]) / 1000000
+    local state = redis.call('HMGET', KEYS[1], 'tokens', 'ts')
+    local tokens = tonumber(state[1]) or burst
+    local ts = tonumber(state[2]) or now
+    tokens = math.min(burst, tokens + math.max(0, now - ts) * rate)
+    local allowed = 0
+    local wait = 0
+    if tokens >= 1 then
+        tokens = tokens - 1
+        allowed = 1
+    else
+        wait = (1 - tokens) / rate
+    end
+    redis.call('HSET', KEYS[1], 'tokens', tostring(tokens), 'ts', tostring(now))
+    redis.call('EXPIRE', KEYS[1], math.ceil(burst / rate) + 1)
+    return {allowed, tostring(wait)}
+    """
+
+    def __init__(self, uri, prefix='ratelimit:'):
+        if redis is None:
+            raise RuntimeError(f'RATE_LIMIT_STORAGE_URI is {uri!r} but the redis package is not installed')
+        self.prefix = prefix
+        self._client = redis.Redis.from_url(uri)
+        self._script = self._client.register_script(self.SCRIPT)
+
+    def take(self, key, rate, burst):
+        allowed, wait = self._script(keys=[self.prefix + key], args=[rate, burst])
+        return bool(allowed), float(wait)
+
+
+def rate_limit_store(uri):
+    """Build the store for a RATE_LIMIT_STORAGE_URI."""
+    if uri.startswith('memory://'):
+        return MemoryRateLimitStore()
+    if uri.startswith(('redis://', 'rediss://', 'unix://')):
+        return RedisRateLimitStore(uri)
+    raise ValueError(f'Unsupported RATE_LIMIT_STORAGE_URI: {uri!r}')
+
+
+# --- Concurrency limits -----------------------------------------------------
+
+class ConcurrencyLimit:
+    """At most `limit` requests in flight, with a bounded, time-boxed queue."""
+
+    def __init__(self, limit, max_queue):
+        self.limit = limit
+        self.max_queue = max_queue
+        self._slots = threading.BoundedSemaphore(limit)
+        self._lock = threading.Lock()
+        self.in_flight = 0
+        self.waiting = 0
+
+    def acquire(self, timeout):
+        if self._slots.acquire(blocking=False):
+            self._admitted()
+            return True
+        with self._lock:
+            if self.waiting >= self.max_queue:
+                return False
+            self.waiting += 1
+        try:
+            acquired = self._slots.acquire(timeout=timeout)
+        finally:
+            with self._lock:
+                self.waiting -= 1
+        if acquired:
+            self._admitted()
+        return acquired
+
+    def release(self):
+        with self._lock:
+            self.in_flight -= 1
+        self._slots.release()
+
+    def _admitted(self):
+        with self._lock:
+            self.in_flight += 1
+
+
+class AsyncConcurrencyLimit:
+    """ConcurrencyLimit for coroutines on one event loop; a queued request waits without holding a thread."""
+
+    def __init__(self, limit, max_queue):
+        self.limit = limit
+        self.max_queue = max_queue
+        self._slots = asyncio.Semaphore(limit)
+        self.in_flight = 0
+        self.waiting = 0
+
+    async def acquire(self, timeout):
+        if self._slots.locked():
+            if self.waiting >= self.max_queue:
+                return False
+            self.waiting += 1
+            try:
+                await asyncio.wait_for(self._slots.acquire(), timeout)
+            except asyncio.TimeoutError:
+                return False
+            finally:
+                self.waiting -= 1
+        else:
+            await self._slots.acquire()
+        self.in_flight += 1
+        return True
+
+    def release(self):
+        self.in_flight -= 1
+        self._slots.release()
+
+
+# --- Flask integration ------------------------------------------------------
+
+def client_address(remote_addr, forwarded_for, trusted_proxies):
+    """The client's address as werkzeug's ProxyFix(x_for=trusted_proxies) would set it."""
+    if trusted_proxies and forwarded_for:
+        hops = [hop.strip() for hop in forwarded_for.split(',')]
+        if len(hops) >= trusted_proxies:
+            return hops[-trusted_proxies]
+    return remote_addr
+
+
+def client_key(user_id, address):
+    """The rate limit bucket owner: the authenticated user, else the address."""
+    return f'user:{user_id}' if user_id is not None else f'ip:{address}'
+
+
+class AdmissionController:
+
+    def __init__(self, pool_capacity, store, rate_limits=RATE_LIMITS, shares=ADMISSION_POOL_SHARES,
+                 route_classes=ROUTE_CLASSES, queue_budget=ADMISSION_QUEUE_BUDGET,
+                 max_queue=ADMISSION_MAX_QUEUE):
+        self.store = store
+        self.rate_limits = rate_limits
+        self.route_classes = route_classes
+        self.queue_budget = queue_budget
+        self.shares = shares
+        self.max_queue = max_queue
+        self.limits = self._build_limits(ConcurrencyLimit, pool_capacity)
+        self.async_limits = {}
+        self.rejections = {}  # (route class, reason) -> count
+        self._lock = threading.Lock()
+
+    def _build_limits(self, limit_class, pool_capacity):
+        limits = {}
+        for name, share in self.shares.items():
+            limit = max(1, int(pool_capacity * share))
+            limits[name] = limit_class(limit, limit * self.max_queue)
+        return limits
+
+    def build_async_limits(self, pool_capacity):
+        """Concurrency limits for the async read path, shares of its own pool of pool_capacity."""
+        self.async_limits = self._build_limits(AsyncConcurrencyLimit, pool_capacity)
+        return self.async_limits
+
+    def route_class(self, endpoint):
+        return self.route_classes.get(endpoint, 'default')
+
+    def take(self, route_class, client):
+        """Take a token from client's bucket for route_class. Returns None, or the seconds until one is available."""
+        rate_limit = self.rate_limits.get(route_class)
+        if not rate_limit:
+            return None
+        allowed, wait = self.store.take(f'{route_class}:{client}', *rate_limit)
+        return None if allowed else wait
+
+    def count_rejection(self, route_class, reason):
+        with self._lock:
+            self.rejections[(route_class, reason)] = self.rejections.get((route_class, reason), 0) + 1
+
+    def _reject(self, route_class, reason, status, retry_after, message):
+        self.count_rejection(route_class, reason)
+        response = jsonify({'error': message})
+        response.status_code = status
+        response.headers['Retry-After'] = str(max(1, math.ceil(retry_after)))
+        return response
+
+    def before_request(self):
+        if request.method == 'OPTIONS' or request.endpoint in EXEMPT_ENDPOINTS:
+            return None
+
+        route_class = self.route_class(request.endpoint)
+        wait = self.take(route_class, client_key(g.get('user_id'), request.remote_addr))
+        if wait is not None:
+            return self._reject(route_class, 'rate_limited', 429, wait, 'Too many requests')
+
+        limit = self.limits.get(route_class)
+        if limit is not None:
+            if not limit.acquire(self.queue_budget):
+                return self._reject(route_class, 'overloaded', 503, 1, 'Server is busy, retry shortly')
+            g.admission_limit = limit
+        return None
+
+    def teardown_request(self, exc=None):
+        limit = g.pop('admission_limit', None)
+        if limit is not None:
+            limit.release()
+
+    def stats(self):
+        with self._lock:
+            rejections = dict(self.rejections)
+        return {
+            'limits': {name: {'limit': limit.limit, 'in_flight': limit.in_flight, 'waiting': limit.waiting}
+                       for name, limit in self.limits.items()},
+            'async_limits': {name: {'limit': limit.limit, 'in_flight': limit.in_flight, 'waiting': limit.waiting}
+                             for name, limit in self.async_limits.items()},
+            'rejections': [{'route_class': route_class, 'reason': reason, 'count': count}
+                           for (route_class, reason), count in sorted(rejections.items())],
+        }
+
+
+def init_admission(app):
+    """Register admission control; call after init_auth so requests are attributed to users."""
+    if not app.config.get('ADMISSION_CONTROL', True):
+        return
+    capacity = app.config.get('DB_POOL_SIZE', 10) + app.config.get('DB_MAX_OVERFLOW', 5)
+    controller = AdmissionController(capacity, rate_limit_store(
+        app.config.get('RATE_LIMIT_STORAGE_URI', RATE_LIMIT_STORAGE_URI)))
+    app.extensions['admission'] = controller
+    app.before_request(controller.before_request)
+    app.teardown_request(controller.teardown_request)
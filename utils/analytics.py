@@ -0,0 +1,191 @@
+import logging
+from datetime import date
+from decimal import Decimal
+from sqlalchemy import delete, func
+from sqlalchemy.dialects import mysql, postgresql, sqlite
+from database import db
+from models.order import Order
+from models.order_product import OrderProduct
+from models.product import Product
+from models.sales_rollup import DailySales, DailyCategorySales, DailyProductSales, ProductSalesTotal
+
+logger = logging.getLogger(__name__)
+
+ROLLUP_MODELS = (DailySales, DailyCategorySales, DailyProductSales, ProductSalesTotal)
+
+
+def counts_toward_sales(status):
+    return status != 'Cancelled'
+
+
+def _increment(model, key_columns, rows):
+    """Add each row's non-key values onto the matching rollup row in one statement.
+
+    Rows that don't exist yet are inserted. Uses ON DUPLICATE KEY UPDATE on
+    MySQL and ON CONFLICT DO UPDATE on SQLite/PostgreSQL.
+    """
+    if not rows:
+        return
+    value_columns = [c for c in rows[0] if c not in key_columns]
+    dialect = db.session.get_bind().dialect.name
+
+    if dialect == 'mysql':
+        stmt = mysql.insert(model).values(rows)
+        stmt = stmt.on_duplicate_key_update(
+            {c: getattr(model, c) + stmt.inserted[c] for c in value_columns})
+    else:
+        insert = postgresql.insert if dialect == 'postgresql' else sqlite.insert
+        stmt = insert(model).values(rows)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=key_columns,
+            set_={c: getattr(model, c) + stmt.excluded[c] for c in value_columns})
+
+    db.session.execute(stmt)
+
+
+def _apply(lines, order_days):
+    """Fold order lines into every rollup table.
+
+    lines: iterable of (day, product_id, category, quantity, revenue) with
+    sign already applied. order_days: {day: order count delta}.
+    """
+    daily, by_category, by_product, totals = {}, {}, {}, {}
+    for day, product_id, category, quantity, revenue in lines:
+        for bucket, key in ((daily, day), (by_category, (day, category)),
+                            (by_product, (day, product_id)), (totals, product_id)):
+            units, amount = bucket.get(key, (0, Decimal(0)))
+            bucket[key] = (units + quantity, amount + revenue)
+
+    for day, count in order_days.items():
+        daily.setdefault(day, (0, Decimal(0)))
+
+    _increment(DailySales, ['day'], [
+        {'day': day, 'orders': order_days.get(day, 0), 'units': u, 'revenue': r}
+        for day, (u, r) in daily.items()])
+    _increment(DailyCategorySales, ['day', 'category'], [
+        {'day': day, 'category': category, 'units': u, 'revenue': r}
+        for (day, category), (u, r) in by_category.items()])
+    _increment(DailyProductSales, ['day', 'product_id'], [
+        {'day': day, 'product_id': pid, 'units': u, 'revenue': r}
+        for (day, pid), (u, r) in by_product.items()])
+    _increment(ProductSalesTotal, ['product_id'], [
+        {'product_id': pid, 'units': u, 'revenue': r}
+        for pid, (u, r) in totals.items()])
+
+
+def _order_lines(order_ids):
+    return db.session.query(
+        Order.order_id, Order.order_date, OrderProduct.product_id, Product.category,
+        OrderProduct.quantity, func.coalesce(OrderProduct.unit_price, Product.price).label('price')
+    ).join(OrderProduct, OrderProduct.order_id == Order.order_id) \
+     .join(Product, Product.product_id == OrderProduct.product_id) \
+     .filter(Order.order_id.in_(order_ids))
+
+
+def _day(order_date):
+    return order_date.date() if order_date else date.today()
+
+
+def unit_prices(product_ids):
+    """{product_id: current price} for the products that exist."""
+    return dict(
+        db.session.query(Product.product_id, Product.price).filter(Product.product_id.in_(list(product_ids)))
+    ) if product_ids else {}
+
+
+def sales_event(order_id, lines, sign=1, orders=1, order_date=None):
+    """Payload for a 'sales.record' outbox event.
+
+    lines: iterable of (product_id, quantity, unit_price), unit_price being
+    the price the line was ordered at, so a later cancellation subtracts
+    exactly the revenue the order added. orders is the change in the day's
+    order count (0 when only some lines of an order change). Pass
+    order_date when the order may be gone by the time the event is handled.
+    """
+    return {
+        'order_id': order_id,
+        'lines': [[product_id, quantity, None if unit_price is None else str(unit_price)]
+                  for product_id, quantity, unit_price in lines],
+        'sign': sign,
+        'orders': orders,
+        'day': order_date.date().isoformat() if order_date else None,
+    }
+
+
+def record_sales(events):
+    """Fold a batch of sales_event payloads into the rollups.
+
+    Product categories and prices, and the order dates of events that
+    carry no day, are each loaded with one query for the whole batch.
+    Revenue uses each line's unit_price; lines without one (events queued
+    before prices were recorded) use the product's current price.
+    """
+    product_ids = {line[0] for event in events for line in event['lines']}
+    products = {
+        row.product_id: row for row in
+        db.session.query(Product.product_id, Product.category, Product.price)
+        .filter(Product.product_id.in_(product_ids))
+    } if product_ids else {}
+
+    undated = {event['order_id'] for event in events if not event['day']}
+    order_dates = dict(
+        db.session.query(Order.order_id, Order.order_date).filter(Order.order_id.in_(undated))
+    ) if undated else {}
+
+    lines = []
+    order_days = {}
+    for event in events:
+        if event['day']:
+            day = date.fromisoformat(event['day'])
+        else:
+            # An order deleted before its creation event was handled falls back to today
+            day = _day(order_dates.get(event['order_id']))
+        sign = event['sign']
+        order_days[day] = order_days.get(day, 0) + sign * event['orders']
+        for product_id, quantity, *unit_price in event['lines']:
+            product = products.get(product_id)
+            if product is None:
+                continue
+            price = Decimal(unit_price[0]) if unit_price and unit_price[0] is not None else product.price
+            lines.append((day, product_id, product.category, sign * quantity, sign * quantity * price))
+
+    _apply(lines, order_days)
+
+
+def backfill(batch_size=1000):
+    """Rebuild every rollup table from order/order_product in batches.
+
+    Each batch of orders is read with one join query and committed on its
+    own, so memory stays bounded. Run it while checkout traffic is low;
+    orders written during the rebuild may be counted twice or missed.
+    """
+    for model in ROLLUP_MODELS:
+        db.session.execute(delete(model))
+    db.session.commit()
+
+    last_id = 0
+    processed = 0
+    while True:
+        batch = db.session.query(Order.order_id, Order.order_date) \
+            .filter(Order.order_id > last_id, Order.status != 'Cancelled') \
+            .order_by(Order.order_id).limit(batch_size).all()
+        if not batch:
+            break
+
+        order_ids = [row.order_id for row in batch]
+        order_days = {}
+        for row in batch:
+            day = _day(row.order_date)
+            order_days[day] = order_days.get(day, 0) + 1
+
+        lines = [(_day(row.order_date), row.product_id, row.category,
+                  row.quantity, row.quantity * row.price)
+                 for row in _order_lines(order_ids)]
+        _apply(lines, order_days)
+        db.session.commit()
+
+        last_id = order_ids[-1]
+        processed += len(order_ids)
+        logger.info('Analytics backfill: %d orders processed', processed)
+
+    return processed
@@ -0,0 +1,445 @@
+"""Serve catalog and order-history reads from an async engine (see asgi.py).
+
+The GET routes in ROUTES are answered on the event loop. They query
+through SQLAlchemy's async engine (aiomysql, or aiosqlite locally) and
+use the same statements, caches, search index and JSON encoding as the
+Flask views, so a response carries the same JSON the sync app would send.
+A request waiting on the database then holds a coroutine rather than a
+thread, which is what lets one process keep thousands of slow clients
+open.
+
+Everything else goes to the Flask app through asgiref's WSGI adapter, on
+a pool of ASYNC_WSGI_THREADS threads, as it would under gunicorn with
+--threads. (asgiref alone would run every such request on one shared
+thread.) That covers writes, auth, carts, analytics, metrics and
+streamed (?stream=) listings.
+
+Admission control applies here too: the same per-client rate limits
+(shared with Flask through the rate limit store) and per-class
+concurrency limits over the async pool. Compression and request metrics
+are Flask hooks, so they only apply to the requests Flask serves.
+"""
+import asyncio
+import logging
+import math
+import re
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import parse_qsl
+from sqlalchemy import select
+from werkzeug.datastructures import MultiDict
+from werkzeug.http import parse_etags
+from config import HTTP_CATALOG_MAX_AGE
+from database import engine_options
+from utils.admission import MemoryRateLimitStore, client_address, client_key
+from utils.auth import verify_token
+from models.order import Order
+from models.product import Product
+from routes.product_routes import parse_product_ids, parse_search_limit
+from utils.http_cache import CATALOG_VERSION, catalog_etag, matching_etag
+from utils.pagination import parse_page_args, DEFAULT_PAGE_SIZE, UNPAGED_LIMIT
+from utils.product_cache import product_cache
+from utils.product_filters import is_filter_request, parse_filters, page_statement, facet_statement, build_facets
+from utils.search_index import search_index
+
+try:
+    from sqlalchemy.ext.asyncio import create_async_engine
+except ImportError:  # optional dependency; needs greenlet (pip install "sqlalchemy[asyncio]")
+    create_async_engine = None
+
+try:
+    from asgiref.sync import sync_to_async
+    from asgiref.wsgi import WsgiToAsgi, WsgiToAsgiInstance
+except ImportError:  # optional dependency; only needed by asgi.py
+    WsgiToAsgi = WsgiToAsgiInstance = None
+
+logger = logging.getLogger(__name__)
+
+# Sync driver -> async driver, for deriving ASYNC_DATABASE_URI
+ASYNC_DRIVERS = {
+    'mysql': 'mysql+aiomysql',
+    'mysql+pymysql': 'mysql+aiomysql',
+    'sqlite': 'sqlite+aiosqlite',
+}
+
+# (path pattern, handler name, Flask endpoint, catalog route served with ETags)
+# The endpoint picks the admission route class, as for the Flask view.
+ROUTES = (
+    (re.compile(r'/api/products'), 'products', 'product_bp.get_products', True),
+    (re.compile(r'/api/products/categories'), 'products_by_categories', 'product_bp.get_products_by_categories', True),
+    (re.compile(r'/api/products/search'), 'search_products', 'product_bp.search_products', True),
+    (re.compile(r'/api/products/(\d+)'), 'product', 'product_bp.get_product', True),
+    (re.compile(r'/api/orders/(\d+)'), 'order', 'order_bp.get_order', False),
+    (re.compile(r'/api/orders/user/(\d+)'), 'orders_by_user', 'order_bp.get_orders_by_user', False),
+)
+
+
+def async_database_uri(config):
+    """ASYNC_DATABASE_URI, or SQLALCHEMY_DATABASE_URI with its driver swapped for an async one."""
+    if config.get('ASYNC_DATABASE_URI'):
+        return config['ASYNC_DATABASE_URI']
+    scheme, sep, rest = config['SQLALCHEMY_DATABASE_URI'].partition('://')
+    return ASYNC_DRIVERS.get(scheme, scheme) + sep + rest
+
+
+def _log_index_failure(task):
+    if not task.cancelled() and task.exception() is not None:
+        logger.error('Search index rebuild failed', exc_info=task.exception())
+
+
+def _product(row):
+    """Encode a Product.projection() row exactly as Product.to_dict does."""
+    product = row._asdict()
+    product['price'] = float(product['price'])
+    return product
+
+
+if WsgiToAsgi is not None:
+    class PooledWsgiToAsgi(WsgiToAsgi):
+        """asgiref's WSGI adapter, running each request on executor.
+
+        WsgiToAsgiInstance.run_wsgi_app is a thread-sensitive sync_to_async,
+        which runs every request on the same thread.
+        """
+
+        def __init__(self, wsgi_application, executor):
+            super().__init__(wsgi_application)
+            self.executor = executor
+
+        async def __call__(self, scope, receive, send):
+            instance = WsgiToAsgiInstance(self.wsgi_application)
+            run = sync_to_async(WsgiToAsgiInstance.run_wsgi_app.__wrapped__,
+                                thread_sensitive=False, executor=self.executor)
+            instance.run_wsgi_app = lambda body: run(instance, body)
+            await instance(scope, receive, send)
+
+
+class AsyncReadApp:
+    """ASGI app: async catalog and order-history reads, everything else via Flask."""
+
+    def __init__(self, flask_app):
+        if create_async_engine is None:
+            raise RuntimeError('The async read path needs greenlet: pip install "sqlalchemy[asyncio]"')
+        if WsgiToAsgi is None:
+            raise RuntimeError('The async read path needs asgiref: pip install asgiref')
+
+        config = flask_app.config
+        uri = async_database_uri(config)
+        self.flask_app = flask_app
+        self.executor = ThreadPoolExecutor(config.get('ASYNC_WSGI_THREADS', 32), thread_name_prefix='wsgi')
+        self.wsgi = PooledWsgiToAsgi(flask_app, self.executor)
+        self._index_build = None
+        self.dumps = flask_app.json.dumps
+        self.engine = create_async_engine(uri, **engine_options({
+            **config,
+            'DB_POOL_SIZE': config.get('ASYNC_DB_POOL_SIZE', 20),
+            'DB_MAX_OVERFLOW': config.get('ASYNC_DB_MAX_OVERFLOW', 10),
+            'SQLALCHEMY_ENGINE_OPTIONS': None,
+        }, uri))
+        origins = config.get('CORS_ORIGINS') or ''
+        self.cors_origins = {origin.strip() for origin in origins.split(',') if origin.strip()}
+        self.trusted_proxies = config.get('TRUSTED_PROXIES', 0)
+        self.admission = flask_app.extensions.get('admission')
+        if self.admission is not None:
+            self.admission.build_async_limits(config.get('ASYNC_DB_POOL_SIZE', 20)
+                                              + config.get('ASYNC_DB_MAX_OVERFLOW', 10))
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] == 'lifespan':
+            return await self._lifespan(receive, send)
+        if scope['type'] == 'http' and scope['method'] == 'GET':
+            for pattern, name, endpoint, catalog in ROUTES:
+                match = pattern.fullmatch(scope['path'])
+                if match:
+                    if await self._admit_and_serve(scope, send, name, endpoint, catalog, match.groups()):
+                        return
+                    break
+        return await self.wsgi(scope, receive, send)
+
+    async def _lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message['type'] == 'lifespan.startup':
+                try:
+                    await self._build_search_index()
+                except Exception as exc:
+                    logger.exception('Async read path failed to start')
+                    await send({'type': 'lifespan.startup.failed', 'message': str(exc)})
+                    return
+                await send({'type': 'lifespan.startup.complete'})
+            elif message['type'] == 'lifespan.shutdown':
+                await self.engine.dispose()
+                self.executor.shutdown(wait=False)
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
+
+    async def _build_search_index(self):
+        """Fetch the products on the loop, then index them on a thread so the loop keeps serving."""
+        async with self.engine.connect() as conn:
+            rows = (await conn.execute(select(Product.product_id, Product.name, Product.description))).all()
+        await asyncio.get_running_loop().run_in_executor(None, search_index.build, rows)
+
+    def _refresh_search_index(self):
+        """Start a rebuild of the stale search index unless one is running, and return it."""
+        if self._index_build is None or self._index_build.done():
+            self._index_build = asyncio.ensure_future(self._build_search_index())
+            self._index_build.add_done_callback(_log_index_failure)
+        return self._index_build
+
+    async def _admit_and_serve(self, scope, send, name, endpoint, catalog, params):
+        """Apply admission control, then answer one request. Returns False to hand it to Flask instead."""
+        query_string = scope['query_string'].decode('latin-1')
+        args = MultiDict(parse_qsl(query_string, keep_blank_values=True))
+        if 'stream' in args:
+            return False  # Flask streams listings, and admits them itself
+        headers = {}
+        for key, value in scope['headers']:
+            key = key.decode('latin-1').lower()
+            value = value.decode('latin-1')
+            headers[key] = f'{headers[key]}, {value}' if key in headers else value
+
+        response_headers = [('Content-Type', 'application/json')]
+        origin = headers.get('origin')
+        if origin and ('*' in self.cors_origins or origin in self.cors_origins):
+            response_headers += [('Access-Control-Allow-Origin', origin), ('Vary', 'Origin'),
+                                 ('Access-Control-Expose-Headers', 'X-Next-Cursor')]
+
+        if self.admission is None:
+            return await self._serve(scope, send, name, catalog, params, args, headers, response_headers)
+
+        route_class = self.admission.route_class(endpoint)
+        wait = await self._take_token(route_class, self._client(scope, headers))
+        if wait is not None:
+            await self._reject(send, route_class, 'rate_limited', 429, wait, 'Too many requests', response_headers)
+            return True
+        limit = self.admission.async_limits.get(route_class)
+        if limit is not None and not await limit.acquire(self.admission.queue_budget):
+            await self._reject(send, route_class, 'overloaded', 503, 1, 'Server is busy, retry shortly',
+                               response_headers)
+            return True
+        try:
+            return await self._serve(scope, send, name, catalog, params, args, headers, response_headers)
+        finally:
+            if limit is not None:
+                limit.release()
+
+    def _client(self, scope, headers):
+        """The rate limit client, as utils.auth and ProxyFix would identify it for Flask."""
+        user_id = None
+        authorization = headers.get('authorization', '')
+        if authorization.startswith('Bearer '):
+            with self.flask_app.app_context():
+                user_id = verify_token(authorization[7:])
+        remote_addr = scope['client'][0] if scope.get('client') else None
+        return client_key(user_id, client_address(remote_addr, headers.get('x-forwarded-for'),
+                                                  self.trusted_proxies))
+
+    async def _take_token(self, route_class, client):
+        if isinstance(self.admission.store, MemoryRateLimitStore):
+            return self.admission.take(route_class, client)
+        # A shared store is a network round trip; keep it off the loop
+        return await asyncio.get_running_loop().run_in_executor(
+            self.executor, self.admission.take, route_class, client)
+
+    async def _reject(self, send, route_class, reason, status, retry_after, message, response_headers):
+        self.admission.count_rejection(route_class, reason)
+        await self._send(send, status, (self.dumps({'error': message}) + '\n').encode(),
+                         response_headers + [('Retry-After', str(max(1, math.ceil(retry_after))))])
+
+    async def _serve(self, scope, send, name, catalog, params, args, headers, response_headers):
+        """Answer one admitted request. Returns False to hand it to Flask instead."""
+        query_string = scope['query_string'].decode('latin-1')
+        etag = matched = None
+        try:
+            async with self.engine.connect() as conn:
+                if catalog:
+                    version = tuple((await conn.execute(CATALOG_VERSION)).one())
+                    statements = product_cache.changes_since(version)
+                    if statements:
+                        changed, deleted = statements
+                        product_cache.apply_changes(await conn.execute(changed),
+                                                    (await conn.execute(deleted)).scalars())
+                    etag = catalog_etag(version, f"{scope['path']}?{query_string}")
+                    matched = matching_etag(etag, parse_etags(headers.get('if-none-match')))
+                if not matched:
+                    result = await getattr(self, name)(conn, args, *(int(param) for param in params))
+        except Exception:
+            logger.exception('Async read of %s failed', scope['path'])
+            etag = matched = None
+            result = 500, {'error': 'Internal server error'}
+
+        cache_headers = [('Cache-Control', f'public, max-age={HTTP_CATALOG_MAX_AGE}, must-revalidate')]
+        if matched:
+            await self._send(send, 304, b'', response_headers + [('ETag', f'"{matched}"')] + cache_headers)
+            return True
+        if result is None:
+            return False
+
+        status, body, *extra = result
+        if extra:
+            response_headers += list(extra[0].items())
+        if status == 200 and etag:
+            response_headers += [('ETag', f'"{etag}"')] + cache_headers
+        await self._send(send, status, (self.dumps(body) + '\n').encode(), response_headers)
+        return True
+
+    @staticmethod
+    async def _send(send, status, body, headers):
+        headers = headers + [('Content-Length', str(len(body)))]
+        await send({
+            'type': 'http.response.start',
+            'status': status,
+            'headers': [(key.encode('latin-1'), value.encode('latin-1')) for key, value in headers],
+        })
+        await send({'type': 'http.response.body', 'body': body})
+
+    # --- Shared helpers -----------------------------------------------------
+
+    @staticmethod
+    def _unpaged(items, key):
+        """The async counterpart of utils.pagination.unpaged_response."""
+        if len(items) > UNPAGED_LIMIT:
+            items = items[:UNPAGED_LIMIT]
+            return 200, items, {'X-Next-Cursor': str(items[-1][key])}
+        return 200, items
+
+    async def _cached_list(self, conn, name, stmt):
+        products = product_cache.cached_list(name)
+        if products is None:
+            stmt = stmt.order_by(Product.product_id).limit(UNPAGED_LIMIT + 1)
+            products = [row._asdict() for row in await conn.execute(stmt)]
+            product_cache.cache_list(name, products)
+        return self._unpaged(products, 'product_id')
+
+    @staticmethod
+    async def _encode_products(conn, rows):
+        return [row._asdict() for row in rows]
+
+    @staticmethod
+    async def _encode_orders(conn, rows):
+        orders = [row._asdict() for row in rows]
+        if not orders:
+            return orders
+        lines = await conn.execute(Order.items_statement([order['order_id'] for order in orders]))
+        return Order.attach_items(orders, lines)
+
+    async def _paginated(self, conn, stmt, key_column, args, encode):
+        """The async counterpart of utils.pagination.paginated_response, minus streaming."""
+        try:
+            limit, cursor, stream = parse_page_args(args)
+        except ValueError as e:
+            return 400, {'error': str(e)}
+        if stream:
+            return None  # Flask streams the batches
+
+        if limit is None and cursor is None:
+            rows = (await conn.execute(stmt.order_by(key_column).limit(UNPAGED_LIMIT + 1))).all()
+            return self._unpaged(await encode(conn, rows), key_column.key)
+
+        stmt = stmt.order_by(key_column)
+        if cursor is not None:
+            stmt = stmt.where(key_column > cursor)
+        limit = limit or DEFAULT_PAGE_SIZE
+        rows = (await conn.execute(stmt.limit(limit + 1))).all()
+        has_more = len(rows) > limit
+        rows = rows[:limit]
+        return 200, {
+            'items': await encode(conn, rows),
+            'next_cursor': getattr(rows[-1], key_column.key) if has_more else None,
+        }
+
+    # --- Routes -------------------------------------------------------------
+
+    async def products(self, conn, args):
+        if 'ids' in args:
+            return await self._products_by_ids(conn, args['ids'])
+        if is_filter_request(args):
+            try:
+                filters = parse_filters(args)
+            except ValueError as exc:
+                return 400, {'error': str(exc)}
+            products = [row._asdict() for row in await conn.execute(page_statement(filters))]
+            total, facets = build_facets(filters, await conn.execute(facet_statement(filters)))
+            return 200, {'products': products, 'total': total, 'facets': facets}
+        stmt = select(*Product.projection())
+        if not args:
+            return await self._cached_list(conn, 'all', stmt)
+        return await self._paginated(conn, stmt, Product.product_id, args, self._encode_products)
+
+    async def _products_by_ids(self, conn, raw_ids):
+        try:
+            product_ids = parse_product_ids(raw_ids)
+        except ValueError as e:
+            return 400, {'error': str(e)}
+
+        found = {}
+        misses = []
+        for product_id in product_ids:
+            product = product_cache.cached_product(product_id)
+            if product is None:
+                misses.append(product_id)
+            else:
+                found[product_id] = product
+        if misses:
+            rows = await conn.execute(select(*Product.projection()).where(Product.product_id.in_(misses)))
+            for row in rows:
+                found[row.product_id] = _product(row)
+                product_cache.cache_product(found[row.product_id])
+
+        return 200, {
+            'products': [found[pid] for pid in product_ids if pid in found],
+            'missing': [pid for pid in product_ids if pid not in found]
+        }
+
+    async def products_by_categories(self, conn, args):
+        categories = args.get('categories', '').split(',')
+        if not categories or categories[0] == '':
+            return 400, {'error': 'No categories provided'}
+
+        stmt = select(*Product.projection()).where(Product.category.in_(categories))
+        if set(args) == {'categories'}:
+            key = ('categories',) + tuple(sorted(set(categories)))
+            return await self._cached_list(conn, key, stmt)
+        return await self._paginated(conn, stmt, Product.product_id, args, self._encode_products)
+
+    async def search_products(self, conn, args):
+        query = args.get('q', '').strip()
+        if not query:
+            return 400, {'error': 'No search query provided'}
+        try:
+            limit = parse_search_limit(args)
+        except ValueError as e:
+            return 400, {'error': str(e)}
+
+        if search_index.stale:
+            # Only the first build holds up searches; later ones swap in when done
+            build = self._refresh_search_index()
+            if not search_index.built:
+                await asyncio.shield(build)
+        product_ids = search_index.search(query, limit=limit)
+        if not product_ids:
+            return 200, []
+
+        rows = await conn.execute(select(*Product.projection()).where(Product.product_id.in_(product_ids)))
+        products = {row.product_id: _product(row) for row in rows}
+        return 200, [products[pid] for pid in product_ids if pid in products]
+
+    async def product(self, conn, args, product_id):
+        product = product_cache.cached_product(product_id)
+        if product is None:
+            row = (await conn.execute(
+                select(*Product.projection()).where(Product.product_id == product_id))).first()
+            if row is None:
+                return 404, {'error': 'Product not found'}
+            product = _product(row)
+            product_cache.cache_product(product)
+        return 200, product
+
+    async def order(self, conn, args, order_id):
+        rows = (await conn.execute(select(*Order.projection()).where(Order.order_id == order_id))).all()
+        if not rows:
+            return 404, {'error': 'Order not found'}
+        return 200, (await self._encode_orders(conn, rows))[0]
+
+    async def orders_by_user(self, conn, args, user_id):
+        stmt = select(*Order.projection()).where(Order.user_id == user_id)
+        return await self._paginated(conn, stmt, Order.order_id, args, self._encode_orders)
@@ -0,0 +1,102 @@
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from flask import current_app, g, request
+from itsdangerous import URLSafeTimedSerializer, BadSignature, SignatureExpired
+from werkzeug.security import generate_password_hash, check_password_hash
+from config import (AUTH_TOKEN_TTL, PASSWORD_HASH_METHOD, PASSWORD_HASH_WORKERS,
+                    PASSWORD_HASH_QUEUE, USER_CACHE_SIZE, USER_CACHE_TTL)
+from utils.product_cache import LRUCache
+
+TOKEN_SALT = 'auth-token'
+
+
+# --- Signed tokens ----------------------------------------------------------
+
+def _serializer():
+    return URLSafeTimedSerializer(current_app.config['SECRET_KEY'], salt=TOKEN_SALT)
+
+
+def issue_token(user_id):
+    """Return an HMAC-signed, timestamped token carrying user_id."""
+    return _serializer().dumps({'user_id': user_id})
+
+
+def verify_token(token, max_age=AUTH_TOKEN_TTL):
+    """Return the user_id in token, or None if it is invalid or expired."""
+    try:
+        payload = _serializer().loads(token, max_age=max_age)
+    except (SignatureExpired, BadSignature):
+        return None
+    return payload.get('user_id')
+
+
+def _load_token_user():
+    header = request.headers.get('Authorization', '')
+    g.user_id = verify_token(header[7:]) if header.startswith('Bearer ') else None
+
+
+def init_auth(app):
+    """Verify the bearer token, if any, on every request and expose it as g.user_id.
+
+    Idempotency keys and per-user rate limits are scoped by g.user_id.
+    Outside DEBUG and TESTING, SECRET_KEY must be set: a default key
+    would let anyone sign tokens.
+    """
+    if not app.config.get('SECRET_KEY') and not (app.debug or app.testing):
+        raise RuntimeError('SECRET_KEY must be set to sign auth tokens')
+    app.before_request(_load_token_user)
+
+
+# --- Password hashing -------------------------------------------------------
+
+class PasswordPoolBusy(Exception):
+    """Raised when too many password hashes are already queued."""
+
+
+_executor = ThreadPoolExecutor(max_workers=PASSWORD_HASH_WORKERS, thread_name_prefix='password-hash')
+_slots = threading.BoundedSemaphore(PASSWORD_HASH_WORKERS + PASSWORD_HASH_QUEUE)
+
+
+def _run_bounded(fn, *args):
+    # hashlib's pbkdf2/scrypt release the GIL, so hashing on the pool lets
+    # other request threads keep running; the semaphore caps the backlog.
+    if not _slots.acquire(blocking=False):
+        raise PasswordPoolBusy()
+    try:
+        return _executor.submit(fn, *args).result()
+    finally:
+        _slots.release()
+
+
+def hash_password(password):
+    return _run_bounded(generate_password_hash, password, PASSWORD_HASH_METHOD)
+
+
+def verify_password(password_hash, password):
+    return _run_bounded(check_password_hash, password_hash, password)
+
+
+# --- Email lookup cache -----------------------------------------------------
+
+user_cache = LRUCache(USER_CACHE_SIZE, USER_CACHE_TTL)
+
+
+def find_user_by_email(email):
+    """Return {'user_id', 'password', 'user'} for email, or None.
+
+    'user' is the to_dict() form; results are cached per email.
+    """
+    entry = user_cache.get(email)
+    if entry is None:
+        from models.user import User
+        user = User.query.filter_by(email=email).first()
+        if user is None:
+            return None
+        entry = {'user_id': user.user_id, 'password': user.password, 'user': user.to_dict()}
+        user_cache.set(email, entry)
+    return entry
+
+
+def forget_user(*emails):
+    for email in emails:
+        user_cache.delete(email)
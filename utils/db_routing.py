@@ -0,0 +1,135 @@
+import itertools
+import logging
+import threading
+import time
+from flask import current_app, g, has_app_context, has_request_context, request
+from flask_sqlalchemy.session import Session
+from sqlalchemy import text
+from sqlalchemy.sql.dml import UpdateBase
+
+logger = logging.getLogger(__name__)
+
+READ_METHODS = ('GET', 'HEAD', 'OPTIONS')
+
+
+class ReplicaRouter:
+    """Chooses a replica engine for read-only work.
+
+    Replicas whose measured lag exceeds max_lag (or whose lag check fails)
+    are skipped until the next check; when none are usable, reads fall
+    back to the primary.
+    """
+
+    def __init__(self, bind_keys, strategy='round_robin', max_lag=None, check_interval=5):
+        self.bind_keys = list(bind_keys)
+        self.strategy = strategy
+        self.max_lag = max_lag
+        self.check_interval = check_interval
+        self._cycle = itertools.cycle(self.bind_keys)
+        self._lag = {}         # bind key -> (checked_at, lag seconds or None)
+        self._checking = set() # bind keys whose lag a thread is measuring now
+        self._lock = threading.Lock()
+
+    def pick(self, engines):
+        """Return a healthy replica engine, or None to use the primary."""
+        candidates = [key for key in self.bind_keys if self._healthy(key, engines[key])]
+        if not candidates:
+            return None
+
+        if self.strategy == 'least_connections':
+            key = min(candidates, key=lambda k: _checked_out(engines[k]))
+        else:
+            with self._lock:
+                for _ in range(len(self.bind_keys)):
+                    key = next(self._cycle)
+                    if key in candidates:
+                        break
+        return engines[key]
+
+    def _healthy(self, key, engine):
+        if self.max_lag is None:
+            return True
+
+        lag = self._current_lag(key, engine)
+        return lag is not None and lag <= self.max_lag
+
+    def _current_lag(self, key, engine):
+        """The replica's last measured lag, re-measured by one thread every check_interval.
+
+        Other threads use the previous measurement meanwhile, so concurrent
+        requests never pile up lag queries on a replica.
+        """
+        with self._lock:
+            checked_at, lag = self._lag.get(key, (None, None))
+            if checked_at is not None and time.monotonic() - checked_at < self.check_interval:
+                return lag
+            if key in self._checking:
+                return lag
+            self._checking.add(key)
+        try:
+            lag = replica_lag(engine)
+        finally:
+            with self._lock:
+                self._lag[key] = (time.monotonic(), lag)
+                self._checking.discard(key)
+        return lag
+
+
+def _checked_out(engine):
+    checkedout = getattr(engine.pool, 'checkedout', None)
+    return checkedout() if checkedout else 0
+
+
+def replica_lag(engine):
+    """Seconds the replica is behind its primary; None if unknown or not replicating."""
+    if engine.dialect.name != 'mysql':
+        return 0
+    try:
+        with engine.connect() as conn:
+            row = conn.execute(text('SHOW REPLICA STATUS')).mappings().first()
+    except Exception:
+        logger.warning('Replica lag check failed for %s', engine.url, exc_info=True)
+        return None
+    if row is None:
+        return None
+    lag = row.get('Seconds_Behind_Source')
+    return None if lag is None else float(lag)
+
+
+def use_primary():
+    """Send every remaining query of the current request to the primary."""
+    if has_request_context():
+        g.db_use_primary = True
+
+
+class RoutingSession(Session):
+    """Session that routes reads in read-only requests to replica binds.
+
+    A request is eligible for replicas when its method is GET/HEAD/OPTIONS.
+    Flushes and INSERT/UPDATE/DELETE statements always go to the primary,
+    and once a request has written, its later reads go there too so it
+    sees its own writes. Work outside a request uses the primary.
+    """
+
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        primary = super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
+        if bind is not None or not has_app_context():
+            return primary
+
+        router = current_app.extensions.get('db_router')
+        if router is None or not has_request_context():
+            return primary
+
+        # Models with their own bind key are never rerouted
+        engines = self._db.engines
+        if primary is not engines.get(None):
+            return primary
+
+        if self._flushing or isinstance(clause, UpdateBase):
+            g.db_use_primary = True
+            return primary
+
+        if request.method not in READ_METHODS or g.get('db_use_primary'):
+            return primary
+
+        return router.pick(engines) or primary
@@ -0,0 +1,605 @@
+"""Flash-sale mode: sell flagged products from an in-memory reservation ledger.
+
+A normal checkout decrements product.stock with a row-locking UPDATE
+(utils/stock.py), so a hot product sells one order at a time. With
+FLASH_SALE_MODE on, products flagged flash_sale are sold differently:
+
+1. Allocation. Each serving process takes stock from product.stock in
+   blocks of FLASH_SALE_ALLOCATION units and records them in
+   flash_sale_allocation in the same transaction. That is the only write
+   to the hot row: once per block instead of once per order.
+2. Reservation. A checkout takes units from its process's allocation in
+   memory, under one of FLASH_SALE_SHARDS locks. A process only sells
+   units it already took from the database, so nothing is oversold.
+3. Write-behind. The order row is written as usual. Its flash-sale lines
+   are queued, and a flusher thread writes them to order_product every
+   FLASH_SALE_FLUSH_INTERVAL seconds, many orders per transaction. The
+   same transaction takes the sold units off the allocation row.
+4. Recovery. Before an order commits, its lines are appended to the
+   process's reservation log. When a process dies, the next one to start
+   on the host replays its log, as does 'flask --app app
+   flash-sale-reconcile'. Lines of committed orders that never reached
+   order_product are written. The rest of the dead process's allocation
+   goes back to product.stock.
+
+While a sale runs, product.stock shows only unallocated units. Unsold
+stock is product.stock plus the product's flash_sale_allocation rows.
+Setting product.stock outright is refused while any units are allocated.
+
+Near the end of a sale, the last units can be spread over several
+processes. A checkout can then be refused while another process still
+holds a few units. Those units return to product.stock when the product
+is unflagged or the process stops.
+
+An order's flash-sale lines reach order_product up to one flush interval
+after the order. Cancelling the order within that window does not
+restock them.
+"""
+import atexit
+import json
+import logging
+import os
+import socket
+import threading
+import time
+import uuid
+from glob import glob
+from sqlalchemy import case, delete, select, update
+from config import (FLASH_SALE_ALLOCATION, FLASH_SALE_SHARDS, FLASH_SALE_FLUSH_INTERVAL, FLASH_SALE_FLUSH_BATCH,
+                    FLASH_SALE_REFRESH_INTERVAL, FLASH_SALE_LOG_DIR, FLASH_SALE_LOG_FSYNC, FLASH_SALE_LOG_MAX_BYTES)
+from database import db
+from utils.db_routing import use_primary
+from models.flash_sale import FlashSaleAllocation
+from models.order import Order
+from models.order_product import OrderProduct
+from models.product import Product
+from utils.product_cache import product_cache
+from utils.stock import release_stock
+
+try:
+    import fcntl
+except ImportError:  # not on Windows; dead processes' logs are then never recovered automatically
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+# Attempts to take stock from product.stock when a concurrent change wins the race
+MAX_ALLOCATE_ATTEMPTS = 3
+
+
+# --- Reservation log ----------------------------------------------------------
+
+class ReservationLog:
+    """Append-only JSON-lines log of one process's reservations.
+
+    Records are {'op': 'reserve', 'order_id', 'lines': [[product_id, qty], ...]},
+    {'op': 'cancel', 'order_id'} and {'op': 'flushed', 'order_ids'}. The
+    owning process holds an exclusive flock on the file for its lifetime,
+    which is how recovery tells a dead process's log from a live one.
+    """
+
+    def __init__(self, directory, owner, fsync=FLASH_SALE_LOG_FSYNC):
+        os.makedirs(directory, exist_ok=True)
+        self.path = os.path.join(directory, f'{owner}.log')
+        self.fsync = fsync
+        self._file = open(self.path, 'a', encoding='utf-8')
+        if fcntl is not None:
+            fcntl.flock(self._file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        self._lock = threading.Lock()
+
+    def append(self, record):
+        line = json.dumps(record, separators=(',', ':')) + '\n'
+        with self._lock:
+            self._file.write(line)
+            # Written through to the OS, so the record survives the process
+            # crashing; fsync as well to survive the host crashing.
+            self._file.flush()
+            if self.fsync:
+                os.fsync(self._file.fileno())
+
+    def size(self):
+        with self._lock:
+            return self._file.tell()
+
+    def truncate(self):
+        with self._lock:
+            self._file.truncate(0)
+            self._file.seek(0)
+
+    def close(self, remove=False):
+        with self._lock:
+            self._file.close()
+        if remove:
+            os.remove(self.path)
+
+    @staticmethod
+    def outstanding(lines):
+        """{order_id: lines} reserved in the log and neither cancelled nor flushed."""
+        pending = {}
+        for line in lines:
+            if not line.endswith('\n'):
+                break  # torn final write: the order it describes never committed
+            record = json.loads(line)
+            if record['op'] == 'reserve':
+                pending[record['order_id']] = record['lines']
+            elif record['op'] == 'cancel':
+                pending.pop(record['order_id'], None)
+            elif record['op'] == 'flushed':
+                for order_id in record['order_ids']:
+                    pending.pop(order_id, None)
+        return pending
+
+
+# --- Database side ----------------------------------------------------------
+
+def _write_lines(orders):
+    """Insert the order_product rows of orders ({order_id: [[product_id, qty], ...]}).
+
+    Orders or products deleted since, and lines already written, are
+    skipped. Returns {product_id: units} of the rows inserted.
+    """
+    order_ids = list(orders)
+    product_ids = {product_id for lines in orders.values() for product_id, _ in lines}
+    existing_orders = {row.order_id for row in
+                       db.session.execute(select(Order.order_id).where(Order.order_id.in_(order_ids)))}
+    prices = dict(db.session.execute(
+        select(Product.product_id, Product.price).where(Product.product_id.in_(product_ids))
+    ).tuples().all())
+    written = set(db.session.execute(
+        select(OrderProduct.order_id, OrderProduct.product_id).where(OrderProduct.order_id.in_(order_ids))
+    ).tuples())
+
+    rows = []
+    inserted = {}
+    for order_id, lines in orders.items():
+        if order_id not in existing_orders:
+            continue
+        for product_id, quantity in lines:
+            if product_id in prices and (order_id, product_id) not in written:
+                rows.append({'order_id': order_id, 'product_id': product_id, 'quantity': quantity,
+                             'unit_price': prices[product_id]})
+                inserted[product_id] = inserted.get(product_id, 0) + quantity
+    if rows:
+        db.session.execute(OrderProduct.__table__.insert(), rows)
+    return inserted
+
+
+def _take_from_allocation(owner, quantities):
+    quantities = dict(sorted(quantities.items()))
+    if not quantities:
+        return
+    taken = case(quantities, value=FlashSaleAllocation.product_id)
+    db.session.execute(
+        update(FlashSaleAllocation)
+        .where(FlashSaleAllocation.owner == owner, FlashSaleAllocation.product_id.in_(list(quantities)))
+        .values(quantity=FlashSaleAllocation.quantity - taken)
+        .execution_options(synchronize_session=False)
+    )
+
+
+def recover_owner(owner, pending):
+    """Settle a dead process's allocation, given its outstanding log records.
+
+    Writes the order lines it never flushed and returns every unsold unit
+    it held to product.stock. Returns {product_id: units restocked}.
+    """
+    allocated = {row.product_id: row.quantity for row in db.session.execute(
+        select(FlashSaleAllocation.product_id, FlashSaleAllocation.quantity)
+        .where(FlashSaleAllocation.owner == owner))}
+    sold = _write_lines(pending) if pending else {}
+
+    restock = {}
+    for product_id, quantity in allocated.items():
+        unsold = quantity - sold.get(product_id, 0)
+        if unsold < 0:
+            logger.warning('Flash-sale owner %s sold %d more units of product %s than it held',
+                           owner, -unsold, product_id)
+        elif unsold:
+            restock[product_id] = unsold
+    release_stock(restock)
+    db.session.execute(delete(FlashSaleAllocation).where(FlashSaleAllocation.owner == owner))
+    db.session.commit()
+    if restock:
+        product_cache.stock_changed(*restock)
+    logger.info('Recovered flash-sale owner %s: wrote lines for %d orders, restocked %s',
+                owner, len(pending), restock)
+    return restock
+
+
+def recover(log_dir=FLASH_SALE_LOG_DIR):
+    """Recover every process on this host that died holding flash-sale stock.
+
+    A log nobody holds a lock on belongs to a dead process. Allocations
+    of this host's processes that have no log at all (the log was lost)
+    are returned to stock in full. Returns {owner: restocked units}.
+    """
+    if fcntl is None:
+        return {}
+    recovered = {}
+    for path in sorted(glob(os.path.join(log_dir, '*.log'))):
+        owner = os.path.basename(path)[:-len('.log')]
+        with open(path, 'r', encoding='utf-8') as f:
+            try:
+                fcntl.flock(f, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                continue  # owner is alive
+            recovered[owner] = recover_owner(owner, ReservationLog.outstanding(f))
+            os.remove(path)
+
+    live = {os.path.basename(path)[:-len('.log')] for path in glob(os.path.join(log_dir, '*.log'))}
+    orphans = db.session.execute(
+        select(FlashSaleAllocation.owner).distinct()
+        .where(FlashSaleAllocation.owner.like(f'{_host()}-%'))).scalars()
+    for owner in set(orphans) - live - set(recovered):
+        recovered[owner] = recover_owner(owner, {})
+    return recovered
+
+
+def _host():
+    return socket.gethostname()[:40]
+
+
+# Why held_products rejects an absolute stock write
+STOCK_HELD_ERROR = 'Stock is held by a running flash sale; unflag the product and let the sale hand it back first'
+
+
+def held_products(product_ids):
+    """The product_ids that flash-sale processes hold allocated units of.
+
+    product.stock leaves those units out, and the sale later takes sold
+    units off the allocation and hands unsold ones back to product.stock
+    as deltas. An absolute stock write while units are held would be
+    oversold or inflated by them, so callers reject it. Lock the product
+    rows first so no allocation slips in between.
+    """
+    if not product_ids:
+        return set()
+    return set(db.session.execute(
+        select(FlashSaleAllocation.product_id).distinct()
+        .where(FlashSaleAllocation.product_id.in_(list(product_ids)), FlashSaleAllocation.quantity > 0)
+    ).scalars())
+
+
+# --- Ledger -----------------------------------------------------------------
+
+class Reservation:
+    """Units of flagged products held for one checkout until confirm or cancel."""
+
+    def __init__(self, ledger, quantities):
+        self.ledger = ledger
+        self.quantities = quantities
+        self.order_id = None
+        self.state = 'held'
+
+    def record(self, order_id):
+        """Log the order's lines. Call after the order row is flushed and before it commits."""
+        self.order_id = order_id
+        self.ledger._record(order_id, self.quantities)
+
+    def confirm(self):
+        """The order committed: queue its lines for the write-behind flush."""
+        if self.state == 'held':
+            self.state = 'confirmed'
+            self.ledger._confirm(self.order_id, self.quantities)
+
+    def cancel(self):
+        """The order did not commit: give the units back to the ledger."""
+        if self.state == 'held':
+            self.state = 'cancelled'
+            self.ledger._cancel(self.order_id, self.quantities)
+
+    def items(self):
+        """The reserved lines in Order.to_dict()'s item format."""
+        items = []
+        for product_id, quantity in self.quantities.items():
+            product = product_cache.get_product(product_id)
+            if product:
+                items.append({'product_id': product_id, 'quantity': quantity,
+                              'price': product['price'], 'product_name': product['name']})
+        return items
+
+
+class _Allocation:
+    """A block of stock one checkout is taking from the database for the others short of it."""
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.units = 0
+
+
+class FlashSaleLedger:
+    """Per-process stock of the flagged products and the write-behind flusher.
+
+    The ledger starts on the first request a process serves, never while
+    the app is being created. So a gunicorn master holds no stock, and
+    every forked worker gets its own owner name, log and flusher thread.
+    """
+
+    def __init__(self, app, allocation=FLASH_SALE_ALLOCATION, shards=FLASH_SALE_SHARDS,
+                 flush_interval=FLASH_SALE_FLUSH_INTERVAL, flush_batch=FLASH_SALE_FLUSH_BATCH,
+                 refresh_interval=FLASH_SALE_REFRESH_INTERVAL, log_dir=FLASH_SALE_LOG_DIR):
+        self.app = app
+        self.allocation = allocation
+        self.flush_interval = flush_interval
+        self.flush_batch = flush_batch
+        self.refresh_interval = refresh_interval
+        self.log_dir = log_dir
+        self.owner = None
+        self.log = None
+        self._shards = [threading.Lock() for _ in range(shards)]
+        self._available = {}  # product_id -> units held by this process and not reserved
+        self._allocations = {}  # product_id -> _Allocation being taken from the database
+        self._names = {}
+        self._flagged = frozenset()
+        self._refreshed_at = 0.0
+        self._pending = []  # (order_id, {product_id: quantity}) committed, not yet flushed
+        self._outstanding = 0  # logged orders not yet confirmed or cancelled
+        self._pending_lock = threading.Lock()
+        self._start_lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+        self._pid = None
+
+    # Lifecycle
+
+    def ensure_started(self):
+        if self._pid == os.getpid():
+            return
+        with self._start_lock:
+            if self._pid == os.getpid():
+                return
+            self.owner = f'{_host()}-{os.getpid()}-{uuid.uuid4().hex[:8]}'
+            self.log = ReservationLog(self.log_dir, self.owner)
+            self._available = {}
+            self._pending = []
+            self._outstanding = 0
+            with self.app.app_context():
+                # Started by whichever request comes first, often a GET that
+                # would read a replica; the allocations must come from the primary
+                use_primary()
+                recover(self.log_dir)
+                self.refresh()
+            self._stop = threading.Event()
+            self._thread = threading.Thread(target=self._loop, name='flash-sale-flusher', daemon=True)
+            self._thread.start()
+            self._pid = os.getpid()
+            atexit.register(self.stop)
+            logger.info('Flash-sale ledger %s started', self.owner)
+
+    def stop(self):
+        """Flush every queued order, hand unsold stock back and remove the log."""
+        if self._pid != os.getpid():
+            return
+        self._stop.set()
+        self._thread.join()
+        with self.app.app_context():
+            while self.flush():
+                pass
+            self.release()
+            db.session.execute(delete(FlashSaleAllocation).where(
+                FlashSaleAllocation.owner == self.owner, FlashSaleAllocation.quantity == 0))
+            db.session.commit()
+        self.log.close(remove=not self._pending and not self._outstanding)
+        self._pid = None
+
+    def _loop(self):
+        while not self._stop.wait(self.flush_interval):
+            with self.app.app_context():
+                try:
+                    while self.flush() == self.flush_batch:
+                        pass
+                    if time.monotonic() - self._refreshed_at >= self.refresh_interval:
+                        self.refresh()
+                except Exception:
+                    db.session.rollback()
+                    logger.exception('Flash-sale flush failed; retrying')
+
+    # Flagged products
+
+    def refresh(self):
+        """Re-read which products are flagged; hand back the stock of unflagged ones."""
+        flagged = frozenset(db.session.execute(
+            select(Product.product_id).where(Product.flash_sale.is_(True))).scalars())
+        self._flagged = flagged
+        self._refreshed_at = time.monotonic()
+        dropped = [product_id for product_id in self._available if product_id not in flagged]
+        if dropped:
+            self.release(dropped)
+
+    def flagged(self, quantities):
+        """The subset of quantities ({product_id: quantity}) sold through the ledger."""
+        return {product_id: quantity for product_id, quantity in quantities.items()
+                if product_id in self._flagged}
+
+    # Checkout
+
+    def reserve(self, quantities):
+        """Hold quantities ({product_id: quantity} of flagged products) for one checkout.
+
+        Returns (reservation, shortfalls) with shortfalls in
+        utils.stock.reserve_stock's format. Either every line is held, or
+        none is and reservation is None.
+        """
+        taken = {}
+        for product_id, quantity in sorted(quantities.items()):
+            reserved, available = self._take(product_id, quantity)
+            if reserved:
+                taken[product_id] = quantity
+                continue
+            self._put_back(taken)
+            name = self._names.get(product_id)
+            return None, [{'product_id': product_id, 'name': name,
+                           'available': available if name is not None else None, 'requested': quantity}]
+        return Reservation(self, taken), []
+
+    def _shard(self, product_id):
+        return self._shards[product_id % len(self._shards)]
+
+    def _take(self, product_id, quantity):
+        """Take quantity units of product_id from this process's stock. Returns (taken, units available).
+
+        When the process is short, one checkout takes a block from the
+        database while the others short of the same product wait for it.
+        The shard lock is never held across that round trip, so checkouts
+        of other products on the shard keep going; the block is published
+        under the lock once it is committed.
+        """
+        while True:
+            with self._shard(product_id):
+                available = self._available.get(product_id, 0)
+                if available >= quantity:
+                    self._available[product_id] = available - quantity
+                    return True, available
+                allocation = self._allocations.get(product_id)
+                if allocation is None:
+                    allocation = self._allocations[product_id] = _Allocation()
+                    break
+            allocation.done.wait()
+            if not allocation.units:
+                # The database had nothing left for that checkout either
+                with self._shard(product_id):
+                    available = self._available.get(product_id, 0)
+                    if available >= quantity:
+                        self._available[product_id] = available - quantity
+                        return True, available
+                return False, available
+
+        try:
+            allocation.units = self._allocate(product_id, quantity - available)
+        finally:
+            with self._shard(product_id):
+                del self._allocations[product_id]
+                available = self._available.get(product_id, 0) + allocation.units
+                reserved = available >= quantity
+                self._available[product_id] = available - quantity if reserved else available
+            allocation.done.set()
+        return reserved, available
+
+    def _put_back(self, quantities):
+        for product_id, quantity in quantities.items():
+            with self._shard(product_id):
+                self._available[product_id] = self._available.get(product_id, 0) + quantity
+
+    def _allocate(self, product_id, needed):
+        """Move up to max(needed, allocation) units from product.stock to this process.
+
+        Runs in its own transaction, committed before the checkout that
+        needed it, without any shard lock held. Returns the units moved.
+        """
+        wanted = max(needed, self.allocation)
+        with self.app.app_context():
+            for _ in range(MAX_ALLOCATE_ATTEMPTS):
+                row = db.session.execute(
+                    select(Product.name, Product.stock).where(Product.product_id == product_id)).first()
+                if row is None:
+                    return 0
+                self._names[product_id] = row.name
+                take = min(wanted, row.stock)
+                if take <= 0:
+                    db.session.rollback()
+                    return 0
+                moved = db.session.execute(
+                    update(Product)
+                    .where(Product.product_id == product_id, Product.stock >= take)
+                    .values(stock=Product.stock - take)
+                    .execution_options(synchronize_session=False)
+                ).rowcount
+                if not moved:
+                    db.session.rollback()
+                    continue
+                held = db.session.execute(
+                    update(FlashSaleAllocation)
+                    .where(FlashSaleAllocation.owner == self.owner, FlashSaleAllocation.product_id == product_id)
+                    .values(quantity=FlashSaleAllocation.quantity + take)
+                    .execution_options(synchronize_session=False)
+                ).rowcount
+                if not held:
+                    db.session.add(FlashSaleAllocation(owner=self.owner, product_id=product_id, quantity=take))
+                db.session.commit()
+                product_cache.stock_changed(product_id)
+                return take
+        return 0
+
+    def _record(self, order_id, quantities):
+        with self._pending_lock:
+            self._outstanding += 1
+            self.log.append({'op': 'reserve', 'order_id': order_id, 'lines': [list(line) for line in quantities.items()]})
+
+    def _confirm(self, order_id, quantities):
+        with self._pending_lock:
+            self._outstanding -= 1
+            self._pending.append((order_id, quantities))
+
+    def _cancel(self, order_id, quantities):
+        if order_id is not None:
+            with self._pending_lock:
+                self._outstanding -= 1
+                self.log.append({'op': 'cancel', 'order_id': order_id})
+        self._put_back(quantities)
+
+    # Write-behind
+
+    def flush(self):
+        """Write one batch of queued order lines and return how many orders it held."""
+        with self._pending_lock:
+            batch = self._pending[:self.flush_batch]
+            del self._pending[:self.flush_batch]
+            if not batch and not self._outstanding and self.log.size() > FLASH_SALE_LOG_MAX_BYTES:
+                self.log.truncate()
+        if not batch:
+            return 0
+
+        orders = {order_id: list(quantities.items()) for order_id, quantities in batch}
+        sold = {}
+        for _, quantities in batch:
+            for product_id, quantity in quantities.items():
+                sold[product_id] = sold.get(product_id, 0) + quantity
+        try:
+            _write_lines(orders)
+            _take_from_allocation(self.owner, sold)
+            db.session.commit()
+        except Exception:
+            db.session.rollback()
+            with self._pending_lock:
+                self._pending[:0] = batch
+            raise
+        self.log.append({'op': 'flushed', 'order_ids': list(orders)})
+        return len(batch)
+
+    def release(self, product_ids=None):
+        """Hand this process's unreserved units (of product_ids, default all) back to product.stock."""
+        released = {}
+        for product_id in list(self._available if product_ids is None else product_ids):
+            with self._shard(product_id):
+                units = self._available.pop(product_id, 0)
+            if units:
+                released[product_id] = units
+        if not released:
+            return
+        release_stock(released)
+        _take_from_allocation(self.owner, released)
+        db.session.commit()
+        product_cache.stock_changed(*released)
+
+    def stats(self):
+        with self._pending_lock:
+            pending = len(self._pending)
+        return {
+            'owner': self.owner,
+            'flagged': sorted(self._flagged),
+            'available': dict(self._available),
+            'pending_orders': pending,
+            'outstanding_orders': self._outstanding,
+        }
+
+
+def init_flash_sale(app):
+    """Sell flagged products through a FlashSaleLedger when FLASH_SALE_MODE is on."""
+    if not app.config.get('FLASH_SALE_MODE', False):
+        return
+    ledger = FlashSaleLedger(app)
+    app.extensions['flash_sale'] = ledger
+
+    @app.before_request
+    def start_flash_sale_ledger():
+        ledger.ensure_started()
@@ -0,0 +1,117 @@
+import gzip
+import hashlib
+from functools import wraps
+from flask import request, make_response
+from sqlalchemy import func, select
+from config import HTTP_CATALOG_MAX_AGE, COMPRESS_MIN_SIZE, COMPRESS_LEVEL
+from database import db
+from models.product import Product, ProductDeletion
+from utils.product_cache import product_cache
+
+try:
+    import brotli
+except ImportError:  # optional dependency; gzip is always available
+    brotli = None
+
+ENCODING_SUFFIXES = ('', '-gzip', '-br')
+
+
+# Latest product insert/update and latest deletion: changes with every catalog write
+CATALOG_VERSION = select(
+    select(func.max(Product.updated_at)).scalar_subquery(),
+    select(func.max(ProductDeletion.deletion_id)).scalar_subquery(),
+)
+
+
+def catalog_version():
+    """The catalog version, read from the database so every worker agrees on it.
+
+    The product cache is caught up with it first, so what the view serves
+    from the cache is no older than the ETag says.
+    """
+    version = tuple(db.session.execute(CATALOG_VERSION).one())
+    statements = product_cache.changes_since(version)
+    if statements:
+        changed, deleted = statements
+        product_cache.apply_changes(db.session.execute(changed), db.session.execute(deleted).scalars())
+    return version
+
+
+def catalog_etag(version, full_path=None):
+    """ETag for a catalog request (default: the current one), from the catalog version and the full path."""
+    full_path = request.full_path if full_path is None else full_path
+    key = f'{version}:{full_path}'
+    return hashlib.sha1(key.encode()).hexdigest()[:20]
+
+
+def matching_etag(etag, if_none_match):
+    """The variant of etag (identity or compressed) listed in if_none_match, or None."""
+    for suffix in ENCODING_SUFFIXES:
+        if etag + suffix in if_none_match:
+            return etag + suffix
+    return None
+
+
+def catalog_cached(view):
+    """Serve a catalog GET route with ETag/If-None-Match and Cache-Control.
+
+    A matching If-None-Match is answered with 304 before the view runs, so
+    revalidation costs one indexed catalog-version query. The 304 carries
+    the variant ETag the client sent. Every response varies on
+    Accept-Encoding, since these are public and compressed for clients
+    that accept it.
+    """
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        etag = catalog_etag(catalog_version())
+        cache_control = f'public, max-age={HTTP_CATALOG_MAX_AGE}, must-revalidate'
+
+        matched = matching_etag(etag, request.if_none_match)
+        if matched:
+            response = make_response('', 304)
+            etag = matched
+        else:
+            response = make_response(view(*args, **kwargs))
+            if response.status_code != 200:
+                return response
+
+        response.set_etag(etag)
+        response.headers['Cache-Control'] = cache_control
+        response.vary.add('Accept-Encoding')
+        return response
+
+    return wrapper
+
+
+def _compress(response):
+    if (response.status_code != 200 or response.direct_passthrough or response.is_streamed
+            or 'Content-Encoding' in response.headers):
+        return response
+
+    data = response.get_data()
+    if len(data) < COMPRESS_MIN_SIZE:
+        return response
+
+    # Whether or not this client gets it compressed, another could
+    response.vary.add('Accept-Encoding')
+    accepted = request.accept_encodings
+    if brotli is not None and accepted['br']:
+        encoding, body = 'br', brotli.compress(data)
+    elif accepted['gzip']:
+        encoding, body = 'gzip', gzip.compress(data, compresslevel=COMPRESS_LEVEL)
+    else:
+        return response
+
+    response.set_data(body)
+    response.headers['Content-Encoding'] = encoding
+
+    # The compressed body is a different representation; keep ETags distinct
+    etag, weak = response.get_etag()
+    if etag:
+        response.set_etag(f'{etag}-{encoding}', weak=weak)
+    return response
+
+
+def init_compression(app):
+    """Compress large non-streamed responses for clients that accept it."""
+    app.after_request(_compress)
@@ -0,0 +1,172 @@
+import hashlib
+import threading
+import time
+from datetime import timedelta
+from functools import wraps
+from flask import request, g, jsonify, make_response
+from sqlalchemy import delete, insert
+from sqlalchemy.exc import IntegrityError
+from config import IDEMPOTENCY_TTL, IDEMPOTENCY_LOCK_TIMEOUT, IDEMPOTENCY_WAIT
+from database import db
+from models.idempotency_key import IdempotencyKey
+from models.outbox import utcnow
+
+HEADER = 'Idempotency-Key'
+MAX_KEY_LENGTH = 255
+
+# Seconds between polls while another process holds the key
+POLL_INTERVAL = 0.05
+# Seconds between deletions of expired keys, per process
+PURGE_INTERVAL = 300
+
+# Keys claimed by requests running in this process -> set when they finish
+_inflight = {}
+_inflight_lock = threading.Lock()
+_last_purge = 0.0
+
+
+def _scoped_key(client_key):
+    caller = g.get('user_id') or '-'
+    scope = f'{request.method} {request.path} {caller} {client_key}'
+    return hashlib.sha256(scope.encode()).hexdigest()
+
+
+def _purge_expired(now):
+    global _last_purge
+    if time.monotonic() - _last_purge < PURGE_INTERVAL:
+        return
+    _last_purge = time.monotonic()
+    db.session.execute(delete(IdempotencyKey).where(IdempotencyKey.expires_at <= now))
+    db.session.commit()
+
+
+def _claim(key, fingerprint):
+    """Try to take key for this request.
+
+    Returns ('claimed', None), ('done', row), ('in_progress', None) or
+    ('mismatch', None). The claim is committed before the view runs, so
+    other processes see it straight away.
+    """
+    now = utcnow()
+    _purge_expired(now)
+    while True:
+        try:
+            db.session.execute(insert(IdempotencyKey).values(
+                key=key, fingerprint=fingerprint, status='in_progress', created_at=now,
+                expires_at=now + timedelta(seconds=IDEMPOTENCY_LOCK_TIMEOUT)
+            ))
+            db.session.commit()
+            return 'claimed', None
+        except IntegrityError:
+            db.session.rollback()
+
+        row = db.session.get(IdempotencyKey, key, populate_existing=True)
+        if row is None:
+            continue  # deleted since our insert failed; try again
+        if row.expires_at <= now:
+            db.session.execute(delete(IdempotencyKey).where(
+                IdempotencyKey.key == key, IdempotencyKey.expires_at <= now))
+            db.session.commit()
+            continue
+        if row.fingerprint != fingerprint:
+            return 'mismatch', None
+        return row.status, row if row.status == 'done' else None
+
+
+def _finish(key, response):
+    """Store a replayable response, or release the key so the client can retry."""
+    row = db.session.get(IdempotencyKey, key, populate_existing=True)
+    if row is None:
+        return
+    if response.status_code >= 500 or response.is_streamed:
+        db.session.delete(row)
+    else:
+        row.status = 'done'
+        row.response_status = response.status_code
+        row.response_body = response.get_data(as_text=True)
+        row.content_type = response.content_type
+        row.expires_at = utcnow() + timedelta(seconds=IDEMPOTENCY_TTL)
+    db.session.commit()
+
+
+def _release(key):
+    db.session.rollback()
+    db.session.execute(delete(IdempotencyKey).where(
+        IdempotencyKey.key == key, IdempotencyKey.status == 'in_progress'))
+    db.session.commit()
+
+
+def _wait(key, deadline):
+    """Sleep until the in-flight request for key may have finished. False once past deadline."""
+    remaining = deadline - time.monotonic()
+    if remaining <= 0:
+        return False
+    with _inflight_lock:
+        done = _inflight.get(key)
+    if done is not None:
+        done.wait(remaining)
+    else:
+        time.sleep(min(POLL_INTERVAL, remaining))
+    return True
+
+
+def _replay(row):
+    response = make_response(row.response_body, row.response_status)
+    response.content_type = row.content_type
+    response.headers['Idempotent-Replayed'] = 'true'
+    return response
+
+
+def idempotent(view):
+    """Make a POST view safe to retry with an Idempotency-Key header.
+
+    The first request with a key runs the view and stores its response
+    for IDEMPOTENCY_TTL seconds. Repeats with the same key and body get
+    the stored response back without running the view. A repeat that
+    arrives while the first is still running waits for it, for up to
+    IDEMPOTENCY_WAIT seconds, and then replays its response. Responses
+    with a 5xx status are not stored, so those requests can be retried.
+    Requests without the header are unaffected.
+    """
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        client_key = request.headers.get(HEADER)
+        if client_key is None:
+            return view(*args, **kwargs)
+        if not client_key.strip() or len(client_key) > MAX_KEY_LENGTH:
+            return jsonify({'error': f'{HEADER} must be 1-{MAX_KEY_LENGTH} characters'}), 400
+
+        key = _scoped_key(client_key)
+        fingerprint = hashlib.sha256(request.get_data()).hexdigest()
+        deadline = time.monotonic() + IDEMPOTENCY_WAIT
+
+        while True:
+            state, row = _claim(key, fingerprint)
+            if state == 'claimed':
+                break
+            if state == 'done':
+                return _replay(row)
+            if state == 'mismatch':
+                return jsonify({'error': f'{HEADER} was already used with a different request body'}), 422
+            if not _wait(key, deadline):
+                response = jsonify({'error': f'A request with this {HEADER} is still in progress'})
+                response.headers['Retry-After'] = '1'
+                return response, 409
+
+        done = threading.Event()
+        with _inflight_lock:
+            _inflight[key] = done
+        try:
+            try:
+                response = make_response(view(*args, **kwargs))
+            except Exception:
+                _release(key)
+                raise
+            _finish(key, response)
+            return response
+        finally:
+            with _inflight_lock:
+                _inflight.pop(key, None)
+            done.set()
+
+    return wrapper
@@ -0,0 +1,62 @@
+import atexit
+import logging
+import os
+import queue
+from logging.handlers import QueueHandler, QueueListener
+from config import LOG_LEVEL, LOG_QUEUE_SIZE
+
+_handler = None
+
+
+class AsyncLogHandler(QueueHandler):
+    """Queues records for a writer thread started in each process that logs.
+
+    The thread starts on the first record a process emits, so an app built
+    in a gunicorn master before forking gets its own writer in every
+    worker. The queue is bounded; records arriving while it is full are
+    dropped and counted rather than held in memory.
+    """
+
+    def __init__(self, handler, maxsize=LOG_QUEUE_SIZE):
+        super().__init__(None)
+        self.handler = handler
+        self.maxsize = maxsize
+        self.dropped = 0
+        self._pid = None
+
+    def enqueue(self, record):
+        # Handler.handle holds self.lock here, and logging re-creates that lock after a fork
+        self._ensure_started()
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+    def _ensure_started(self):
+        if self._pid == os.getpid():
+            return
+        # A forked child inherits the parent's queue but not its writer thread
+        self.queue = queue.Queue(self.maxsize)
+        listener = QueueListener(self.queue, self.handler, respect_handler_level=True)
+        listener.start()
+        atexit.register(listener.stop)
+        self._pid = os.getpid()
+
+
+def init_logging():
+    """Send log records through a queue to a background writer thread.
+
+    Request threads only enqueue records; formatting and writing to stderr
+    happen on the writer thread, so logging never blocks a request.
+    """
+    global _handler
+    if _handler is not None:
+        return
+
+    stream = logging.StreamHandler()
+    stream.setFormatter(logging.Formatter('%(asctime)s %(levelname)s %(name)s: %(message)s'))
+    _handler = AsyncLogHandler(stream)
+
+    root = logging.getLogger()
+    root.addHandler(_handler)
+    root.setLevel(LOG_LEVEL)
@@ -0,0 +1,198 @@
+import hmac
+import threading
+import time
+from collections import deque
+from flask import g, request, has_request_context, jsonify, Response, current_app
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from sqlalchemy.orm import Session
+from sqlalchemy.pool import Pool
+from config import SLOW_QUERY_THRESHOLD_MS, SLOW_QUERY_SAMPLES
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+COUNT_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100, 250)
+
+
+class Histogram:
+    """Cumulative-bucket histogram with one series per label set."""
+
+    def __init__(self, name, help_text, buckets):
+        self.name = name
+        self.help_text = help_text
+        self.buckets = buckets
+        self._series = {}  # labels tuple -> [bucket counts..., count, sum]
+        self._lock = threading.Lock()
+
+    def observe(self, value, **labels):
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [0] * (len(self.buckets) + 2)
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[i] += 1
+            series[-2] += 1
+            series[-1] += value
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.help_text}', f'# TYPE {self.name} histogram']
+        with self._lock:
+            items = sorted(self._series.items())
+        for key, series in items:
+            labels = [f'{k}="{_escape(v)}"' for k, v in key]
+            for bound, value in zip(self.buckets, series):
+                le = 'le="%s"' % bound
+                lines.append(f'{self.name}_bucket{_labels(labels + [le])} {value}')
+            le = 'le="+Inf"'
+            lines.append(f'{self.name}_bucket{_labels(labels + [le])} {series[-2]}')
+            lines.append(f'{self.name}_count{_labels(labels)} {series[-2]}')
+            lines.append(f'{self.name}_sum{_labels(labels)} {series[-1]}')
+        return lines
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _labels(labels):
+    return '{' + ','.join(labels) + '}' if labels else ''
+
+
+request_latency = Histogram(
+    'http_request_duration_seconds', 'Request latency by route.', LATENCY_BUCKETS)
+request_statements = Histogram(
+    'db_statements_per_request', 'SQL statements issued per request.', COUNT_BUCKETS)
+request_db_time = Histogram(
+    'db_time_per_request_seconds', 'Total time spent in SQL per request.', LATENCY_BUCKETS)
+pool_checkout_wait = Histogram(
+    'db_pool_checkout_wait_seconds', 'Time from first query to getting a pooled connection.', LATENCY_BUCKETS)
+
+slow_queries = deque(maxlen=SLOW_QUERY_SAMPLES)
+_slow_query_total = 0
+_slow_query_lock = threading.Lock()
+
+
+# --- SQLAlchemy hooks -------------------------------------------------------
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info['query_start'] = time.perf_counter()
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    global _slow_query_total
+    elapsed = time.perf_counter() - conn.info.pop('query_start', time.perf_counter())
+
+    if has_request_context():
+        g.sql_count = g.get('sql_count', 0) + 1
+        g.sql_time = g.get('sql_time', 0.0) + elapsed
+        g.pop('checkout_start', None)
+
+    if elapsed * 1000 >= SLOW_QUERY_THRESHOLD_MS:
+        with _slow_query_lock:
+            _slow_query_total += 1
+            slow_queries.append({
+                'statement': statement,
+                'duration_ms': round(elapsed * 1000, 3),
+                'endpoint': request.endpoint if has_request_context() else None,
+                'at': time.time()
+            })
+
+
+def _do_orm_execute(orm_execute_state):
+    # A pool checkout, if one is needed, happens right after this point
+    if has_request_context():
+        g.checkout_start = time.perf_counter()
+
+
+def _on_checkout(dbapi_connection, connection_record, connection_proxy):
+    if has_request_context():
+        start = g.pop('checkout_start', None)
+        if start is not None:
+            pool_checkout_wait.observe(time.perf_counter() - start)
+
+
+# --- Flask hooks ------------------------------------------------------------
+
+def _before_request():
+    g.request_start = time.perf_counter()
+    g.sql_count = 0
+    g.sql_time = 0.0
+
+
+def _after_request(response):
+    start = g.get('request_start')
+    if start is None:
+        return response
+
+    endpoint = request.endpoint or 'unmatched'
+    blueprint = request.blueprint or ''
+    request_latency.observe(time.perf_counter() - start, blueprint=blueprint, endpoint=endpoint,
+                            method=request.method, status=response.status_code)
+    request_statements.observe(g.get('sql_count', 0), endpoint=endpoint)
+    request_db_time.observe(g.get('sql_time', 0.0), endpoint=endpoint)
+    return response
+
+
+def render_metrics():
+    """Render every metric in Prometheus text exposition format."""
+    from utils.product_cache import product_cache
+
+    lines = []
+    for histogram in (request_latency, request_statements, request_db_time, pool_checkout_wait):
+        lines.extend(histogram.render())
+
+    lines.append('# HELP db_slow_queries_total Statements slower than the slow query threshold.')
+    lines.append('# TYPE db_slow_queries_total counter')
+    lines.append(f'db_slow_queries_total {_slow_query_total}')
+
+    stats = product_cache.stats()
+    for name in ('hits', 'misses', 'evictions', 'expirations'):
+        lines.append(f'# TYPE product_cache_{name}_total counter')
+        lines.append(f'product_cache_{name}_total {stats[name]}')
+    lines.append('# TYPE product_cache_size gauge')
+    lines.append(f'product_cache_size {stats["size"]}')
+
+    admission = current_app.extensions.get('admission')
+    if admission is not None:
+        stats = admission.stats()
+        for gauge in ('in_flight', 'waiting'):
+            lines.append(f'# TYPE admission_{gauge} gauge')
+            for name, limit in sorted(stats['limits'].items()):
+                lines.append(f'admission_{gauge}{{route_class="{name}"}} {limit[gauge]}')
+        lines.append('# TYPE admission_rejections_total counter')
+        for row in stats['rejections']:
+            lines.append(f'admission_rejections_total{{route_class="{row["route_class"]}",'
+                         f'reason="{row["reason"]}"}} {row["count"]}')
+
+    return '\n'.join(lines) + '\n'
+
+
+def metrics():
+    return Response(render_metrics(), mimetype='text/plain; version=0.0.4')
+
+
+def get_slow_queries():
+    """The recent slow statements, for a client sending ``Authorization: Bearer <METRICS_TOKEN>``."""
+    token = current_app.config['METRICS_TOKEN']
+    header = request.headers.get('Authorization', '')
+    if not header.startswith('Bearer ') or not hmac.compare_digest(header[7:].encode(), token.encode()):
+        return jsonify({'error': 'Unauthorized'}), 401
+    return jsonify(list(slow_queries))
+
+
+def init_metrics(app):
+    """Register request timing, SQL instrumentation, /metrics and, given a METRICS_TOKEN, /metrics/slow-queries."""
+    app.before_request(_before_request)
+    app.after_request(_after_request)
+
+    if not event.contains(Engine, 'before_cursor_execute', _before_cursor_execute):
+        event.listen(Engine, 'before_cursor_execute', _before_cursor_execute)
+        event.listen(Engine, 'after_cursor_execute', _after_cursor_execute)
+        event.listen(Session, 'do_orm_execute', _do_orm_execute)
+        event.listen(Pool, 'checkout', _on_checkout)
+
+    app.add_url_rule('/metrics', 'metrics', metrics)
+    if app.config.get('METRICS_TOKEN'):
+        # Statements can carry customer data; only expose them behind a token
+        app.add_url_rule('/metrics/slow-queries', 'slow_queries', get_slow_queries)
@@ -0,0 +1,74 @@
+"""Outbox events for order changes and the handlers that process them.
+
+Routes call the functions below inside the transaction that changes the
+order; the work itself runs later on an outbox worker (utils/outbox.py).
+"""
+import logging
+from utils.outbox import enqueue, handler
+from utils.analytics import counts_toward_sales, sales_event, record_sales
+from utils.product_cache import product_cache
+from utils.stock import release_stock
+
+logger = logging.getLogger(__name__)
+notification_logger = logging.getLogger('notifications')
+
+
+def order_placed(order, quantities, prices):
+    """quantities: {product_id: quantity} of the new order's lines; prices: {product_id: unit price}."""
+    lines = [(product_id, quantity, prices.get(product_id)) for product_id, quantity in quantities.items()]
+    enqueue('sales.record', sales_event(order.order_id, lines))
+    enqueue('order.notify', {'order_id': order.order_id, 'user_id': order.user_id, 'status': order.status})
+
+
+def order_status_changed(order, old_status, lines):
+    """lines: (product_id, quantity, unit_price) of the order's lines. Call after setting order.status.
+
+    Cancelling an order restocks its lines and removes it from the sales
+    rollups. Reinstating one adds it back; its stock must already have
+    been reserved by the caller.
+    """
+    was_counted = counts_toward_sales(old_status)
+    is_counted = counts_toward_sales(order.status)
+    if was_counted and not is_counted:
+        enqueue('stock.release', {'order_id': order.order_id,
+                                  'lines': [[product_id, quantity] for product_id, quantity, _ in lines]})
+    if was_counted != is_counted:
+        enqueue('sales.record', sales_event(order.order_id, lines, 1 if is_counted else -1,
+                                            order_date=order.order_date))
+    enqueue('order.notify', {'order_id': order.order_id, 'user_id': order.user_id, 'status': order.status})
+
+
+def order_deleted(order, lines):
+    if counts_toward_sales(order.status):
+        enqueue('sales.record', sales_event(order.order_id, lines, -1, order_date=order.order_date))
+
+
+def order_lines_changed(order, lines, sign):
+    """A line was added to (sign=1) or removed from (sign=-1) an existing order."""
+    if counts_toward_sales(order.status):
+        enqueue('sales.record', sales_event(order.order_id, lines, sign, orders=0,
+                                            order_date=order.order_date))
+
+
+@handler('sales.record')
+def handle_sales(payloads):
+    record_sales(payloads)
+
+
+@handler('stock.release')
+def handle_stock_release(payloads):
+    quantities = {}
+    for payload in payloads:
+        for product_id, quantity in payload['lines']:
+            quantities[product_id] = quantities.get(product_id, 0) + quantity
+    release_stock(quantities)
+    logger.info('Restocked %d products for %d cancelled orders', len(quantities), len(payloads))
+    # Drop cached stock levels only once the restock is visible
+    return lambda: product_cache.stock_changed(*quantities)
+
+
+@handler('order.notify')
+def handle_notify(payloads):
+    for payload in payloads:
+        notification_logger.info('Order %s for user %s is now %s',
+                                 payload['order_id'], payload['user_id'], payload['status'])
@@ -0,0 +1,243 @@
+import logging
+import os
+import random
+import threading
+import uuid
+from datetime import timedelta
+from sqlalchemy import delete, update
+from config import (OUTBOX_BATCH_SIZE, OUTBOX_POLL_INTERVAL, OUTBOX_MAX_ATTEMPTS, OUTBOX_BACKOFF_BASE,
+                    OUTBOX_BACKOFF_MAX, OUTBOX_LEASE, OUTBOX_RETENTION)
+from database import db
+from models.outbox import OutboxEvent, utcnow
+
+logger = logging.getLogger(__name__)
+
+# Seconds between deletions of old processed events, per process
+PRUNE_INTERVAL = 3600
+
+# topic -> handler(payloads) -> optional callable to run after the batch commits
+HANDLERS = {}
+
+
+def handler(topic):
+    """Register the function that processes a batch of events for topic.
+
+    The handler receives the payloads of every claimed event for the
+    topic and makes its database changes in the current session; they
+    commit together with the events being marked done, and only if this
+    worker still holds the events' lease. If the lease expired and another
+    worker took the events over, the changes are rolled back, so each
+    event's database changes apply once. The handler itself may still be
+    called again for a payload (after a crash or a lost lease), so work it
+    does outside the database must tolerate repeats. It may return a
+    callable that runs once the batch has committed, for side effects
+    outside the database.
+    """
+    def register(fn):
+        HANDLERS[topic] = fn
+        return fn
+    return register
+
+
+def enqueue(topic, payload):
+    """Record an event in the current transaction; it runs only if the transaction commits."""
+    db.session.add(OutboxEvent(topic=topic, payload=payload))
+
+
+def backoff(attempts):
+    """Seconds to wait before retry number attempts + 1 (exponential, with jitter)."""
+    delay = min(OUTBOX_BACKOFF_MAX, OUTBOX_BACKOFF_BASE * 2 ** (attempts - 1))
+    return delay * random.uniform(0.5, 1.0)
+
+
+class LeaseLost(Exception):
+    """Events were claimed by another worker after this worker's lease on them expired."""
+
+
+def _claim(batch_size):
+    """Lease up to batch_size due events to this worker and return (lease token, events).
+
+    Candidates are read with SKIP LOCKED where the database supports it,
+    then taken with a conditional UPDATE, so two workers never hold the
+    same event. A worker that dies leaves its events to be picked up again
+    once the lease expires.
+    """
+    now = utcnow()
+    candidates = db.session.query(OutboxEvent.event_id) \
+        .filter(OutboxEvent.status == 'pending', OutboxEvent.available_at <= now) \
+        .order_by(OutboxEvent.event_id).limit(batch_size) \
+        .with_for_update(skip_locked=True).all()
+    if not candidates:
+        db.session.rollback()
+        return None, []
+
+    token = uuid.uuid4().hex
+    db.session.execute(
+        update(OutboxEvent)
+        .where(OutboxEvent.event_id.in_([row.event_id for row in candidates]),
+               OutboxEvent.status == 'pending', OutboxEvent.available_at <= now)
+        .values(lease_token=token, available_at=now + timedelta(seconds=OUTBOX_LEASE),
+                attempts=OutboxEvent.attempts + 1)
+        .execution_options(synchronize_session=False)
+    )
+    db.session.commit()
+    return token, OutboxEvent.query.filter(OutboxEvent.lease_token == token) \
+        .order_by(OutboxEvent.event_id).all()
+
+
+def _run(topic, events, token):
+    after_commit = HANDLERS[topic]([event.payload for event in events])
+    # Mark done only the events still leased to this worker; the UPDATE's
+    # row locks keep a re-claim from slipping in before the commit
+    done = db.session.execute(
+        update(OutboxEvent)
+        .where(OutboxEvent.event_id.in_([event.event_id for event in events]),
+               OutboxEvent.lease_token == token, OutboxEvent.status == 'pending')
+        .values(status='done', processed_at=utcnow(), lease_token=None, last_error=None)
+        .execution_options(synchronize_session=False)
+    ).rowcount
+    if done != len(events):
+        raise LeaseLost()
+    db.session.commit()
+    if after_commit:
+        after_commit()
+
+
+def _fail(event_id, token, error):
+    event = db.session.query(OutboxEvent) \
+        .filter(OutboxEvent.event_id == event_id, OutboxEvent.lease_token == token) \
+        .with_for_update().first()
+    if event is None:
+        db.session.rollback()  # re-claimed by another worker; the failure is theirs to handle now
+        return
+    event.lease_token = None
+    event.last_error = error
+    if event.attempts >= OUTBOX_MAX_ATTEMPTS:
+        event.status = 'dead'
+        logger.error('Outbox event %s (%s) failed %d times; giving up: %s',
+                     event.event_id, event.topic, event.attempts, error)
+    else:
+        event.available_at = utcnow() + timedelta(seconds=backoff(event.attempts))
+        logger.warning('Outbox event %s (%s) failed on attempt %d; retrying at %s: %s',
+                       event.event_id, event.topic, event.attempts, event.available_at, error)
+    db.session.commit()
+
+
+def _process(topic, events, token):
+    try:
+        _run(topic, events, token)
+    except Exception as exc:
+        db.session.rollback()
+        if len(events) == 1:
+            if isinstance(exc, LeaseLost):
+                logger.warning('Outbox event %s (%s) was re-claimed after its lease expired; '
+                               'leaving it to the new holder', events[0].event_id, topic)
+            else:
+                _fail(events[0].event_id, token, f'{type(exc).__name__}: {exc}')
+            return
+        # Retry one by one so a single bad or re-claimed event does not hold back the batch
+        for event in events:
+            _process(topic, [db.session.get(OutboxEvent, event.event_id)], token)
+
+
+def drain(batch_size=OUTBOX_BATCH_SIZE):
+    """Claim one batch of due events, run them grouped by topic and return how many were claimed."""
+    token, events = _claim(batch_size)
+    by_topic = {}
+    for event in events:
+        by_topic.setdefault(event.topic, []).append(event)
+    for topic, group in by_topic.items():
+        _process(topic, group, token)
+    return len(events)
+
+
+def prune(retention=OUTBOX_RETENTION):
+    """Delete processed events older than retention seconds."""
+    cutoff = utcnow() - timedelta(seconds=retention)
+    deleted = db.session.execute(
+        delete(OutboxEvent).where(OutboxEvent.status == 'done', OutboxEvent.processed_at < cutoff)
+    ).rowcount
+    db.session.commit()
+    return deleted
+
+
+class OutboxWorkerPool:
+    """Threads that drain the outbox, each in its own app context.
+
+    The pool starts on the first request a process serves (or from the
+    outbox-worker CLI command), never while the app is being created, so
+    a gunicorn master does not run workers and every forked child starts
+    its own.
+    """
+
+    def __init__(self, app, workers):
+        self.app = app
+        self.workers = workers
+        self._threads = []
+        self._stop = threading.Event()
+        self._lock = threading.Lock()
+        self._pid = None
+        self._last_prune = 0.0
+
+    def ensure_started(self):
+        if self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            self._stop = threading.Event()
+            self._threads = [
+                threading.Thread(target=self._loop, name=f'outbox-worker-{i}', daemon=True)
+                for i in range(self.workers)
+            ]
+            for thread in self._threads:
+                thread.start()
+            self._pid = os.getpid()
+            logger.info('Started %d outbox workers', self.workers)
+
+    def stop(self, timeout=None):
+        self._stop.set()
+        for thread in self._threads:
+            thread.join(timeout)
+        self._pid = None
+
+    def join(self):
+        for thread in self._threads:
+            thread.join()
+
+    def _loop(self):
+        while not self._stop.is_set():
+            with self.app.app_context():
+                try:
+                    processed = drain()
+                    if not processed:
+                        self._maybe_prune()
+                except Exception:
+                    db.session.rollback()
+                    logger.exception('Outbox worker failed to drain a batch')
+                    processed = 0
+            if not processed:
+                self._stop.wait(OUTBOX_POLL_INTERVAL)
+
+    def _maybe_prune(self):
+        now = utcnow().timestamp()
+        with self._lock:
+            if now - self._last_prune < PRUNE_INTERVAL:
+                return
+            self._last_prune = now
+        deleted = prune()
+        if deleted:
+            logger.info('Pruned %d processed outbox events', deleted)
+
+
+def init_outbox(app):
+    """Run OUTBOX_WORKERS drain threads in each serving process (0 disables them)."""
+    workers = app.config.get('OUTBOX_WORKERS', 0)
+    if not workers:
+        return
+    pool = OutboxWorkerPool(app, workers)
+    app.extensions['outbox'] = pool
+
+    @app.before_request
+    def start_outbox_workers():
+        pool.ensure_started()
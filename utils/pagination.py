@@ -0,0 +1,140 @@
+from flask import request, jsonify, current_app, Response, stream_with_context
+
+DEFAULT_PAGE_SIZE = 100
+MAX_PAGE_SIZE = 1000
+STREAM_BATCH_SIZE = 500
+
+# Rows a list route returns when called without limit/cursor/stream. When
+# there are more, the X-Next-Cursor header says where to continue.
+UNPAGED_LIMIT = 10000
+
+
+def encode_models(rows):
+    return [row.to_dict() for row in rows]
+
+
+def encode_projected(rows):
+    """Encode rows from a ``query.with_entities(*Model.projection())`` query."""
+    return [row._asdict() for row in rows]
+
+
+def parse_page_args(args=None):
+    """Read limit/cursor/stream from the query string (default: the current request's).
+
+    Returns (limit, cursor, stream) or raises ValueError with a message
+    suitable for a 400 response.
+    """
+    args = request.args if args is None else args
+    limit = args.get('limit')
+    cursor = args.get('cursor')
+    stream = args.get('stream')
+
+    if limit is not None:
+        if not limit.isdigit() or int(limit) <= 0:
+            raise ValueError('limit must be a positive integer')
+        limit = min(int(limit), MAX_PAGE_SIZE)
+
+    if cursor is not None:
+        if not cursor.isdigit():
+            raise ValueError('cursor must be a non-negative integer')
+        cursor = int(cursor)
+
+    if stream is not None and stream not in ('ndjson', 'json'):
+        raise ValueError("stream must be 'ndjson' or 'json'")
+
+    return limit, cursor, stream
+
+
+def unpaged_response(items, key):
+    """jsonify the first UNPAGED_LIMIT items of a list fetched with limit UNPAGED_LIMIT + 1.
+
+    items are dicts ordered by key. If there was one more, it is dropped
+    and X-Next-Cursor carries the cursor for ?cursor= to continue from.
+    """
+    headers = {}
+    if len(items) > UNPAGED_LIMIT:
+        items = items[:UNPAGED_LIMIT]
+        headers['X-Next-Cursor'] = str(items[-1][key])
+    return jsonify(items), 200, headers
+
+
+def _batches(query, key_column, limit=None):
+    """Yield up to limit rows of a key-ordered query, STREAM_BATCH_SIZE at a time.
+
+    Each batch is its own short keyset query (``key > last key LIMIT n``),
+    so no cursor is left open while the caller encodes a batch. An encoder
+    that runs queries of its own, such as loading order items, would
+    otherwise make an unbuffered MySQL cursor drop its unread rows.
+    """
+    last = None
+    while limit is None or limit > 0:
+        size = STREAM_BATCH_SIZE if limit is None else min(STREAM_BATCH_SIZE, limit)
+        batch = (query if last is None else query.filter(key_column > last)).limit(size).all()
+        if batch:
+            yield batch
+        if len(batch) < size:
+            return
+        if limit is not None:
+            limit -= len(batch)
+        last = getattr(batch[-1], key_column.key)
+
+
+def _stream(query, key_column, limit, stream, encode):
+    """Yield rows as NDJSON or a chunked JSON array, batch by batch."""
+    dumps = current_app.json.dumps
+
+    def generate():
+        if stream == 'ndjson':
+            for batch in _batches(query, key_column, limit):
+                yield ''.join(dumps(item) + '\n' for item in encode(batch))
+            return
+
+        yield '['
+        first = True
+        for batch in _batches(query, key_column, limit):
+            for item in encode(batch):
+                yield ('' if first else ',') + dumps(item)
+                first = False
+        yield ']'
+
+    mimetype = 'application/x-ndjson' if stream == 'ndjson' else 'application/json'
+    return Response(stream_with_context(generate()), mimetype=mimetype)
+
+
+def paginated_response(query, key_column, encode=encode_models):
+    """Serve a list endpoint with optional keyset pagination or streaming.
+
+    Without parameters a plain list is returned as before, capped at
+    UNPAGED_LIMIT rows ordered by ``key_column`` (see unpaged_response). With ``limit``
+    and/or ``cursor`` a page of rows ordered by ``key_column`` is returned
+    together with ``next_cursor``. ``stream=ndjson|json`` streams every row
+    after ``cursor`` in keyset batches so memory stays bounded.
+
+    ``encode`` turns a list of rows into a list of JSON-ready dicts.
+    """
+    try:
+        limit, cursor, stream = parse_page_args()
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
+    if limit is None and cursor is None and stream is None:
+        rows = query.order_by(key_column).limit(UNPAGED_LIMIT + 1).all()
+        return unpaged_response(encode(rows), key_column.key)
+
+    query = query.order_by(key_column)
+    if cursor is not None:
+        query = query.filter(key_column > cursor)
+
+    if stream:
+        return _stream(query, key_column, limit, stream, encode)
+
+    limit = limit or DEFAULT_PAGE_SIZE
+    rows = query.limit(limit + 1).all()
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+    next_cursor = getattr(rows[-1], key_column.key) if has_more else None
+
+    return jsonify({
+        'items': encode(rows),
+        'next_cursor': next_cursor
+    })
@@ -0,0 +1,261 @@
+import threading
+import time
+from collections import OrderedDict
+from sqlalchemy import select
+from config import PRODUCT_CACHE_SIZE, PRODUCT_CACHE_TTL, PRODUCT_CACHE_CATCH_UP_LIMIT
+from utils.pagination import UNPAGED_LIMIT
+
+
+class LRUCache:
+    """Thread-safe LRU cache with a per-entry TTL and usage counters."""
+
+    def __init__(self, maxsize, ttl):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data = OrderedDict()  # key -> (expires_at, value)
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def get(self, key):
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            expires_at, value = entry
+            if expires_at < time.monotonic():
+                del self._data[key]
+                self.expirations += 1
+                self.misses += 1
+                return None
+            self._data.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def set(self, key, value):
+        with self._lock:
+            self._data[key] = (time.monotonic() + self.ttl, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+                self.evictions += 1
+
+    def delete(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def items_where(self, predicate):
+        """(key, value) of the live entries whose key matches, without counting hits."""
+        now = time.monotonic()
+        with self._lock:
+            return [(key, value) for key, (expires_at, value) in self._data.items()
+                    if predicate(key) and expires_at >= now]
+
+    def delete_where(self, predicate):
+        with self._lock:
+            for key in [k for k in self._data if predicate(k)]:
+                del self._data[key]
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def stats(self):
+        with self._lock:
+            return {
+                'size': len(self._data),
+                'maxsize': self.maxsize,
+                'ttl': self.ttl,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'expirations': self.expirations
+            }
+
+
+class ProductCache:
+    """Read-through cache of serialized products and product listings.
+
+    Entries hold ``Product.to_dict()`` output rather than ORM instances so
+    they can be shared across sessions and requests. Single products are
+    keyed by ``('product', id)``; listings by ``('list', 'all')`` or
+    ``('list', ('categories', *names))``. A product
+    write drops the product's own entry and every listing. A stock change
+    (orders, cancellations, flash-sale allocations) drops only the
+    product's entry: listings keep showing the old stock until they expire,
+    since checkout checks stock in the database anyway and dropping every
+    listing on each order would leave them nearly always cold.
+
+    Those hooks only see this process's writes. Catalog requests also
+    catch the cache up with the catalog version (utils/http_cache.py), so
+    what it serves matches the ETag it is served under.
+    """
+
+    def __init__(self, maxsize=PRODUCT_CACHE_SIZE, ttl=PRODUCT_CACHE_TTL):
+        self.cache = LRUCache(maxsize, ttl)
+        self._seen_version = None
+        self._version_lock = threading.Lock()
+
+    def cached_product(self, product_id):
+        """Return the cached product dict, or None on a miss. Never queries."""
+        return self.cache.get(('product', product_id))
+
+    def cache_product(self, product):
+        """Store a product dict loaded by the caller."""
+        self.cache.set(('product', product['product_id']), product)
+
+    def cached_list(self, name):
+        """Return the cached listing, or None on a miss. Never queries."""
+        return self.cache.get(('list', name))
+
+    def cache_list(self, name, products):
+        """Store a listing loaded by the caller."""
+        self.cache.set(('list', name), products)
+
+    def get_product(self, product_id):
+        """Return the product dict for product_id, or None if it doesn't exist."""
+        product = self.cached_product(product_id)
+        if product is None:
+            from models.product import Product
+            row = Product.query.get(product_id)
+            if row is None:
+                return None
+            product = row.to_dict()
+            self.cache_product(product)
+        return product
+
+    def get_many(self, product_ids):
+        """Return {product_id: product dict} for the IDs that exist.
+
+        Cache misses are loaded together with a single IN query.
+        """
+        found = {}
+        misses = []
+        for product_id in product_ids:
+            product = self.cache.get(('product', product_id))
+            if product is None:
+                misses.append(product_id)
+            else:
+                found[product_id] = product
+
+        if misses:
+            from models.product import Product
+            for row in Product.query.filter(Product.product_id.in_(misses)):
+                product = row.to_dict()
+                self.cache.set(('product', row.product_id), product)
+                found[row.product_id] = product
+        return found
+
+    def get_list(self, name, query):
+        """Return a cached listing, running the Product query to build it on a miss.
+
+        Only the serialized columns are selected, so no ORM instances are built.
+        """
+        products = self.cached_list(name)
+        if products is None:
+            from models.product import Product
+            products = [row._asdict() for row in query.with_entities(*Product.projection())]
+            self.cache_list(name, products)
+        return products
+
+    def put(self, product):
+        """Store a freshly written product and drop listings that contain stale data."""
+        self._drop_lists()
+        self.cache.set(('product', product.product_id), product.to_dict())
+
+    def invalidate(self, *product_ids):
+        """Drop the products and every listing, after a write to anything but stock."""
+        self._drop_lists()
+        self.stock_changed(*product_ids)
+
+    def stock_changed(self, *product_ids):
+        """Drop the products whose stock changed; listings keep theirs until they expire."""
+        for product_id in product_ids:
+            self.cache.delete(('product', product_id))
+
+    def changes_since(self, version):
+        """Statements reading the catalog changes this cache has not seen, or None if it is current.
+
+        version is utils.http_cache's (latest updated_at, latest
+        deletion_id). The first caller to see it move claims it and gets
+        two statements: the changed products (Product.projection()) and
+        the deleted product_ids. Their results go to apply_changes.
+        """
+        from models.product import Product, ProductDeletion
+        with self._version_lock:
+            seen = self._seen_version
+            if seen is not None and not _newer(version, seen):
+                return None
+            self._seen_version = version
+        if seen is None:
+            # Whatever is cached predates the first version this process read
+            self.cache.clear()
+            return None
+
+        updated_at, deletion_id = seen
+        changed = select(*Product.projection())
+        if updated_at is not None:
+            # >=: a write stamped in the same instant may have committed after the read
+            changed = changed.where(Product.updated_at >= updated_at)
+        deleted = select(ProductDeletion.product_id)
+        if deletion_id is not None:
+            deleted = deleted.where(ProductDeletion.deletion_id > deletion_id)
+        return (changed.limit(PRODUCT_CACHE_CATCH_UP_LIMIT + 1),
+                deleted.limit(PRODUCT_CACHE_CATCH_UP_LIMIT + 1))
+
+    def apply_changes(self, changed_rows, deleted_ids):
+        """Bring the cache up to date with the results of changes_since's statements.
+
+        Changed and deleted products are dropped. Listings are dropped when
+        a product was deleted, or when a changed product differs from the
+        listing in more than its stock or belongs in a listing that lacks it
+        (new, or moved category). Otherwise the listing's stock is updated
+        in place.
+        """
+        changed = {row.product_id: row._asdict() for row in changed_rows}
+        deleted = list(deleted_ids)
+        if len(changed) > PRODUCT_CACHE_CATCH_UP_LIMIT or len(deleted) > PRODUCT_CACHE_CATCH_UP_LIMIT:
+            self.cache.clear()
+            return
+        self.stock_changed(*changed, *deleted)
+        if deleted:
+            self._drop_lists()
+        elif changed and not self._update_list_stock(changed):
+            self._drop_lists()
+
+    def _update_list_stock(self, changed):
+        """Copy the stock of changed products into the listings. False if a listing needs rebuilding."""
+        updates = []
+        for (_, name), products in self.cache.items_where(lambda key: key[0] == 'list'):
+            listed = {product['product_id']: product for product in products}
+            # A full listing holds the first UNPAGED_LIMIT + 1 products by ID; it ends before later ones
+            complete = len(products) <= UNPAGED_LIMIT
+            for product_id, fresh in changed.items():
+                product = listed.get(product_id)
+                if product is None:
+                    belongs = name == 'all' or fresh['category'] in name[1:]
+                    if belongs and (complete or product_id < products[-1]['product_id']):
+                        return False
+                elif any(product[key] != value for key, value in fresh.items() if key != 'stock'):
+                    return False
+                else:
+                    updates.append((product, fresh['stock']))
+        for product, stock in updates:
+            product['stock'] = stock
+        return True
+
+    def stats(self):
+        return self.cache.stats()
+
+    def _drop_lists(self):
+        self.cache.delete_where(lambda key: key[0] == 'list')
+
+
+def _newer(version, seen):
+    return any(value is not None and (old is None or value > old) for value, old in zip(version, seen))
+
+
+product_cache = ProductCache()
@@ -0,0 +1,174 @@
+from decimal import Decimal, InvalidOperation
+from flask import request, jsonify
+from sqlalchemy import case, func, select
+from database import db
+from models.product import Product
+from utils.pagination import DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE
+
+# Query-string parameters that switch GET /products into filtered mode
+FILTER_PARAMS = ('min_price', 'max_price', 'in_stock', 'category', 'sort')
+
+# Upper bounds of the price facet buckets; the last bucket is open-ended
+PRICE_BUCKETS = (25, 50, 100, 250)
+
+SORT_COLUMNS = {
+    'price': Product.price,
+    'name': Product.name,
+    'stock': Product.stock,
+}
+
+
+def is_filter_request(args=None):
+    args = request.args if args is None else args
+    return any(param in args for param in FILTER_PARAMS)
+
+
+def _price_bucket_labels():
+    bounds = (0,) + PRICE_BUCKETS
+    labels = [f'{low}-{high}' for low, high in zip(bounds, bounds[1:])]
+    return labels + [f'{PRICE_BUCKETS[-1]}+']
+
+
+def _price_bucket_expr():
+    """SQL expression mapping a product's price to its bucket index."""
+    return case(
+        *[(Product.price < bound, index) for index, bound in enumerate(PRICE_BUCKETS)],
+        else_=len(PRICE_BUCKETS)
+    )
+
+
+def _parse_price(args, name):
+    raw = args.get(name)
+    if raw is None or raw == '':
+        return None
+    try:
+        value = Decimal(raw)
+    except InvalidOperation:
+        raise ValueError(f'{name} must be a number')
+    if not value.is_finite() or value < 0:
+        raise ValueError(f'{name} must be a non-negative number')
+    return value
+
+
+def parse_filters(args=None):
+    """Read the filter parameters from the query string (default: the current request's).
+
+    Returns a dict of parsed filters or raises ValueError with a message
+    suitable for a 400 response.
+    """
+    args = request.args if args is None else args
+    min_price = _parse_price(args, 'min_price')
+    max_price = _parse_price(args, 'max_price')
+    if min_price is not None and max_price is not None and min_price > max_price:
+        raise ValueError('min_price cannot be greater than max_price')
+
+    in_stock = args.get('in_stock', '').lower()
+    if in_stock not in ('', 'true', 'false', '1', '0'):
+        raise ValueError("in_stock must be 'true' or 'false'")
+
+    categories = [c.strip() for c in args.get('category', '').split(',') if c.strip()]
+    unknown = set(categories) - set(Product.category.type.enums)
+    if unknown:
+        raise ValueError(f"Unknown category: {', '.join(sorted(unknown))}")
+
+    sort = args.get('sort', 'name')
+    if sort.lstrip('-') not in SORT_COLUMNS:
+        raise ValueError(f"sort must be one of {', '.join(sorted(SORT_COLUMNS))}, optionally prefixed with '-'")
+
+    limit = args.get('limit', str(DEFAULT_PAGE_SIZE))
+    if not limit.isdigit() or int(limit) <= 0:
+        raise ValueError('limit must be a positive integer')
+
+    return {
+        'min_price': min_price,
+        'max_price': max_price,
+        'in_stock': in_stock in ('true', '1'),
+        'categories': list(dict.fromkeys(categories)),
+        'sort': sort,
+        'limit': min(int(limit), MAX_PAGE_SIZE),
+    }
+
+
+def _price_conditions(filters):
+    conditions = []
+    if filters['min_price'] is not None:
+        conditions.append(Product.price >= filters['min_price'])
+    if filters['max_price'] is not None:
+        conditions.append(Product.price <= filters['max_price'])
+    return conditions
+
+
+def page_statement(filters):
+    """SELECT for the filtered, sorted page of products."""
+    stmt = select(*Product.projection())
+    if filters['categories']:
+        stmt = stmt.where(Product.category.in_(filters['categories']))
+    stmt = stmt.where(*_price_conditions(filters))
+    if filters['in_stock']:
+        stmt = stmt.where(Product.stock > 0)
+
+    column = SORT_COLUMNS[filters['sort'].lstrip('-')]
+    if filters['sort'].startswith('-'):
+        stmt = stmt.order_by(column.desc(), Product.product_id.desc())
+    else:
+        stmt = stmt.order_by(column.asc(), Product.product_id.asc())
+    return stmt.limit(filters['limit'])
+
+
+def facet_statement(filters):
+    """Category and price-bucket counts from a single grouped aggregate.
+
+    Each facet ignores its own filter so the client can show how many
+    products the other choices would return: category counts honour the
+    price range but not the category set, and price bucket counts honour
+    the category set but not the price range. Grouping by (category,
+    bucket) with a conditional count of the in-range rows gives both, and
+    the total, in one query; build_facets folds the rows.
+    """
+    bucket = _price_bucket_expr()
+    price_conditions = _price_conditions(filters)
+    if price_conditions:
+        in_range = func.sum(case((db.and_(*price_conditions), 1), else_=0))
+    else:
+        in_range = func.count()
+
+    stmt = select(Product.category, bucket, func.count(), in_range)
+    if filters['in_stock']:
+        stmt = stmt.where(Product.stock > 0)
+    return stmt.group_by(Product.category, bucket)
+
+
+def build_facets(filters, rows):
+    """Return (total, facets) from the rows of facet_statement."""
+    labels = _price_bucket_labels()
+    categories = {name: 0 for name in Product.category.type.enums}
+    prices = [0] * len(labels)
+    total = 0
+    selected = set(filters['categories'])
+    for category, index, count, matching in rows:
+        categories[category] += int(matching)
+        if not selected or category in selected:
+            prices[index] += count
+            total += int(matching)
+
+    return total, {
+        'category': categories,
+        'price': [{'bucket': label, 'count': count} for label, count in zip(labels, prices)],
+    }
+
+
+def filtered_products_response():
+    """Serve GET /products with filters, sorting and facet counts.
+
+    Costs two queries whatever the catalog size: the page itself, served
+    from the (category, price) or (stock) index, and one grouped aggregate
+    for the facets.
+    """
+    try:
+        filters = parse_filters()
+    except ValueError as exc:
+        return jsonify({'error': str(exc)}), 400
+
+    products = [row._asdict() for row in db.session.execute(page_statement(filters))]
+    total, facets = build_facets(filters, db.session.execute(facet_statement(filters)))
+    return jsonify({'products': products, 'total': total, 'facets': facets})
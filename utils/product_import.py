@@ -0,0 +1,507 @@
+"""Bulk product import and stock updates from a streamed NDJSON or CSV body.
+
+The body is read READ_SIZE bytes at a time and parsed a row at a time.
+Each row is validated against Product's columns: the category enum, the
+string lengths, price as Numeric(10, 2), and non-negative stock. Valid
+rows are written BULK_BATCH_SIZE at a time, each batch in its own
+transaction. Memory holds one batch and the first BULK_MAX_ERRORS row
+errors, whatever the size of the upload. Once a batch commits, the
+product cache is invalidated and the search index updated once for the
+whole batch.
+
+Import rows (POST /products/bulk) are upserts keyed on product_id:
+
+- A row without product_id creates a product and needs every field in
+  REQUIRED_FIELDS.
+- A row that gives every field is inserted, or overwrites the product
+  with that ID, through INSERT ... ON DUPLICATE KEY UPDATE (ON CONFLICT
+  DO UPDATE on SQLite/PostgreSQL).
+- A row with product_id and only some fields updates those fields of an
+  existing product. Each set of columns is one UPDATE ... CASE per batch.
+
+Inserts and upserts run as one executemany per batch, which PyMySQL
+sends as a single multi-row INSERT.
+
+Stock rows (POST /products/bulk/stock) set the stock of existing
+products, {"product_id": 12, "stock": 40}, with one UPDATE ... CASE per
+batch.
+
+Rows that set the stock of a product a flash sale holds units of fail
+(see utils.flash_sale.held_products).
+
+If a batch fails in the database, it is rolled back and its rows are
+retried one per transaction, so the report names the rows at fault.
+"""
+import abc
+import codecs
+import csv
+import json
+from decimal import Decimal, InvalidOperation
+from sqlalchemy import case, func, insert, or_, select, update
+from sqlalchemy.dialects import mysql, postgresql, sqlite
+from sqlalchemy.exc import SQLAlchemyError
+from database import db
+from models.product import Product, now_precise
+from utils.flash_sale import held_products, STOCK_HELD_ERROR
+from utils.product_cache import product_cache
+from utils.search_index import search_index
+from config import BULK_BATCH_SIZE, BULK_MAX_ERRORS, BULK_MAX_LINE_LENGTH
+
+# Bytes read from the request body at a time
+READ_SIZE = 64 * 1024
+
+CONTENT_TYPES = {
+    'application/x-ndjson': 'ndjson',
+    'application/ndjson': 'ndjson',
+    'application/jsonl': 'ndjson',
+    'text/csv': 'csv',
+}
+
+REQUIRED_FIELDS = ('name', 'description', 'price', 'category', 'stock', 'image_url')
+
+CATEGORIES = tuple(Product.category.type.enums)
+MAX_PRICE = Decimal('99999999.99')  # Numeric(10, 2)
+MAX_INT = 2 ** 31 - 1
+
+TRUE_VALUES = ('1', 'true', 'yes')
+FALSE_VALUES = ('0', 'false', 'no')
+
+
+class BulkInputError(ValueError):
+    """The body can't be read past this point; the rows before it were processed."""
+
+
+# --- Reading ----------------------------------------------------------------
+
+def _decode(line, number):
+    if number == 1:
+        line = line.removeprefix(codecs.BOM_UTF8)
+    try:
+        return line.decode('utf-8')
+    except UnicodeDecodeError:
+        raise BulkInputError(f'Line {number} is not valid UTF-8')
+
+
+def _lines(stream):
+    """Yield the body's lines, each with its newline, reading READ_SIZE bytes at a time."""
+    pending = b''
+    number = 0
+    while True:
+        chunk = stream.read(READ_SIZE)
+        if not chunk:
+            break
+        lines = (pending + chunk).split(b'\n')
+        pending = lines.pop()
+        for line in lines:
+            number += 1
+            yield _decode(line + b'\n', number)
+        if len(pending) > BULK_MAX_LINE_LENGTH:
+            raise BulkInputError(f'Line {number + 1} is longer than {BULK_MAX_LINE_LENGTH} bytes')
+    if pending:
+        yield _decode(pending, number + 1)
+
+
+def _ndjson_rows(stream):
+    """Yield (line number, row dict or None, error or None) for each non-blank line."""
+    for number, line in enumerate(_lines(stream), 1):
+        if not line.strip():
+            continue
+        try:
+            row = json.loads(line, parse_float=Decimal)
+        except ValueError:
+            yield number, None, 'Invalid JSON'
+            continue
+        if not isinstance(row, dict):
+            yield number, None, 'Row must be a JSON object'
+            continue
+        yield number, row, None
+
+
+def _csv_rows(stream, fields):
+    """Yield (line number, row dict or None, error or None) for each CSV record.
+
+    The first record names the columns. Empty cells are left out of the
+    row, so a partial update can leave columns blank.
+    """
+    reader = csv.reader(_lines(stream))
+    try:
+        header = [name.strip() for name in next(reader, [])]
+        unknown = [name for name in header if name not in fields]
+        if unknown or len(set(header)) != len(header):
+            raise BulkInputError(f'CSV header must name distinct columns from: {", ".join(fields)}')
+        for record in reader:
+            if not any(cell.strip() for cell in record):
+                continue
+            if len(record) != len(header):
+                yield reader.line_num, None, f'Expected {len(header)} columns, got {len(record)}'
+                continue
+            yield reader.line_num, {name: cell.strip() for name, cell in zip(header, record) if cell.strip()}, None
+    except csv.Error as e:
+        raise BulkInputError(f'Line {reader.line_num}: {e}')
+
+
+# --- Validation -------------------------------------------------------------
+
+def _integer(value, minimum):
+    if isinstance(value, str):
+        try:
+            value = int(value)
+        except ValueError:
+            raise ValueError('must be an integer')
+    if isinstance(value, bool) or not isinstance(value, int):
+        raise ValueError('must be an integer')
+    if not minimum <= value <= MAX_INT:
+        raise ValueError(f'must be between {minimum} and {MAX_INT}')
+    return value
+
+
+def _text(value, max_length=None):
+    if not isinstance(value, str) or not value.strip():
+        raise ValueError('must be a non-empty string')
+    if max_length is not None and len(value) > max_length:
+        raise ValueError(f'must be at most {max_length} characters')
+    return value
+
+
+def _price(value):
+    if isinstance(value, bool) or not isinstance(value, (int, Decimal, str)):
+        raise ValueError('must be a number')
+    try:
+        price = Decimal(value)
+    except InvalidOperation:
+        raise ValueError('must be a number')
+    if not price.is_finite() or not 0 <= price <= MAX_PRICE:
+        raise ValueError(f'must be between 0 and {MAX_PRICE}')
+    if price != price.quantize(Decimal('0.01')):
+        raise ValueError('must have at most two decimal places')
+    return price
+
+
+def _category(value):
+    if value not in CATEGORIES:
+        raise ValueError(f'must be one of: {", ".join(CATEGORIES)}')
+    return value
+
+
+def _flag(value):
+    if isinstance(value, str) and value.lower() in TRUE_VALUES + FALSE_VALUES:
+        return value.lower() in TRUE_VALUES
+    if not isinstance(value, bool):
+        raise ValueError('must be true or false')
+    return value
+
+
+CLEANERS = {
+    'product_id': lambda value: _integer(value, 1),
+    'name': lambda value: _text(value, Product.name.type.length),
+    'description': _text,
+    'price': _price,
+    'category': _category,
+    'stock': lambda value: _integer(value, 0),
+    'image_url': lambda value: _text(value, Product.image_url.type.length),
+    'flash_sale': _flag,
+}
+
+
+def _clean(row, fields):
+    """Return (values, errors): the row's fields converted to column types, and what was wrong."""
+    values = {}
+    errors = []
+    unknown = sorted(name for name in row if name not in fields)
+    if unknown:
+        errors.append(f'Unknown fields: {", ".join(unknown)}')
+    for name in fields:
+        if name not in row:
+            continue
+        try:
+            values[name] = CLEANERS[name](row[name])
+        except ValueError as e:
+            errors.append(f'{name} {e}')
+    return values, errors
+
+
+# --- Writing ----------------------------------------------------------------
+
+def _grouped(rows, fields):
+    """Split rows by the columns they set: {columns: rows}, for one statement each."""
+    groups = {}
+    for row in rows:
+        groups.setdefault(tuple(name for name in fields if name in row), []).append(row)
+    return groups
+
+
+def _upsert(columns):
+    """An insert of columns that overwrites the product when its ID already exists.
+
+    Executed with a batch of rows, PyMySQL sends it as one multi-row
+    statement. It runs on the Core table, so SQLAlchemy compiles it once
+    and caches it rather than building ORM parameters for every row.
+    """
+    columns = [name for name in columns if name != 'product_id']
+    dialect = db.session.get_bind().dialect.name
+
+    if dialect == 'mysql':
+        stmt = mysql.insert(Product.__table__)
+        return stmt.on_duplicate_key_update({**{name: stmt.inserted[name] for name in columns},
+                                             'updated_at': now_precise()})
+    insert_ = postgresql.insert if dialect == 'postgresql' else sqlite.insert
+    stmt = insert_(Product.__table__)
+    return stmt.on_conflict_do_update(
+        index_elements=['product_id'],
+        set_={**{name: stmt.excluded[name] for name in columns}, 'updated_at': now_precise()})
+
+
+def _update(rows):
+    """Set each row's columns on its product in one statement, matched through CASE."""
+    columns = [name for name in rows[0] if name != 'product_id']
+    return (
+        update(Product)
+        .where(Product.product_id.in_([row['product_id'] for row in rows]))
+        .values({name: case({row['product_id']: row[name] for row in rows}, value=Product.product_id)
+                 for name in columns})
+        .execution_options(synchronize_session=False)
+    )
+
+
+def _merged(batch):
+    """Fold rows for the same product_id into (lines, values), later fields winning.
+
+    Sorted by ID, so concurrent imports lock products in the same order.
+    """
+    merged = {}
+    for line, values in batch:
+        lines, merged_values = merged.setdefault(values['product_id'], ([], {}))
+        lines.append(line)
+        merged_values.update(values)
+    return [merged[product_id] for product_id in sorted(merged)]
+
+
+def _existing(product_ids):
+    """The product_ids that exist, locked for the rest of the batch's transaction."""
+    if not product_ids:
+        return set()
+    return set(db.session.execute(
+        select(Product.product_id).where(Product.product_id.in_(product_ids))
+        .order_by(Product.product_id).with_for_update()).scalars())
+
+
+def _db_error(error):
+    return str(getattr(error, 'orig', None) or error).splitlines()[0][:200]
+
+
+class BatchResult:
+    """What one committed transaction wrote, applied to the report and caches afterwards."""
+
+    def __init__(self):
+        self.created = 0
+        self.updated = 0
+        self.failures = []      # (line, values, message)
+        self.product_ids = set()  # existing products written
+        self.reindex_ids = set()  # products whose name or description may have changed
+        self.created_after = None  # new products without a given ID have IDs above this
+        self.flash_sale = False
+
+
+class BulkJob(abc.ABC):
+    """Reads, validates and writes one upload; subclasses define the fields and _write."""
+
+    fields = ()
+
+    def __init__(self, ledger=None):
+        self.ledger = ledger
+        self.rows = 0
+        self.created = 0
+        self.updated = 0
+        self.failed = 0
+        self.batches = 0
+        self.errors = []
+        self.aborted = None
+
+    def run(self, stream, fmt):
+        """Process the body and return the report."""
+        rows = _csv_rows(stream, self.fields) if fmt == 'csv' else _ndjson_rows(stream)
+        batch = []
+        try:
+            for line, row, error in rows:
+                self.rows += 1
+                if error is not None:
+                    self._fail(line, row, [error])
+                    continue
+                values, errors = _clean(row, self.fields)
+                errors = errors or self._check(values)
+                if errors:
+                    self._fail(line, row, errors)
+                    continue
+                batch.append((line, values))
+                if len(batch) >= BULK_BATCH_SIZE:
+                    self._flush(batch)
+                    batch = []
+        except BulkInputError as e:
+            self.aborted = str(e)
+        if batch:
+            self._flush(batch)
+        return self.report()
+
+    def report(self):
+        report = {
+            'rows': self.rows,
+            'created': self.created,
+            'updated': self.updated,
+            'failed': self.failed,
+            'batches': self.batches,
+            'errors': self.errors,
+            'errors_truncated': self.failed > len(self.errors),
+        }
+        if self.aborted:
+            report['error'] = self.aborted
+        return report
+
+    def _check(self, values):
+        """Errors in a row whose fields are individually valid."""
+        return []
+
+    @abc.abstractmethod
+    def _write(self, batch):
+        """Write one batch of (line, values) in the current transaction and return its BatchResult."""
+
+    def _fail(self, line, row, errors):
+        self.failed += 1
+        if len(self.errors) < BULK_MAX_ERRORS:
+            product_id = row.get('product_id') if isinstance(row, dict) else None
+            self.errors.append({'line': line, 'product_id': product_id, 'errors': errors})
+
+    def _flush(self, batch):
+        """Write batch in one transaction, or row by row if the batch fails; then refresh caches once."""
+        results = []
+        try:
+            result = self._write(batch)
+            db.session.commit()
+            results.append(result)
+        except SQLAlchemyError:
+            db.session.rollback()
+            for line, values in batch:
+                try:
+                    result = self._write([(line, values)])
+                    db.session.commit()
+                    results.append(result)
+                except SQLAlchemyError as e:
+                    db.session.rollback()
+                    self._fail(line, values, [_db_error(e)])
+        self.batches += 1
+        self._committed(results)
+
+    def _committed(self, results):
+        product_ids = set()
+        reindex_ids = set()
+        created_after = None
+        flash_sale = False
+        for result in results:
+            self.created += result.created
+            self.updated += result.updated
+            for line, values, message in result.failures:
+                self._fail(line, values, [message])
+            product_ids |= result.product_ids
+            reindex_ids |= result.reindex_ids
+            if result.created_after is not None and (created_after is None or result.created_after < created_after):
+                created_after = result.created_after
+            flash_sale = flash_sale or result.flash_sale
+
+        if product_ids or created_after is not None:
+            product_cache.invalidate(*product_ids)
+        if search_index.built and (reindex_ids or created_after is not None):
+            condition = Product.product_id.in_(reindex_ids)
+            if created_after is not None:
+                condition = or_(condition, Product.product_id > created_after)
+            search_index.add_many(db.session.execute(
+                select(Product.product_id, Product.name, Product.description).where(condition)))
+        if self.ledger and flash_sale:
+            self.ledger.refresh()
+
+
+class ProductImport(BulkJob):
+    """Create products and upsert them by product_id."""
+
+    fields = ('product_id',) + REQUIRED_FIELDS + ('flash_sale',)
+
+    def _check(self, values):
+        if 'product_id' in values:
+            if len(values) == 1:
+                return ['Nothing to update']
+            return []
+        missing = [name for name in REQUIRED_FIELDS if name not in values]
+        return [f'Missing required fields: {", ".join(missing)}'] if missing else []
+
+    def _write(self, batch):
+        result = BatchResult()
+        new = [values for line, values in batch if 'product_id' not in values]
+        keyed = _merged([(line, values) for line, values in batch if 'product_id' in values])
+        existing = _existing([values['product_id'] for lines, values in keyed])
+        held = held_products(values['product_id'] for lines, values in keyed
+                             if 'stock' in values and values['product_id'] in existing)
+
+        upserts = []
+        updates = []
+        for lines, values in keyed:
+            product_id = values['product_id']
+            if product_id in held:
+                result.failures.extend((line, values, STOCK_HELD_ERROR) for line in lines)
+                continue
+            if all(name in values for name in REQUIRED_FIELDS):
+                upserts.append(values)
+            elif product_id in existing:
+                updates.append(values)
+            else:
+                missing = [name for name in REQUIRED_FIELDS if name not in values]
+                message = f'Product not found; creating it needs: {", ".join(missing)}'
+                result.failures.extend((line, values, message) for line in lines)
+                continue
+            if product_id in existing:
+                result.updated += len(lines)
+                result.product_ids.add(product_id)
+            else:
+                result.created += len(lines)
+            if 'name' in values or 'description' in values:
+                result.reindex_ids.add(product_id)
+            result.flash_sale = result.flash_sale or 'flash_sale' in values
+
+        if new:
+            result.created_after = db.session.execute(
+                select(func.coalesce(func.max(Product.product_id), 0))).scalar()
+            for rows in _grouped(new, self.fields).values():
+                db.session.execute(insert(Product.__table__), rows)
+            result.created += len(new)
+            result.flash_sale = result.flash_sale or any(values.get('flash_sale') for values in new)
+        for columns, rows in _grouped(upserts, self.fields).items():
+            db.session.execute(_upsert(columns), rows)
+        for rows in _grouped(updates, self.fields).values():
+            db.session.execute(_update(rows))
+        return result
+
+
+class StockUpdate(BulkJob):
+    """Set the stock of existing products."""
+
+    fields = ('product_id', 'stock')
+
+    def _check(self, values):
+        missing = [name for name in self.fields if name not in values]
+        return [f'Missing required fields: {", ".join(missing)}'] if missing else []
+
+    def _write(self, batch):
+        result = BatchResult()
+        rows = _merged(batch)
+        existing = _existing([values['product_id'] for lines, values in rows])
+        held = held_products(existing)
+        found = []
+        for lines, values in rows:
+            if values['product_id'] in held:
+                result.failures.extend((line, values, STOCK_HELD_ERROR) for line in lines)
+            elif values['product_id'] in existing:
+                found.append(values)
+                result.updated += len(lines)
+            else:
+                result.failures.extend((line, values, 'Product not found') for line in lines)
+        if found:
+            db.session.execute(_update(found))
+        result.product_ids = {values['product_id'] for values in found}
+        return result
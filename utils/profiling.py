@@ -0,0 +1,276 @@
+"""Per-request profiling: stack samples and SQL timings, written as collapsed stacks.
+
+A request is profiled when it carries `X-Profile: <PROFILE_TOKEN>`, or
+at random with probability PROFILE_SAMPLE_RATE. While it runs, a
+sampler thread records the request thread's Python stack every
+PROFILE_INTERVAL seconds. A sample taken while a statement is on the
+wire ends in a '[sql] SELECT ...' frame, so database time shows up under
+the code that issued it. Time in to_dict, ORM hydration and the driver
+shows up as ordinary frames.
+
+Each profiled request writes two files to PROFILE_DIR and answers with
+an X-Profile-Id header naming them:
+
+- <id>.collapsed: one 'frame;frame;frame count' line per distinct stack,
+  for flamegraph.pl, speedscope or inferno.
+- <id>.json: the request, wall and CPU time, and every statement with
+  its offset and duration.
+
+Sampled requests are short, so merge them per endpoint before reading
+the flamegraph:
+
+    flask --app app profile-merge order_bp.get_orders > get_orders.collapsed
+
+With PROFILE_SAMPLE_RATE at 0 and no PROFILE_TOKEN, init_profiling
+registers nothing, so the app runs no profiling code at all. When
+profiling is enabled, an unprofiled request costs one header lookup, one
+random draw, and one g lookup per SQL statement.
+"""
+import hmac
+import json
+import os
+import random
+import sys
+import threading
+import time
+import uuid
+from collections import Counter
+from glob import glob
+from flask import g, request
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from config import PROFILE_HEADER, PROFILE_INTERVAL, PROFILE_DIR, PROFILE_MAX_FILES, PROFILE_MAX_STATEMENTS
+
+# Characters of a statement kept in its [sql] frame and in the JSON report
+SQL_FRAME_LENGTH = 80
+SQL_REPORT_LENGTH = 2000
+
+
+class RequestProfile:
+    """Samples and statements of one request; filled in by the sampler and SQL hooks."""
+
+    def __init__(self, reason):
+        self.profile_id = f'{time.strftime("%Y%m%dT%H%M%S")}-{uuid.uuid4().hex[:8]}'
+        self.reason = reason
+        self.thread_id = threading.get_ident()
+        self.stacks = Counter()
+        self.statements = []
+        self.statement = None  # (text, start) of the statement in flight
+        self.started = time.perf_counter()
+        self.cpu_started = time.thread_time()
+        self.wall = self.cpu = None
+
+    def finish(self):
+        self.wall = time.perf_counter() - self.started
+        self.cpu = time.thread_time() - self.cpu_started
+
+
+class StackSampler:
+    """One thread per process that samples the stacks of the requests being profiled.
+
+    It sleeps on an Event while no request is profiled.
+    """
+
+    def __init__(self, interval=PROFILE_INTERVAL):
+        self.interval = interval
+        self._active = {}  # thread ident -> RequestProfile
+        self._labels = {}  # code object -> frame label
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._pid = None
+
+    def add(self, profile):
+        self._ensure_started()
+        with self._lock:
+            self._active[profile.thread_id] = profile
+            self._wake.set()
+
+    def remove(self, profile):
+        with self._lock:
+            self._active.pop(profile.thread_id, None)
+            if not self._active:
+                self._wake.clear()
+
+    def _ensure_started(self):
+        if self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._pid != os.getpid():
+                threading.Thread(target=self._run, name='profile-sampler', daemon=True).start()
+                self._pid = os.getpid()
+
+    def _run(self):
+        while True:
+            self._wake.wait()
+            frames = sys._current_frames()
+            with self._lock:
+                active = list(self._active.values())
+            for profile in active:
+                frame = frames.get(profile.thread_id)
+                if frame is not None:
+                    self._sample(profile, frame)
+            del frames
+            time.sleep(self.interval)
+
+    def _sample(self, profile, frame):
+        stack = []
+        while frame is not None:
+            code = frame.f_code
+            label = self._labels.get(code)
+            if label is None:
+                name = getattr(code, 'co_qualname', code.co_name)
+                path = '/'.join(code.co_filename.replace('\\', '/').rsplit('/', 2)[-2:])
+                label = f'{name} ({path}:{code.co_firstlineno})'.replace(';', ',')
+                self._labels[code] = label
+            stack.append(label)
+            frame = frame.f_back
+        stack.reverse()
+        statement = profile.statement
+        if statement is not None:
+            stack.append('[sql] ' + statement[0])
+        profile.stacks[';'.join(stack)] += 1
+
+
+sampler = StackSampler()
+_written = 0
+_write_lock = threading.Lock()
+
+
+# --- SQLAlchemy hooks -------------------------------------------------------
+
+def _current_profile():
+    try:
+        return g.get('profile')
+    except RuntimeError:  # outside an app context
+        return None
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    profile = _current_profile()
+    if profile is not None and profile.thread_id == threading.get_ident():
+        profile.statement = (' '.join(statement[:SQL_FRAME_LENGTH * 2].split())[:SQL_FRAME_LENGTH],
+                             time.perf_counter())
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    profile = _current_profile()
+    if profile is None or profile.statement is None or profile.thread_id != threading.get_ident():
+        return
+    start = profile.statement[1]
+    profile.statement = None
+    if len(profile.statements) < PROFILE_MAX_STATEMENTS:
+        profile.statements.append({
+            'statement': statement[:SQL_REPORT_LENGTH],
+            'offset_ms': round((start - profile.started) * 1000, 3),
+            'duration_ms': round((time.perf_counter() - start) * 1000, 3),
+            'executemany': executemany,
+        })
+
+
+# --- Flask hooks ------------------------------------------------------------
+
+def _make_before_request(sample_rate, token):
+    def before_request():
+        header = request.headers.get(PROFILE_HEADER)
+        if header is not None:
+            if not token or not hmac.compare_digest(header.encode(), token.encode()):
+                return None
+            reason = 'header'
+        elif sample_rate and random.random() < sample_rate:
+            reason = 'sampled'
+        else:
+            return None
+        g.profile = RequestProfile(reason)
+        sampler.add(g.profile)
+        return None
+    return before_request
+
+
+def _after_request(response):
+    profile = g.get('profile')
+    if profile is not None:
+        response.headers['X-Profile-Id'] = profile.profile_id
+        g.profile_status = response.status_code
+    return response
+
+
+def _teardown_request(exc=None):
+    profile = g.pop('profile', None)
+    if profile is None:
+        return
+    sampler.remove(profile)
+    profile.finish()
+    write(profile, {
+        'method': request.method,
+        'path': request.full_path.rstrip('?'),
+        'endpoint': request.endpoint,
+        'status': g.pop('profile_status', 500),
+        'error': repr(exc) if exc is not None else None,
+    })
+
+
+def write(profile, request_info, directory=PROFILE_DIR):
+    """Write profile's .collapsed and .json files and prune the oldest beyond PROFILE_MAX_FILES."""
+    global _written
+    os.makedirs(directory, exist_ok=True)
+    base = os.path.join(directory, profile.profile_id)
+    with open(base + '.collapsed', 'w', encoding='utf-8') as f:
+        for stack, count in profile.stacks.most_common():
+            f.write(f'{stack} {count}\n')
+    with open(base + '.json', 'w', encoding='utf-8') as f:
+        json.dump({
+            'profile_id': profile.profile_id,
+            'reason': profile.reason,
+            **request_info,
+            'wall_ms': round(profile.wall * 1000, 3),
+            'cpu_ms': round(profile.cpu * 1000, 3),
+            'samples': sum(profile.stacks.values()),
+            'interval_ms': sampler.interval * 1000,
+            'sql_count': len(profile.statements),
+            'sql_ms': round(sum(s['duration_ms'] for s in profile.statements), 3),
+            'statements': profile.statements,
+        }, f, indent=2)
+
+    with _write_lock:
+        _written += 1
+        prune = _written % 50 == 0
+    if prune:
+        reports = sorted(glob(os.path.join(directory, '*.json')))
+        for path in reports[:max(0, len(reports) - PROFILE_MAX_FILES)]:
+            for suffix in ('.json', '.collapsed'):
+                try:
+                    os.remove(path[:-len('.json')] + suffix)
+                except FileNotFoundError:
+                    pass
+
+
+def merge(endpoint=None, directory=PROFILE_DIR):
+    """Sum the collapsed stacks of every stored profile (of endpoint, if given)."""
+    stacks = Counter()
+    for path in sorted(glob(os.path.join(directory, '*.json'))):
+        with open(path, encoding='utf-8') as f:
+            if endpoint is not None and json.load(f).get('endpoint') != endpoint:
+                continue
+        try:
+            with open(path[:-len('.json')] + '.collapsed', encoding='utf-8') as f:
+                for line in f:
+                    stack, _, count = line.rstrip('\n').rpartition(' ')
+                    stacks[stack] += int(count)
+        except FileNotFoundError:
+            continue
+    return stacks
+
+
+def init_profiling(app):
+    """Profile sampled or X-Profile requests; registers nothing when both are off."""
+    sample_rate = app.config.get('PROFILE_SAMPLE_RATE', 0.0)
+    token = app.config.get('PROFILE_TOKEN')
+    if not sample_rate and not token:
+        return
+
+    app.before_request(_make_before_request(sample_rate, token))
+    app.after_request(_after_request)
+    app.teardown_request(_teardown_request)
+    if not event.contains(Engine, 'before_cursor_execute', _before_cursor_execute):
+        event.listen(Engine, 'before_cursor_execute', _before_cursor_execute)
+        event.listen(Engine, 'after_cursor_execute', _after_cursor_execute)
@@ -0,0 +1,241 @@
+import heapq
+import math
+import re
+import threading
+import time
+from bisect import bisect_left, insort
+from config import SEARCH_INDEX_TTL
+
+TOKEN_RE = re.compile(r'[a-z0-9]+')
+
+# BM25 parameters
+K1 = 1.2
+B = 0.75
+
+# Name matches count for more than description matches
+NAME_WEIGHT = 3
+
+# Bound the work a short prefix (e.g. a single keystroke) can trigger; a
+# prefix with more terms than this expands to the ones in most products
+MAX_PREFIX_EXPANSIONS = 64
+
+
+def tokenize(text):
+    return TOKEN_RE.findall((text or '').lower())
+
+
+class ProductSearchIndex:
+    """In-memory inverted index over product name and description.
+
+    Query tokens match indexed terms by prefix, every query token must
+    match, and results are ordered by a BM25 score. The index is built
+    lazily from the database on first use and kept current by the product
+    write routes through add/remove. Writes made by other processes only
+    arrive through a rebuild, so the index is rebuilt once it is
+    SEARCH_INDEX_TTL seconds old.
+    """
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._build_lock = threading.Lock()
+        self._built = False
+        self._built_at = 0.0
+        self._pending = None   # (product_id, name, description or None to remove) written during a build
+        self._postings = {}    # term -> {product_id: weighted term frequency}
+        self._terms = []       # sorted vocabulary, for prefix lookups
+        self._doc_terms = {}   # product_id -> set of terms
+        self._doc_len = {}     # product_id -> weighted document length
+        self._total_len = 0
+
+    def build(self, products):
+        """Replace the index contents with the given products.
+
+        The new index is built aside and swapped in, so searches use the old
+        one meanwhile. Products added or removed during the build are
+        applied again after the swap.
+        """
+        with self._lock:
+            self._pending = []
+        fresh = ProductSearchIndex()
+        for product in products:
+            fresh._add(product.product_id, product.name, product.description)
+        fresh._terms = sorted(fresh._postings)
+
+        with self._lock:
+            self._postings = fresh._postings
+            self._terms = fresh._terms
+            self._doc_terms = fresh._doc_terms
+            self._doc_len = fresh._doc_len
+            self._total_len = fresh._total_len
+            pending, self._pending = self._pending, None
+            self._built = True
+            self._built_at = time.monotonic()
+            for product_id, name, description in pending:
+                if description is None:
+                    self._remove(product_id)
+                else:
+                    self._index(product_id, name, description)
+
+    @property
+    def built(self):
+        return self._built
+
+    @property
+    def stale(self):
+        """True before the first build and once the index is SEARCH_INDEX_TTL old."""
+        return not self._built or time.monotonic() - self._built_at >= SEARCH_INDEX_TTL
+
+    def ensure_built(self):
+        """Build the index if it is stale.
+
+        The first build blocks searches until it is done. Later rebuilds run
+        in the one thread that finds the index stale; other threads keep
+        searching the current index meanwhile.
+        """
+        if not self.stale:
+            return
+        if not self._build_lock.acquire(blocking=not self._built):
+            return
+        try:
+            if self.stale:
+                from models.product import Product
+                self.build(Product.query.with_entities(
+                    Product.product_id, Product.name, Product.description
+                ).yield_per(1000))
+        finally:
+            self._build_lock.release()
+
+    def add(self, product):
+        """Index a new product, or re-index an updated one."""
+        with self._lock:
+            if self._pending is not None:
+                self._pending.append((product.product_id, product.name, product.description or ''))
+            if not self._built:
+                return
+            self._index(product.product_id, product.name, product.description)
+
+    def _index(self, product_id, name, description):
+        self._remove(product_id)
+        for term in self._add(product_id, name, description):
+            i = bisect_left(self._terms, term)
+            if i == len(self._terms) or self._terms[i] != term:
+                insort(self._terms, term)
+
+    def add_many(self, products):
+        """Index or re-index several products, merging their new terms into the vocabulary once."""
+        with self._lock:
+            if self._pending is not None:
+                self._pending.extend((product.product_id, product.name, product.description or '')
+                                     for product in products)
+            if not self._built:
+                return
+            terms = set()
+            for product in products:
+                self._remove(product.product_id)
+                terms.update(self._add(product.product_id, product.name, product.description))
+            new_terms = sorted(term for term in terms if not self._has_term(term))
+            if new_terms:
+                self._terms = list(heapq.merge(self._terms, new_terms))
+
+    def remove(self, product_id):
+        with self._lock:
+            if self._pending is not None:
+                self._pending.append((product_id, None, None))
+            if self._built:
+                self._remove(product_id)
+
+    def search(self, query, limit=None):
+        """Return product IDs matching every token of query, best first."""
+        tokens = tokenize(query)
+        if not tokens:
+            return []
+
+        self.ensure_built()
+        with self._lock:
+            n_docs = len(self._doc_len)
+            if not n_docs:
+                return []
+            avg_len = self._total_len / n_docs
+
+            # Expand each query token to the indexed terms it prefixes
+            expansions = [self._expand(token) for token in tokens]
+            if not all(expansions):
+                return []
+
+            # Intersect candidates starting from the most selective token
+            candidates = None
+            for terms in sorted(expansions, key=lambda ts: sum(len(self._postings[t]) for t in ts)):
+                matched = set()
+                for term in terms:
+                    matched.update(self._postings[term])
+                candidates = matched if candidates is None else candidates & matched
+                if not candidates:
+                    return []
+
+            scores = dict.fromkeys(candidates, 0.0)
+            for terms in expansions:
+                # A token scores as its best-matching expansion
+                best = {}
+                for term in terms:
+                    postings = self._postings[term]
+                    idf = math.log(1 + (n_docs - len(postings) + 0.5) / (len(postings) + 0.5))
+                    if len(postings) <= len(candidates):
+                        hits = ((pid, tf) for pid, tf in postings.items() if pid in candidates)
+                    else:
+                        hits = ((pid, postings[pid]) for pid in candidates if pid in postings)
+                    for pid, tf in hits:
+                        norm = tf + K1 * (1 - B + B * self._doc_len[pid] / avg_len)
+                        score = idf * tf * (K1 + 1) / norm
+                        if score > best.get(pid, 0.0):
+                            best[pid] = score
+                for pid, score in best.items():
+                    scores[pid] += score
+
+            rank = lambda pid: (-scores[pid], pid)
+            if limit is not None:
+                return heapq.nsmallest(limit, candidates, key=rank)
+            return sorted(candidates, key=rank)
+
+    def _has_term(self, term):
+        i = bisect_left(self._terms, term)
+        return i < len(self._terms) and self._terms[i] == term
+
+    def _expand(self, token):
+        """Indexed terms starting with token, capped at the MAX_PREFIX_EXPANSIONS in most products."""
+        start = bisect_left(self._terms, token)
+        end = bisect_left(self._terms, token[:-1] + chr(ord(token[-1]) + 1), start)
+        terms = self._terms[start:end]
+        if len(terms) > MAX_PREFIX_EXPANSIONS:
+            terms = heapq.nlargest(MAX_PREFIX_EXPANSIONS, terms, key=lambda term: len(self._postings[term]))
+        return terms
+
+    def _add(self, product_id, name, description):
+        counts = {}
+        for term in tokenize(name):
+            counts[term] = counts.get(term, 0) + NAME_WEIGHT
+        for term in tokenize(description):
+            counts[term] = counts.get(term, 0) + 1
+
+        for term, tf in counts.items():
+            self._postings.setdefault(term, {})[product_id] = tf
+        self._doc_terms[product_id] = set(counts)
+        length = sum(counts.values())
+        self._doc_len[product_id] = length
+        self._total_len += length
+        return counts
+
+    def _remove(self, product_id):
+        terms = self._doc_terms.pop(product_id, None)
+        if terms is None:
+            return
+        self._total_len -= self._doc_len.pop(product_id)
+        for term in terms:
+            postings = self._postings[term]
+            del postings[product_id]
+            if not postings:
+                del self._postings[term]
+                i = bisect_left(self._terms, term)
+                del self._terms[i]
+
+
+search_index = ProductSearchIndex()
@@ -0,0 +1,92 @@
+from sqlalchemy import case, update
+from database import db, begin_savepoint
+from models.product import Product
+
+# Retries when a reservation fails but a re-read finds enough stock
+MAX_ATTEMPTS = 3
+
+
+def aggregate_quantities(items):
+    """Sum requested quantities per product_id, ordered by product_id."""
+    quantities = {}
+    for item in items:
+        quantities[item['product_id']] = quantities.get(item['product_id'], 0) + item['quantity']
+    return dict(sorted(quantities.items()))
+
+
+def reserve_stock(items):
+    """Atomically decrement stock for every line item in the current transaction.
+
+    All products are decremented with a single conditional UPDATE
+    (``stock = stock - q WHERE stock >= q``) touching rows in product_id
+    order, so concurrent checkouts can neither oversell nor deadlock on
+    each other. Either every line is reserved, or nothing is. The UPDATE
+    runs in a savepoint, so a shortfall undoes only the decrement and
+    leaves the rest of the caller's transaction alone.
+
+    Returns a list of shortfalls, empty on success. Each shortfall is a
+    dict with product_id, name, available and requested; name and
+    available are None when the product does not exist.
+    """
+    quantities = aggregate_quantities(items)
+    if not quantities:
+        return []
+
+    ids = list(quantities)
+    requested = case(quantities, value=Product.product_id)
+    stmt = (
+        update(Product)
+        .where(Product.product_id.in_(ids), Product.stock >= requested)
+        .values(stock=Product.stock - requested)
+        .execution_options(synchronize_session=False)
+    )
+
+    for _ in range(MAX_ATTEMPTS):
+        savepoint = begin_savepoint()
+        if db.session.execute(stmt).rowcount == len(ids):
+            savepoint.commit()
+            return []
+
+        # Some lines could not be reserved: undo the partial decrement and
+        # report exactly which ones fell short.
+        savepoint.rollback()
+        shortfalls = _shortfalls(quantities)
+        if shortfalls:
+            return shortfalls
+        # Stock was replenished between the UPDATE and the re-read; retry.
+
+    return _shortfalls(quantities, report_all=True)
+
+
+def _shortfalls(quantities, report_all=False):
+    rows = db.session.query(Product.product_id, Product.name, Product.stock) \
+        .filter(Product.product_id.in_(list(quantities))).all()
+    found = {row.product_id: row for row in rows}
+
+    shortfalls = []
+    for product_id, quantity in quantities.items():
+        row = found.get(product_id)
+        if row is None:
+            shortfalls.append({'product_id': product_id, 'name': None,
+                               'available': None, 'requested': quantity})
+        elif report_all or row.stock < quantity:
+            shortfalls.append({'product_id': product_id, 'name': row.name,
+                               'available': row.stock, 'requested': quantity})
+    return shortfalls
+
+
+def release_stock(quantities):
+    """Add quantities ({product_id: quantity}) back to stock with one UPDATE.
+
+    Products that no longer exist are skipped.
+    """
+    quantities = dict(sorted(quantities.items()))
+    if not quantities:
+        return
+    released = case(quantities, value=Product.product_id)
+    db.session.execute(
+        update(Product)
+        .where(Product.product_id.in_(list(quantities)))
+        .values(stock=Product.stock + released)
+        .execution_options(synchronize_session=False)
+    )